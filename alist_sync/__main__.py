@@ -4,8 +4,7 @@ import logging
 import os
 from pathlib import Path
 
-from typer import Typer, Option, echo
-
+from typer import Typer, Option, echo, BadParameter
 
 logger = logging.getLogger("alist-sync.__main__")
 app = Typer()
@@ -14,6 +13,14 @@ app = Typer()
 _stores_config: str | None = Option(
     None, "-c", "--store-path", help="一个包含存储配置的JSON文件，可以是AList的备份文件"
 )
+_profile: bool = Option(
+    False, "--profile", help="统计扫描、检查、传输、写入状态等各阶段的耗时, 结束后输出"
+)
+_profile_output: Path | None = Option(
+    None,
+    "--profile-output",
+    help="采样全部线程的调用栈, 保存为 collapsed stack 格式 (flamegraph.pl, speedscope)",
+)
 
 
 @app.command("test-config")
@@ -47,10 +54,20 @@ def sync(
         envvar="ALIST_SYNC_DEBUG",
         help="调试模式, 将以单线程启动",
     ),
+    engine: str = Option(
+        "thread",
+        "--engine",
+        "-e",
+        envvar="ALIST_SYNC_ENGINE",
+        help="传输引擎: thread 线程池, async 单个事件循环中的大量并发Worker",
+    ),
+    profile: bool = _profile,
+    profile_output: Path | None = _profile_output,
 ):
     """同步任务"""
     from alist_sync.config import create_config, getenv
     from alist_sync.d_main import main, main_debug
+    from alist_sync import profiler
 
     if config_file and Path(config_file).exists():
         os.environ["ALIST_SYNC_CONFIG"] = str(Path(config_file).resolve().absolute())
@@ -61,22 +78,29 @@ def sync(
     if debug:
         echo("调试模式启动")
         return main_debug()
-    return main()
+    if engine not in ("thread", "async"):
+        raise BadParameter(f"未知的引擎: {engine}, 可选: thread, async")
+    with profiler.profiling(profile, profile_output):
+        return main(engine)
 
 
 @app.command("check")
 def check(
     config_file: str = Option(None, "--config", "-c", help="配置文件路径"),
+    profile: bool = _profile,
+    profile_output: Path | None = _profile_output,
 ):
     """检查任务"""
     from alist_sync.config import create_config
     from alist_sync.d_main import main_check
+    from alist_sync import profiler
 
     if config_file and Path(config_file).exists():
         os.environ["ALIST_SYNC_CONFIG"] = str(Path(config_file).resolve().absolute())
         os.environ["_ALIST_SYNC_CONFIG"] = str(Path(config_file).resolve().absolute())
     create_config()
-    return main_check()
+    with profiler.profiling(profile, profile_output):
+        return main_check()
 
 
 @app.command("get-info")
@@ -1,19 +1,33 @@
 import asyncio
 import builtins
 import logging
+import posixpath
+import re
+import threading
 import time
 from typing import Literal
 
 from alist_sdk import AsyncClient as _AsyncClient, Task, Client
 from async_lru import alru_cache as lru_cache
 
+from alist_sync import metrics
 from alist_sync.common import get_alist_client
 from alist_sync.config import create_config
 
 logger = logging.getLogger("alist-sync.client")
 sync_config = create_config()
 
-__all__ = ["AlistClient", "get_status", "create_async_client"]
+__all__ = [
+    "AlistClient",
+    "get_status",
+    "create_async_client",
+    "parse_copy_task",
+    "copy_task_ids",
+    "existing_copy_tasks",
+    "async_existing_copy_tasks",
+    "wait_copy_task",
+    "async_wait_copy_task",
+]
 
 CopyStatusModify = Literal[
     "init",
@@ -46,6 +60,7 @@ class AlistClient(_AsyncClient):
             username=username,
             password=password,
             has_opt=has_opt,
+            max_connect=max_connect,
             **kwargs,
         )
 
@@ -68,6 +83,13 @@ class AlistClient(_AsyncClient):
     def _task_rtype(rtype, data):
         if rtype == list:
             return data or []
+        if rtype == "copy_path":
+            # 同一对路径可能有多个任务 (之前复制过同一个文件), 按出现的顺序保留全部
+            _tasks: dict[tuple[str, str], list[Task]] = {}
+            for i in data or []:
+                if (key := parse_copy_task(i.name)) is not None:
+                    _tasks.setdefault(key, []).append(i)
+            return _tasks
         return {i.name: i for i in data or []}
 
     @lru_cache(maxsize=1)
@@ -91,40 +113,233 @@ class AlistClient(_AsyncClient):
         raise ValueError(f"获取未完成的任务失败: {res.code = } {res.message = }")
 
 
+_COPY_TASK_NAME = re.compile(r"^copy \[(.*?)]\((.*)\) to \[(.*?)]\((.*)\)$")
+
+
+def parse_copy_task(name: str) -> tuple[str, str] | None:
+    """从复制任务的名称中解析 (源文件路径, 目标目录)
+
+    任务名称: copy [源存储挂载路径](源文件实际路径) to [目标存储挂载路径](目标目录实际路径)
+    """
+    match = _COPY_TASK_NAME.match(name)
+    if match is None:
+        return None
+    src_mount, src_path, dst_mount, dst_path = match.groups()
+    return (
+        posixpath.join(src_mount, src_path.lstrip("/")).rstrip("/") or "/",
+        posixpath.join(dst_mount, dst_path.lstrip("/")).rstrip("/") or "/",
+    )
+
+
+def copy_task_ids(data) -> set[str]:
+    """fs/copy 返回的任务ID (alist_sdk 解析为 ListTask), 较早的 AList 版本不返回任务"""
+    tasks = (
+        data.get("tasks") if isinstance(data, dict) else getattr(data, "tasks", None)
+    )
+    return {
+        _id
+        for t in tasks or []
+        if (_id := t.get("id") if isinstance(t, dict) else t.id)
+    }
+
+
+async def _copy_tasks(
+    client: AlistClient, fresh: bool = False
+) -> tuple[dict[tuple[str, str], list[Task]], dict[tuple[str, str], list[Task]]]:
+    """(已完成, 未完成) 的复制任务, 按 (源文件路径, 目标目录) 分组
+
+    同一个5秒内的全部查询共用一次 task/copy/done 与 task/copy/undone 请求,
+    fresh 时跳过缓存, 直接请求
+    """
+    if fresh:
+        _done, _undone = await asyncio.gather(
+            client.task_done("copy"), client.task_undone("copy")
+        )
+        for res in (_done, _undone):
+            if res.code != 200:
+                raise ValueError(f"获取任务失败: {res.code = } {res.message = }")
+        return (
+            client._task_rtype("copy_path", _done.data),
+            client._task_rtype("copy_path", _undone.data),
+        )
+    (_, _done), (_, _undone) = await asyncio.gather(
+        client.cached_task_done("copy", "copy_path", int(time.time()) // 5),
+        client.cached_task_undone("copy", "copy_path", int(time.time()) // 5),
+    )
+    return _done, _undone
+
+
+async def async_existing_copy_tasks(
+    client: AlistClient, key: tuple[str, str]
+) -> set[str]:
+    """发起复制之前, 同一对路径上已有任务的ID, 等待时忽略这些任务"""
+    _done, _undone = await _copy_tasks(client, fresh=True)
+    return {t.id for t in _done.get(key, []) + _undone.get(key, [])}
+
+
 async def get_status(
-    task_name, client: AlistClient = None
+    key: tuple[str, str],
+    client: AlistClient = None,
+    ignore: set[str] = frozenset(),
+    task_ids: set[str] = frozenset(),
+    fresh: bool = False,
 ) -> tuple[CopyStatusModify, int | float]:
-    """获取任务状态
+    """获取复制任务状态
 
+    之前复制同一个文件留下的任务仍在任务列表中, 以任务ID区分:
+    有 fs/copy 返回的任务ID时只看这些任务, 否则忽略发起复制之前已有的任务。
+
+    :param key: (源文件路径, 目标目录)
     :param client: AlistClient
-    :param task_name: 任务名称
+    :param ignore: 发起复制之前已有的任务ID
+    :param task_ids: fs/copy 返回的任务ID
+    :param fresh: 跳过5秒的缓存
     :return: 任务状态(状态名称，状态进展)
     """
     client = client or get_alist_client()
-    (_, _task_done), (_, _task_undone) = await asyncio.gather(
-        client.cached_task_done("copy", dict, int(time.time()) // 5),
-        client.cached_task_undone("copy", dict, int(time.time()) // 5),
-    )
-    if task_name in _task_done and task_name not in _task_undone:
+    _done, _undone = await _copy_tasks(client, fresh)
+
+    def _ours(tasks: list[Task]) -> list[Task]:
+        if task_ids:
+            return [t for t in tasks if t.id in task_ids]
+        return [t for t in tasks if t.id not in ignore]
+
+    if undone := _ours(_undone.get(key, [])):
+        return undone[-1].status, undone[-1].progress
+    if done := _ours(_done.get(key, [])):
+        if done[-1].error:
+            return "failed", done[-1].progress
         return "success", 100
-    elif task_name in _task_undone:
-        return _task_undone[task_name].status, _task_undone[task_name].progress
-    else:
-        raise ValueError(f"任务不存在: {task_name}")
+    raise ValueError(f"任务不存在: {key}")
+
 
+def create_async_client(client: Client, transport=None) -> AlistClient:
+    """创建AsyncClient, 沿用已登录的同步客户端的Token
 
-def create_async_client(client: Client) -> AlistClient:
-    """创建AsyncClient"""
+    :param transport: 异步连接池, 见 AlistServer.async_transport
+    """
 
     _server = sync_config.get_server(client.base_url)
-    _server.token = client.headers.get("authorization")
+    _data = _server.dump_for_alist_client()
+    # 不重复登录, 请求头中已经包含Token
+    for _k in ("token", "username", "password"):
+        _data.pop(_k)
+    if transport is not None:
+        _data["transport"] = transport
+    _data["event_hooks"] = {
+        "request": [_server.rate_limiter.async_hook, metrics.async_request_hook],
+        "response": [metrics.async_response_hook],
+    }
 
-    _ac = AlistClient(**_server.dump_for_alist_client())
+    _ac = AlistClient(**_data)
     _ac.headers = client.headers
     _ac.cookies = client.cookies
     return _ac
 
 
+_loop: asyncio.AbstractEventLoop | None = None
+_loop_lock = threading.Lock()
+_async_clients: dict[str, AlistClient] = {}
+
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    """在后台线程中运行的事件循环，同步代码通过它调用 AlistClient"""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(
+                target=_loop.run_forever, name="alist_client_loop", daemon=True
+            ).start()
+        return _loop
+
+
+def _get_async_client(client: Client) -> AlistClient:
+    with _loop_lock:
+        key = str(client.base_url)
+        if key not in _async_clients:
+            _async_clients[key] = create_async_client(client)
+        return _async_clients[key]
+
+
+async def async_wait_copy_task(
+    client: AlistClient,
+    key: tuple[str, str],
+    timeout: float = 24 * 3600,
+    not_found: float = 15,
+    ignore: set[str] = frozenset(),
+    task_ids: set[str] = frozenset(),
+) -> CopyStatusModify:
+    """等待服务器端复制任务完成，参数见 wait_copy_task
+
+    :param key: (源文件路径, 目标目录)
+    """
+    _start = time.time()
+    fresh = True
+    while True:
+        try:
+            # 第一次查询跳过缓存, 缓存可能在发起复制之前就已经获取
+            status, progress = await get_status(key, client, ignore, task_ids, fresh)
+            logger.debug("复制任务 %s: %s %s", key, status, progress)
+            if status in ("success", "failed"):
+                return status
+        except ValueError:
+            # 同一存储内的复制可能不创建任务, 由调用方检查结果
+            if time.time() - _start > not_found:
+                return "checked_done"
+        fresh = False
+        if time.time() - _start > timeout:
+            raise TimeoutError(f"等待复制任务超时: {key}")
+        await asyncio.sleep(5 - time.time() % 5 + 0.1)
+
+
+def _copy_key(src_path: str, dst_dir: str) -> tuple[str, str]:
+    return src_path.rstrip("/") or "/", dst_dir.rstrip("/") or "/"
+
+
+def existing_copy_tasks(client: Client, src_path: str, dst_dir: str) -> set[str]:
+    """async_existing_copy_tasks 的同步版本"""
+    return asyncio.run_coroutine_threadsafe(
+        async_existing_copy_tasks(
+            _get_async_client(client), _copy_key(src_path, dst_dir)
+        ),
+        _get_loop(),
+    ).result()
+
+
+def wait_copy_task(
+    client: Client,
+    src_path: str,
+    dst_dir: str,
+    timeout: float = 24 * 3600,
+    not_found: float = 15,
+    ignore: set[str] = frozenset(),
+    task_ids: set[str] = frozenset(),
+) -> CopyStatusModify:
+    """阻塞等待服务器端复制任务完成
+
+    :param client: 发起复制的客户端
+    :param src_path: 源文件路径
+    :param dst_dir: 目标目录
+    :param timeout: 最长等待时间
+    :param not_found: 一直找不到任务时，等待这么久后返回 checked_done
+    :param ignore: 发起复制之前已有的任务ID, 见 existing_copy_tasks
+    :param task_ids: fs/copy 返回的任务ID, 见 copy_task_ids
+    :return: success | failed | checked_done
+    """
+    return asyncio.run_coroutine_threadsafe(
+        async_wait_copy_task(
+            _get_async_client(client),
+            _copy_key(src_path, dst_dir),
+            timeout,
+            not_found,
+            ignore,
+            task_ids,
+        ),
+        _get_loop(),
+    ).result()
+
+
 if __name__ == "__main__":
     _c = AlistClient(
         base_url="http://localhost:5244",
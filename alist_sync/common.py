@@ -9,7 +9,6 @@ import threading
 from pathlib import Path
 from typing import Iterable
 
-
 logger = logging.getLogger("alist-sync.common")
 
 __all__ = [
@@ -23,6 +22,10 @@ __all__ = [
     "all_thread_name",
     "prefix_in_threads",
     "transfer_speed",
+    "HASH_ALGORITHMS",
+    "hash_info_dict",
+    "hash_match",
+    "ContentHash",
 ]
 
 
@@ -109,9 +112,64 @@ def beautify_size(byte_size: float):
 
 
 def transfer_speed(size, start: datetime.datetime, end: datetime.datetime) -> str:
-    """转换速度"""
-    speed = (size * 2) / (end - start).seconds
-    return beautify_size(speed) + '/s'
+    """平均传输速度: size 字节在 start 到 end 之间传输完成"""
+    seconds = (end - start).total_seconds()
+    if not size or seconds <= 0:
+        return beautify_size(0) + "/s"
+    return beautify_size(size / seconds) + "/s"
+
+
+# AList hash_info 中可以用于校验的算法, 靠前的优先
+HASH_ALGORITHMS = ("sha1", "md5")
+
+
+def hash_info_dict(hash_info) -> dict[str, str] | None:
+    """AList 的 hash_info 转为 {算法: 小写十六进制}, 驱动没有提供时返回 None"""
+    if hash_info is None:
+        return None
+    if not isinstance(hash_info, dict):
+        hash_info = hash_info.model_dump()
+    _hash = {k: v.lower() for k, v in hash_info.items() if k in HASH_ALGORITHMS and v}
+    return _hash or None
+
+
+def hash_match(expected: dict | None, actual: dict | None) -> bool | None:
+    """按双方都有的第一个算法比较, 没有共同的算法时返回 None"""
+    for name in HASH_ALGORITHMS:
+        if expected and actual and name in expected and name in actual:
+            return expected[name] == actual[name]
+    return None
+
+
+class ContentHash:
+    """在传输的分块循环中增量计算内容的散列, 不再读取一次文件
+
+    :param expected: 源文件的 hash_info, 使用其中的第一个算法
+    """
+
+    def __init__(self, expected: dict[str, str]):
+        self.name = next(n for n in HASH_ALGORITHMS if n in expected)
+        self.expected = expected[self.name]
+        self._hash = hashlib.new(self.name)
+
+    @classmethod
+    def create(cls, expected: dict[str, str] | None) -> "ContentHash | None":
+        """源文件没有可用的散列时返回 None"""
+        if not expected or not any(n in expected for n in HASH_ALGORITHMS):
+            return None
+        return cls(expected)
+
+    def update(self, chunk: bytes):
+        self._hash.update(chunk)
+
+    def hexdigest(self) -> str:
+        return self._hash.hexdigest()
+
+    def verify(self) -> bool:
+        return self.hexdigest() == self.expected
+
+    def __repr__(self):
+        return f"<ContentHash {self.name}: {self.hexdigest()} expected {self.expected}>"
 
 
 if __name__ == "__main__":
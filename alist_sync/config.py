@@ -9,13 +9,19 @@ from typing import Optional, Literal, TYPE_CHECKING, Any, Annotated
 
 from alist_sdk import AlistPathType, AlistPath
 from alist_sdk.path_lib import AlistPathPydanticAnnotation
-from httpx import URL
+from httpx import URL, Client, AsyncClient
 from pydantic import Field, BaseModel, BeforeValidator
 from pymongo.database import Database
 
+from alist_sync import metrics
+from alist_sync.http_pool import PoolTransport, AsyncPoolTransport
+from alist_sync.rate_limit import RateLimiter, TokenBucket, bandwidth_bucket
+from alist_sync.scheduler import WorkerScheduler, SchedulePolicy
 
 if TYPE_CHECKING:
-    from alist_sync.data_handle import ShelveHandle, MongoHandle
+    from alist_sync.data_handle import HandleBase
+    from alist_sync.dir_cache import DirCache
+    from alist_sync.snapshot import BaseSnapshot
 
 logger = logging.getLogger("alist-sync.config")
 
@@ -49,11 +55,18 @@ def create_config():
         "ALIST_SYNC_CONFIG", Path(__file__).parent.parent / "config.yaml"
     )
 
-    _sync_config = Config.load_from_yaml(config_file)
+    _sync_config = Config.load_from_yaml(Path(config_file))
     setattr(builtins, "sync_config", _sync_config)
     return _sync_config
 
 
+class RateLimit(BaseModel):
+    """令牌桶: 每秒 qps 个请求, 最多累积 burst 个"""
+
+    qps: float
+    burst: int = 1
+
+
 class AlistServer(BaseModel):
     """"""
 
@@ -63,22 +76,101 @@ class AlistServer(BaseModel):
     token: Optional[str] = None
     has_opt: Optional[bool] = False
 
-    max_connect: int = 30  # 最大同时连接数
+    # 最大同时连接数: 扫描、检查与传输共用该服务器的连接池, 连接数不超过此值
+    max_connect: int = 30
+    keepalive_expiry: float = 30  # 空闲连接保持的时间 (秒)
+    # 从该服务器下载时的分段数与每段的最小大小 (字节)
+    download_segments: int = 4
+    min_segment_size: int = 16 * 1024 * 1024
     storage_config: Optional[Path] = None
+    # 按 API 类别限速, 类别: list, get, put, remove; 没有配置的类别不限速
+    rate_limit: dict[Literal["list", "get", "put", "remove"], RateLimit] = {}
+    # 从该服务器下载与上传到该服务器的总速率 (字节/秒), 0 表示不限速
+    max_bandwidth: int = 0
 
     # httpx 的参数
     verify: Optional[bool] = True
     headers: Optional[dict] = None
 
+    @cached_property
+    def transport(self) -> PoolTransport:
+        """该服务器的连接池, 同步客户端共用"""
+        return PoolTransport(
+            self.max_connect, self.keepalive_expiry, verify=self.verify
+        )
+
+    @cached_property
+    def download_client(self) -> Client:
+        """下载 raw_url 的客户端, 共用该服务器的连接池
+
+        raw_url 可能指向第三方存储, 请求中不能带有 AList 的 Token。
+        """
+        return Client(
+            transport=self.transport,
+            event_hooks={
+                "request": [metrics.request_hook],
+                "response": [metrics.response_hook],
+            },
+        )
+
+    def async_download_client(self, transport: AsyncPoolTransport) -> AsyncClient:
+        """download_client 的异步版本, 使用调用方持有的异步连接池"""
+        return AsyncClient(
+            transport=transport,
+            event_hooks={
+                "request": [metrics.async_request_hook],
+                "response": [metrics.async_response_hook],
+            },
+        )
+
+    @cached_property
+    def rate_limiter(self) -> RateLimiter:
+        """该服务器的限速器, 同步与异步客户端共用"""
+        return RateLimiter(
+            self.base_url,
+            {k: (v.qps, v.burst) for k, v in self.rate_limit.items()},
+        )
+
+    @cached_property
+    def bandwidth(self) -> TokenBucket | None:
+        return bandwidth_bucket(self.max_bandwidth)
+
+    def async_transport(self) -> AsyncPoolTransport:
+        """创建异步连接池, 异步连接池不能跨事件循环使用, 由调用方持有"""
+        return AsyncPoolTransport(
+            self.max_connect, self.keepalive_expiry, verify=self.verify
+        )
+
     def dump_for_alist_client(self):
-        return self.model_dump(exclude={"storage_config"})
+        return self.model_dump(
+            exclude={
+                "storage_config",
+                "download_segments",
+                "min_segment_size",
+                "keepalive_expiry",
+                "rate_limit",
+                "max_bandwidth",
+            }
+        )
 
     def dump_for_alist_path(self):
         _data = self.model_dump(
-            exclude={"storage_config", "max_connect"},
+            exclude={
+                "storage_config",
+                "download_segments",
+                "min_segment_size",
+                "keepalive_expiry",
+                "rate_limit",
+                "max_bandwidth",
+            },
             by_alias=True,
         )
         _data["server"] = _data.pop("base_url")
+        _data["transport"] = self.transport
+        _data["event_hooks"] = {
+            "request": [self.rate_limiter.hook, metrics.request_hook],
+            "response": [metrics.response_hook],
+        }
         return _data
 
 
@@ -98,10 +190,55 @@ class SyncGroup(BaseModel):
     interval: int = 300
     need_backup: bool = False
     backup_dir: str = ".alist-sync-backup"
+    # file: 下载到 cache_dir 中的临时文件后上传; stream: 边下载边上传, 不落盘
+    transfer_mode: Literal["file", "stream"] = "file"
+    # 该同步组全部传输的总速率 (字节/秒), 0 表示不限速
+    max_bandwidth: int = 0
+    # 源文件有 hash_info 时, 校验传输的内容与目标文件的 hash_info
+    verify_hash: bool = False
+    # mirror: 需要复制的文件在目标上有相同的、将要删除的文件时, 在目标上移动
+    detect_move: bool = False
     blacklist: Annotated[list[str], BeforeValidator(lambda x: set_add(x))] = []
     whitelist: Annotated[list[str], BeforeValidator(lambda x: set_add(x))] = []
     group: list[PAlistPathType] = Field(min_length=2)
 
+    @cached_property
+    def bandwidth(self) -> TokenBucket | None:
+        return bandwidth_bucket(self.max_bandwidth)
+
+
+class SchedulerConfig(BaseModel):
+    """Worker 调度, 参见 alist_sync.scheduler"""
+
+    policy: SchedulePolicy = "fifo"
+    # lanes 策略的大小分界 (字节), 默认分为 <10MB, <1GB, >=1GB 三个车道
+    lanes: list[int] = [10 * 1024 * 1024, 1024 * 1024 * 1024]
+    # 每个车道同时运行的最大数量, 0 表示不限
+    lane_limits: list[int] = []
+    # 优先的相对路径模式, 越靠前越优先
+    priority: list[str] = []
+    max_queued: int = 1000
+
+    def create(self) -> WorkerScheduler:
+        return WorkerScheduler(
+            policy=self.policy,
+            lanes=self.lanes,
+            lane_limits=self.lane_limits,
+            priority=self.priority,
+            max_queued=self.max_queued,
+        )
+
+
+class MetricsConfig(BaseModel):
+    """运行指标, 参见 alist_sync.metrics"""
+
+    # 在该端口上提供 /metrics, 0 表示不启用
+    port: int = 0
+    addr: str = "0.0.0.0"
+    # 定时写入该文件, 供 node_exporter 的 textfile collector 采集
+    textfile: Optional[Path] = None
+    interval: float = 15
+
 
 NotifyType = Literal["email", "webhook"]
 
@@ -142,11 +279,23 @@ class Config(BaseModel):
     timeout: int = Field(10)
     ua: str = None
 
+    # 持久化目录列表的有效期(秒), 目录修改时间未变化时复用上次运行的列表, 0 不启用
+    # 只在父目录本次实际列出时复用, 父目录也来自持久化的列表时重新列出
+    dir_cache_ttl: int = 0
+
+    # 全部传输的总速率 (字节/秒), 0 表示不限速
+    max_bandwidth: int = 0
+
+    scheduler: SchedulerConfig = SchedulerConfig()
+    metrics: MetricsConfig = MetricsConfig()
+
     daemon: bool = getenv("ALIST_SYNC_DAEMON", "false").lower() in TrueValues
 
     name: str = getenv("ALIST_SYNC_NAME", "alist-sync")
 
     mongodb_uri: str | None = getenv("ALIST_SYNC_MONGODB_URI", None)
+    # Worker 状态批量写入的间隔(秒), 同一Worker的多次更新合并写入, 0 表示每次更新立即写入
+    state_flush_interval: float = 1
 
     notify: list[EMailNotify | WebHookNotify] = []
 
@@ -171,6 +320,10 @@ class Config(BaseModel):
     def start_time(self) -> int:
         return int(time.time())
 
+    @cached_property
+    def bandwidth(self) -> TokenBucket | None:
+        return bandwidth_bucket(self.max_bandwidth)
+
     @cached_property
     def cache_dir(self) -> Path:
         self.cache__dir.mkdir(exist_ok=True, parents=True)
@@ -188,6 +341,13 @@ class Config(BaseModel):
                 return server
         raise ModuleNotFoundError()
 
+    def get_sync_group(self, name: str) -> SyncGroup | None:
+        """通过名称找到SyncGroup"""
+        for group in self.sync_groups:
+            if group.name == name:
+                return group
+        return None
+
     @cached_property
     def mongodb(self) -> "Database|None":
         from pymongo import MongoClient
@@ -207,18 +367,43 @@ class Config(BaseModel):
         return db
 
     @cached_property
-    def handle(self) -> "ShelveHandle|MongoHandle":
-        from alist_sync.data_handle import ShelveHandle, MongoHandle
+    def handle(self) -> "HandleBase":
+        from alist_sync.data_handle import SQLiteHandle, MongoHandle, WriteBehindHandle
 
         if self.mongodb is None:
-            return ShelveHandle(self.cache_dir)
-        return MongoHandle(self.mongodb)
+            _handle = SQLiteHandle(self.cache_dir.joinpath("alist_cache_state.sqlite"))
+            # 旧版本默认使用 ShelveHandle
+            _handle.import_shelve(self.cache_dir)
+        else:
+            _handle = MongoHandle(self.mongodb)
+        if self.state_flush_interval <= 0:
+            return _handle
+        return WriteBehindHandle(_handle, self.state_flush_interval)
+
+    @cached_property
+    def dir_cache(self) -> "DirCache":
+        from alist_sync.dir_cache import DirCache, DirStore
+
+        if self.dir_cache_ttl <= 0:
+            return DirCache()
+        return DirCache(
+            DirStore(self.cache_dir.joinpath("alist_cache_dirs.sqlite")),
+            ttl=self.dir_cache_ttl,
+        )
+
+    @cached_property
+    def snapshot(self) -> "BaseSnapshot":
+        """双向同步的基准快照"""
+        from alist_sync.snapshot import BaseSnapshot
+
+        return BaseSnapshot(self.cache_dir.joinpath("alist_sync_base.sqlite"))
 
     @classmethod
     def load_from_yaml(cls, file: Path) -> "Config":
         from yaml import safe_load
 
-        return cls.model_validate(safe_load(file.open("rb")))
+        with Path(file).open("rb") as fs:
+            return cls.model_validate(safe_load(fs))
 
     def dump_to_yaml(self, file: Path = None):
         from yaml import safe_dump
@@ -6,23 +6,26 @@
 @Date-Time  : 2024/2/25 21:17
 
 """
+
 import datetime
 import fnmatch
 import logging
+import posixpath
 import threading
 import time
-from queue import Queue, Empty
-from typing import Iterator
+from collections import Counter
+from queue import Queue
+from typing import Iterator, Iterable
 from functools import lru_cache
 
 from alist_sdk import AlistPath, RawItem, AlistPathType, Item
 from pydantic import BaseModel
 
+from alist_sync import metrics, profiler
+from alist_sync.common import hash_info_dict, hash_match
 from alist_sync.config import create_config, SyncGroup
 from alist_sync.d_worker import Worker
 from alist_sync.thread_pool import MyThreadPoolExecutor
-from alist_sync.common import prefix_in_threads
-
 
 logger = logging.getLogger("alist-sync.d_checker")
 sync_config = create_config()
@@ -44,58 +47,137 @@ class SyncRawItem(BaseModel):
 
 
 class Checker:
+    # 是否支持 detect_move (move_workers): 目标上多余的文件会被删除时, 才可以移动到新的位置
+    supports_move = False
+
     def __init__(self, sync_group: SyncGroup, scaner_queue: Queue, worker_queue: Queue):
         self.sync_group: SyncGroup = sync_group
         self.worker_queue = worker_queue
         self.scaner_queue: Queue[AlistPath] = scaner_queue
 
         self.conflict: set = set()
-        self.pool = MyThreadPoolExecutor(10)
-        self.stat_sq = threading.Semaphore(4)
+        # 线程名前缀也是线程池指标的名称, 包含同步组的名称
+        self.pool = MyThreadPoolExecutor(
+            10, thread_name_prefix=f"checker[{self.sync_group.name}]_"
+        )
+        self.list_pool = MyThreadPoolExecutor(
+            len(self.sync_group.group) * 2,
+            thread_name_prefix=f"checker_list[{self.sync_group.name}]_",
+        )
         self.main_thread = threading.Thread(
             target=self.main,
             name=f"checker_main[{self.sync_group.name}-{self.__class__.__name__}]",
         )
+        self.walker_thread = threading.Thread(
+            target=self.walker,
+            name=f"checker_walker[{self.sync_group.name}-{self.__class__.__name__}]",
+        )
+        self._walking = 0
+        self._walk_cond = threading.Condition()
+        # 待遍历的目录与待检查的文件
+        metrics.register_queue(
+            f"checker_walk[{self.sync_group.name}]", lambda: self._walking
+        )
+        self.delete_plans: dict[AlistPath, set[str]] = {}
+        self._plan_lock = threading.Lock()
 
     @lru_cache(64)
     def split_path(self, path: AlistPath) -> tuple[AlistPath, str]:
         """将Path切割为sync_dir和相对路径"""
         for sr in self.sync_group.group:
-            try:
+            if path.is_relative_to(sr):
                 return sr, path.relative_to(sr)
-            except ValueError:
-                pass
         raise ValueError()
 
     def get_backup_dir(self, path) -> AlistPath:
         return self.split_path(path)[0].joinpath(self.sync_group.backup_dir)
 
-    def create_worker(self, type_: str, source_path: AlistPath, target_path: AlistPath):
+    def create_worker(
+        self,
+        type_: str,
+        source_path: AlistPath,
+        target_path: AlistPath,
+        source_stat: Item | None = None,
+        **kwargs,
+    ):
+        """创建 Worker
+
+        :param source_stat: 目录列表中已知的源文件信息, Worker 不再单独查询
+        """
+        if source_stat is not None:
+            kwargs |= dict(
+                file_size=source_stat.size,
+                source_modified=source_stat.modified,
+                source_hash=hash_info_dict(source_stat.hash_info),
+            )
         return Worker(
             type=type_,
             group_name=self.sync_group.name,
             need_backup=self.sync_group.need_backup,
-            backup_dir=self.get_backup_dir(source_path),
+            backup_dir=self.get_backup_dir(target_path),
+            transfer_mode=self.sync_group.transfer_mode,
             relative_path=self.split_path(source_path)[1],
             source_path=source_path,
             target_path=target_path,
+            verify_hash=self.sync_group.verify_hash,
+            **kwargs,
         )
 
+    delete_batch_size = 100
+
+    def plan_delete(self, target_dir: AlistPath, names: Iterable[str]):
+        """登记需要删除的文件，遍历结束后按目录批量生成删除Worker"""
+        names = set(names)
+        if not names:
+            return
+        with self._plan_lock:
+            self.delete_plans.setdefault(target_dir, set()).update(names)
+
+    def delete_workers(self) -> Iterator[Worker]:
+        """按目录与批量大小生成删除Worker"""
+        with self._plan_lock:
+            plans, self.delete_plans = self.delete_plans, {}
+        for target_dir, names in sorted(plans.items(), key=lambda x: str(x[0])):
+            names = sorted(names)
+            for i in range(0, len(names), self.delete_batch_size):
+                _batch = names[i : i + self.delete_batch_size]
+                logger.info(
+                    f"Checked: [DELETE] {target_dir.as_uri()} 中的 {len(_batch)} 项"
+                )
+                yield Worker(
+                    type="delete",
+                    group_name=self.sync_group.name,
+                    need_backup=self.sync_group.need_backup,
+                    backup_dir=self.get_backup_dir(target_dir),
+                    relative_path=self.split_path(target_dir)[1],
+                    target_path=target_dir,
+                    delete_names=_batch,
+                )
+
+    def put_worker(self, worker: Worker):
+        """Worker 进入队列"""
+        self.worker_queue.put(worker)
+
     _stat_get_times = 0
 
-    @lru_cache(40_000)
+    @profiler.timed("stat")
     def get_stat(self, path: AlistPath) -> SyncRawItem:
-        # BUGFIX  控制QPS而不时并发
-        with self.stat_sq:
-            self._stat_get_times += 1
-            logger.debug("get_stat: %s, times: %d", path, self._stat_get_times)
-            try:
-                stat = path.client.dict_files_item(
-                    path.parent.as_posix()
-                ).get(path.name)
-            except FileNotFoundError:
-                stat = None
-            return SyncRawItem(path=path, stat=stat)
+        """从目录列表缓存中获取文件信息，每个目录只会被列出一次
+
+        请求速率由服务器的 rate_limit 控制
+        """
+        self._stat_get_times += 1
+        logger.debug("get_stat: %s, times: %d", path, self._stat_get_times)
+        stat = sync_config.dir_cache.get_item(path)
+        if stat is not None:
+            path.set_stat(stat)
+        return SyncRawItem(path=path, stat=stat)
+
+    def list_dir(
+        self, path: AlistPath, modified: datetime.datetime | None = None
+    ) -> dict[str, Item]:
+        """列出目录，经过目录列表缓存"""
+        return sync_config.dir_cache.list_dir(path, modified)
 
     def checker(
         self,
@@ -104,6 +186,149 @@ class Checker:
     ) -> "Worker|None":
         raise NotImplementedError
 
+    def required_roots(self) -> list[AlistPath]:
+        """遍历前必须存在的成员目录，默认为源目录"""
+        return self.sync_group.group[:1]
+
+    def walk_members(self) -> list[AlistPath]:
+        """遍历时需要立即列出的成员，其余成员的列表为None，由checker_dir按需列出"""
+        return self.sync_group.group
+
+    def walk_dirs(
+        self, relative_path: str, listings: dict[AlistPath, dict[str, Item]]
+    ) -> set[str]:
+        """需要继续向下遍历的子目录名称，默认为源目录中的子目录"""
+        return {
+            name
+            for name, item in listings[self.sync_group.group[0]].items()
+            if item.is_dir
+        }
+
+    def checker_dir(
+        self, relative_path: str, listings: dict[AlistPath, dict[str, Item]]
+    ) -> Iterator["Worker|None"]:
+        """对比同一相对目录在全部成员上的列表，一次给出整个目录的决策
+
+        :param relative_path: 相对于同步目录的路径
+        :param listings: {同步目录: {文件名: Item}}
+        """
+        source = self.sync_group.group[0]
+        source_items = listings[source]
+        for name in sorted(source_items):
+            item = source_items[name]
+            _relative = posixpath.join(relative_path, name)
+            if item.is_dir or self.ignore(_relative):
+                continue
+            source_path = source.joinpath(_relative)
+            source_path.set_stat(item)
+            for member, items in listings.items():
+                if member == source:
+                    continue
+                target_path = member.joinpath(_relative)
+                if (target_item := items.get(name)) is not None:
+                    target_path.set_stat(target_item)
+                yield self.checker(
+                    SyncRawItem(path=source_path, stat=item),
+                    SyncRawItem(path=target_path, stat=target_item),
+                )
+
+    def walk(
+        self,
+        relative_path: str = "",
+        dirs: dict[AlistPath, Item | None] | None = None,
+    ):
+        """同时列出全部成员上的同一相对目录，对比后向下遍历
+
+        :param relative_path: 相对于同步目录的路径
+        :param dirs: 父目录列表中该目录在每个成员上的Item,
+            为None的成员已知不存在该目录，不再发起请求
+        """
+        logger.debug("Walking [%s] in %s", relative_path, self.sync_group.name)
+        eager = self.walk_members()
+        if dirs is None:
+            dirs = {member: None for member in self.sync_group.group}
+            absent = set()
+        else:
+            absent = {member for member, item in dirs.items() if item is None}
+
+        _futures = {
+            member: self.list_pool.submit(
+                self.list_dir,
+                member.joinpath(relative_path),
+                item.modified if item is not None else None,
+            )
+            for member, item in dirs.items()
+            if member in eager and member not in absent
+        }
+        listings = {
+            member: (
+                _futures[member].result()
+                if member in _futures
+                else ({} if member in eager else None)
+            )
+            for member in self.sync_group.group
+        }
+
+        for _worker in profiler.timed_iter(
+            "check", self.checker_dir(relative_path, listings)
+        ):
+            if _worker:
+                self.put_worker(_worker)
+
+        for name in sorted(self.walk_dirs(relative_path, listings)):
+            _relative = posixpath.join(relative_path, name)
+            if self.ignore(_relative):
+                continue
+            self._submit_walk(
+                _relative,
+                {
+                    member: (
+                        items[name]
+                        if items and name in items and items[name].is_dir
+                        else None
+                    )
+                    for member, items in listings.items()
+                },
+            )
+
+    def _submit_walk(self, relative_path: str, dirs: dict | None = None):
+        with self._walk_cond:
+            self._walking += 1
+        self.pool.submit(self._t_walk, relative_path, dirs)
+
+    def _t_walk(self, relative_path: str, dirs: dict | None):
+        try:
+            self.walk(relative_path, dirs)
+        except Exception as _e:
+            logger.error("Walker Error [%s]: ", relative_path, exc_info=_e)
+        finally:
+            with self._walk_cond:
+                self._walking -= 1
+                self._walk_cond.notify_all()
+
+    def walker(self):
+        """按目录同步遍历全部成员，直到没有待遍历的目录"""
+        logger.info(f"Walker Started - name: {self.walker_thread.name}")
+        _missing = [m.as_uri() for m in self.required_roots() if not m.exists()]
+        if _missing:
+            logger.error(
+                f"[{self.sync_group.name}] 目录不存在, 跳过该同步组: {_missing}"
+            )
+            self.pool.shutdown(wait=True)
+            self.list_pool.shutdown(wait=True)
+            return
+        self._submit_walk("")
+        with self._walk_cond:
+            self._walk_cond.wait_for(lambda: self._walking == 0)
+        if self.supports_move:
+            for _worker in self.move_workers():
+                self.worker_queue.put(_worker)
+        for _worker in self.delete_workers():
+            self.worker_queue.put(_worker)
+        self.pool.shutdown(wait=True)
+        self.list_pool.shutdown(wait=True)
+        logger.info(f"遍历完成 - {self.walker_thread.name}")
+
     def ignore(self, relative_path) -> bool:
         for _i in self.sync_group.blacklist:
             if fnmatch.fnmatchcase(relative_path, _i):
@@ -123,48 +348,31 @@ class Checker:
 
     def _t_checker(self, path):
         try:
-            for _c in self.checker_every_dir(path):
+            for _c in profiler.timed_iter("check", self.checker_every_dir(path)):
                 if _c:
                     self.worker_queue.put(_c)
         except Exception as _e:
             logger.error("Checker Error: ", exc_info=_e)
 
     def main(self):
-        """"""
+        """逐个检查 scaner_queue 中的文件, 取到 None 时等待检查完成后退出"""
         logger.info(f"Checker Started - name: {self.main_thread.name}")
-        _started = False
         while True:
-            if (
-                self.scaner_queue.empty()
-                and sync_config.daemon is False
-                and not prefix_in_threads("scaner_")
-                and time.time() - sync_config.start_time > sync_config.timeout
-            ):
-                logger.info(f"循环线程退出 - {self.main_thread.name}")
+            path = self.scaner_queue.get()
+            if path is None:
                 break
-
-            try:
-                _started = True
-                path = self.scaner_queue.get(timeout=3)
-                self.pool.submit(self._t_checker, path)
-            except Empty:
-                logger.debug(
-                    "Checker Size: %s, %d",
-                    self.sync_group.name,
-                    self.pool.work_qsize(),
-                )
-                if _started:
-                    continue
-                logger.info(
-                    f"Checkers: 空 Scaner 队列, 如果没有新的任务, "
-                    f"{sync_config.timeout - (time.time() - sync_config.start_time):d}"
-                    f"秒后退出"
-                )
+            self.pool.submit(self._t_checker, path)
+        self.pool.shutdown(wait=True)
+        logger.info(f"循环线程退出 - {self.main_thread.name}")
 
     def start(self) -> threading.Thread:
         self.main_thread.start()
         return self.main_thread
 
+    def start_walker(self) -> threading.Thread:
+        self.walker_thread.start()
+        return self.walker_thread
+
 
 class CheckerCopy(Checker):
     """"""
@@ -180,43 +388,526 @@ class CheckerCopy(Checker):
                 type_="copy",
                 source_path=source_stat.path,
                 target_path=target_stat.path,
+                source_stat=source_stat.stat,
             )
 
         logger.info(f"Checked: [JUMP] {source_stat.path.as_uri()}")
         return None
 
 
-class CheckerMirror(Checker):
-    """"""
+class CheckerMirror(CheckerCopy):
+    """镜像: 复制源目录中的文件，删除目标目录中存在但源目录中不存在的文件
 
-    def checker(
-        self, source_stat: SyncRawItem, target_stat: SyncRawItem
-    ) -> "Worker|None":
-        # _main = self.sync_group.group[0]
-        # # target如果是主存储器 - 且target不存在，source存在，删除source
-        # if target_stat == _main and not target_stat.exists() and source_stat.exists():
-        #     return Worker(
-        #         type="delete",
-        #         need_backup=self.sync_group.need_backup,
-        #         backup_dir=self.get_backup_dir(source_stat.path),
-        #         target_path=source_stat.path,
-        #     )
-        # if not target_stat.exists():
-        #     return Worker(
-        #         type="copy",
-        #         need_backup=False,
-        #         source_path=source_stat.path,
-        #         target_path=target_stat.path,
-        #     )
-        return None
+    删除在遍历结束后，按目标目录分批交给Worker。
+    detect_move 时，需要复制的文件与将要删除的文件相同时，在目标上移动该文件。
+    """
+
+    supports_move = True
+    # detect_move 时最多暂缓的复制Worker数量, 限制遍历期间占用的内存
+    move_hold_limit = 10000
+
+    def __init__(self, sync_group: SyncGroup, scaner_queue: Queue, worker_queue: Queue):
+        super().__init__(sync_group, scaner_queue, worker_queue)
+        # detect_move: 遍历结束前暂缓的复制Worker, 与目标上源目录中不存在的文件、目录
+        self.detect_move = self.sync_group.detect_move
+        self._held: list[Worker] = []
+        self._hold_full = False
+        self._orphans: list[tuple[AlistPath, Item]] = []
+
+    def checker_dir(
+        self, relative_path: str, listings: dict[AlistPath, dict[str, Item]]
+    ) -> Iterator["Worker|None"]:
+        yield from super().checker_dir(relative_path, listings)
+
+        source = self.sync_group.group[0]
+        source_items = listings[source]
+        for member, items in listings.items():
+            if member == source:
+                continue
+            _extra = {
+                name: item
+                for name, item in items.items()
+                if name not in source_items
+                and not self.ignore(posixpath.join(relative_path, name))
+            }
+            self.plan_delete(member.joinpath(relative_path), _extra)
+            if self.detect_move and _extra:
+                self.plan_orphans(member.joinpath(relative_path), _extra)
+
+    def put_worker(self, worker: Worker):
+        """detect_move 时复制Worker暂缓到遍历结束, 其余直接进入队列
+
+        暂缓的数量达到 move_hold_limit 后, 之后的复制Worker直接进入队列, 不再检测移动
+        """
+        if self.detect_move and worker.type == "copy":
+            with self._plan_lock:
+                if len(self._held) < self.move_hold_limit:
+                    self._held.append(worker)
+                    return
+                if not self._hold_full:
+                    self._hold_full = True
+                    logger.warning(
+                        f"[{self.sync_group.name}] 暂缓的复制已达到 "
+                        f"{self.move_hold_limit}, 之后的复制不再检测移动"
+                    )
+        self.worker_queue.put(worker)
+
+    def plan_orphans(self, target_dir: AlistPath, items: dict[str, Item]):
+        """登记目标上源目录中不存在的文件与目录, 作为移动的来源"""
+        _orphans = [(target_dir.joinpath(name), item) for name, item in items.items()]
+        with self._plan_lock:
+            self._orphans.extend(_orphans)
+
+    def _orphan_files(
+        self, orphans: list[tuple[AlistPath, Item]]
+    ) -> Iterator[tuple[AlistPath, Item]]:
+        """展开登记的目录, 只在有暂缓的复制Worker时列出"""
+        for path, item in orphans:
+            if not item.is_dir:
+                yield path, item
+                continue
+            _relative = self.split_path(path)[1]
+            yield from self._orphan_files(
+                [
+                    (path.joinpath(name), _item)
+                    for name, _item in self.list_dir(path, item.modified).items()
+                    if not self.ignore(posixpath.join(_relative, name))
+                ]
+            )
+
+    @staticmethod
+    def _move_key(member: AlistPath, size: int, modified: datetime.datetime):
+        return member, size, int(modified.timestamp())
+
+    def move_workers(self) -> Iterator[Worker]:
+        """为暂缓的复制Worker在目标上寻找相同的已有文件, 找到时改为移动
+
+        大小与修改时间 (秒) 相同, 两边都有散列时散列也必须相同;
+        没有可比较的散列时, 只在大小与修改时间唯一对应一个文件时移动
+        """
+        with self._plan_lock:
+            held, self._held = self._held, []
+            orphans, self._orphans = self._orphans, []
+        if not held or not orphans:
+            yield from held
+            return
+
+        candidates: dict[tuple, dict[AlistPath, Item]] = {}
+        try:
+            for path, item in self._orphan_files(orphans):
+                _key = self._move_key(
+                    self.split_path(path)[0], item.size, item.modified
+                )
+                candidates.setdefault(_key, {})[path] = item
+        except Exception as _e:
+            logger.error("列出目标上多余的目录失败, 全部复制: ", exc_info=_e)
+            yield from held
+            return
+
+        keys = {
+            w.id: self._move_key(self.split_path(w.target_path)[0], *w.source_stat())
+            for w in held
+        }
+        counts = Counter(keys.values())
+        for worker in held:
+            _paths = candidates.get(keys[worker.id], {})
+            _matches = {
+                p: hash_match(worker.source_hash, hash_info_dict(item.hash_info))
+                for p, item in _paths.items()
+            }
+            found = next((p for p, m in _matches.items() if m is True), None)
+            if (
+                found is None
+                and counts[keys[worker.id]] == 1
+                and list(_matches.values()) == [None]
+            ):
+                found = next(iter(_paths))
+            if found is None:
+                yield worker
+                continue
+            _paths.pop(found)
+            logger.info(
+                f"Checked: [MOVE] {found.as_uri()} -> {worker.target_path.as_uri()}"
+            )
+            yield self.relocate_worker(worker, found)
+
+    def relocate_worker(self, worker: Worker, found: AlistPath) -> Worker:
+        """移动代替复制, 移走的文件与它所在的多余目录本次不再删除, 空目录在下次同步时删除"""
+        member = self.split_path(found)[0]
+        with self._plan_lock:
+            _path = found
+            while _path != member:
+                if (_names := self.delete_plans.get(_path.parent)) is not None:
+                    _names.discard(_path.name)
+                _path = _path.parent
+        return Worker(
+            **{
+                **worker.model_dump(exclude={"id"}, exclude_none=True),
+                "type": "move",
+                "move_from": found,
+            }
+        )
+
+
+# 基准中文件记录的保留键: 计划的复制, 成员URI中总是有 "://", 不会冲突
+PENDING = "pending"
 
 
 class CheckerSync(Checker):
-    """"""
+    """双向同步: 以上次全部成员一致时的基准快照做三方对比
+
+    相对于基准，只在一个成员上修改/新增的文件复制到其他成员，
+    只被删除而其他成员未修改的文件在其他成员上删除，
+    多个成员同时修改时以修改时间最新的为准，并记录冲突。
+    配置了 dir_cache_ttl 时，基准中没有未完成操作、且全部成员上目录修改时间
+    都未变化的目录，不再逐个对比文件; 修改时间只取自本次运行中实际列出的父目录，
+    只有直接子项的变化会更新目录的修改时间，子目录仍然逐个检查。
+    """
+
+    def __init__(self, sync_group: SyncGroup, scaner_queue: Queue, worker_queue: Queue):
+        super().__init__(sync_group, scaner_queue, worker_queue)
+        self.snapshot = sync_config.snapshot
+        self._uris = {member: member.as_uri() for member in self.sync_group.group}
+        self._local = threading.local()
+
+    def required_roots(self) -> list[AlistPath]:
+        """全部成员: 成员目录不存在 (例如存储未挂载) 时与删除了全部文件无法区分"""
+        return self.sync_group.group
+
+    def list_dir(
+        self, path: AlistPath, modified: datetime.datetime | None = None
+    ) -> dict[str, Item]:
+        """父目录的列表中存在的目录列出时不存在, 抛出异常, 不视为删除了其中的全部文件"""
+        return sync_config.dir_cache.list_dir(path, modified, missing_ok=False)
+
+    @staticmethod
+    def _sig(item: Item) -> list[float]:
+        return [item.size, item.modified.timestamp()]
+
+    def _dirs_sig(self, dirs: dict[AlistPath, Item | None]) -> dict[str, float]:
+        return {
+            self._uris[member]: item.modified.timestamp()
+            for member, item in dirs.items()
+            if item is not None
+        }
+
+    def walk(
+        self,
+        relative_path: str = "",
+        dirs: dict[AlistPath, Item | None] | None = None,
+    ):
+        self._local.dirs = dirs
+        try:
+            super().walk(relative_path, dirs)
+        except Exception:
+            self.snapshot.invalidate(self.sync_group.name, relative_path)
+            raise
+
+    def walk_dirs(
+        self, relative_path: str, listings: dict[AlistPath, dict[str, Item]]
+    ) -> set[str]:
+        """全部成员中的子目录"""
+        return {
+            name
+            for items in listings.values()
+            for name, item in items.items()
+            if item.is_dir
+        }
+
+    def unchanged(
+        self, row, relative_path: str, dirs: dict[AlistPath, Item | None]
+    ) -> bool:
+        """目录在基准中是干净的，且全部成员上的修改时间都未变化
+
+        修改时间来自父目录的列表, 父目录的列表来自持久化存储时不可信
+        """
+        return (
+            sync_config.dir_cache_ttl > 0
+            and row is not None
+            and row.clean
+            and bool(dirs)
+            and time.time() - row.update_time <= sync_config.dir_cache_ttl
+            and row.dirs_sig == self._dirs_sig(dirs)
+            and all(
+                sync_config.dir_cache.live(member.joinpath(relative_path).parent)
+                for member, item in dirs.items()
+                if item is not None
+            )
+        )
+
+    def checker_dir(
+        self, relative_path: str, listings: dict[AlistPath, dict[str, Item]]
+    ) -> Iterator["Worker|None"]:
+        group = self.sync_group.group
+        dirs = self._local.dirs or {}
+        row = self.snapshot.get(self.sync_group.name, relative_path)
+        if self.unchanged(row, relative_path, dirs):
+            logger.debug("Sync: 目录未变化 [%s]", relative_path)
+            return
+        base = row.entries if row is not None else {}
+
+        # 成员删除了整个目录，其他成员上的该目录已经为空
+        if row is not None and relative_path and not any(listings.values()):
+            _deleted = [m for m, item in dirs.items() if item is None]
+            if any(self._uris[m] in row.dirs_sig for m in _deleted):
+                _parent, _name = posixpath.split(relative_path)
+                for member, item in dirs.items():
+                    if item is not None:
+                        logger.info(
+                            f"Checked: [DELETE] {member.joinpath(relative_path).as_uri()}"
+                        )
+                        self.plan_delete(member.joinpath(_parent), [_name])
+                self.snapshot.delete(self.sync_group.name, relative_path)
+                return
+
+        entries = {}
+        subdirs = set()
+        clean = True
+        for name in sorted(set(base).union(*listings.values())):
+            _relative = posixpath.join(relative_path, name)
+            if self.ignore(_relative):
+                continue
+            current = {member: listings[member].get(name) for member in group}
+            kinds = {item.is_dir for item in current.values() if item is not None}
+            if kinds == {True}:
+                subdirs.add(name)
+                continue
+            if len(kinds) > 1:
+                self.add_conflict(_relative, "文件与目录同名")
+                clean = False
+                continue
+
+            agreed, _entry = yield from self.merge_file(
+                _relative, current, base.get(name, {})
+            )
+            if not agreed:
+                clean = False
+            if _entry:
+                entries[name] = _entry
+
+        if row is not None:
+            for name in set(row.subdirs) - subdirs:
+                self.snapshot.delete(
+                    self.sync_group.name, posixpath.join(relative_path, name)
+                )
+        self.snapshot.put(
+            self.sync_group.name,
+            relative_path,
+            entries,
+            subdirs,
+            (
+                self._dirs_sig(dirs)
+                if clean or row is None
+                # 未完成时保留上次一致时存在该目录的成员，用于判断目录删除
+                else row.dirs_sig
+            ),
+            clean,
+        )
+
+    @staticmethod
+    def identical(a: Item, b: Item) -> bool:
+        """大小与散列相同; 没有可比较的散列时, 大小与修改时间相同"""
+        _match = hash_match(hash_info_dict(a.hash_info), hash_info_dict(b.hash_info))
+        return a.size == b.size and (
+            _match if _match is not None else a.modified == b.modified
+        )
+
+    def converged(
+        self,
+        current: dict[AlistPath, Item | None],
+        base: dict[AlistPath, list[float] | None],
+        pending: dict,
+    ) -> bool:
+        """上次计划的复制是否已经完成
+
+        源文件与计划时相同; 目标文件的大小与源文件相同, 且修改时间与源文件相同
+        (上传时保留了修改时间) 或者与计划时不同 (已被复制覆盖); 其余成员与基准相同
+        """
+        _from, _sig = pending["from"], pending["sig"]
+        for member, item in current.items():
+            uri = self._uris[member]
+            if uri == _from:
+                if item is None or self._sig(item) != _sig:
+                    return False
+            elif uri in pending["to"]:
+                if item is None or item.size != _sig[0]:
+                    return False
+                if item.modified.timestamp() != _sig[1] and (
+                    self._sig(item) == pending["to"][uri]
+                ):
+                    return False
+            elif (self._sig(item) if item is not None else None) != base[member]:
+                return False
+        return True
+
+    def merge_file(
+        self,
+        relative_path: str,
+        current: dict[AlistPath, Item | None],
+        entry: dict,
+    ) -> Iterator["Worker|None"]:
+        """三方对比一个文件
+
+        :param entry: 基准中该文件的记录 {成员URI: [大小, 修改时间], "pending": 计划的复制}
+        :return: (全部成员是否已经一致, 保存到基准中的记录)
+
+        计划复制时基准保持上次一致时的状态, 另外记录计划的复制;
+        复制失败时下次仍以旧的基准对比, 不会反向复制
+        """
+        present = {m: item for m, item in current.items() if item is not None}
+        if not present:
+            return True, None
+
+        base = {m: entry.get(self._uris[m]) for m in current}
+        _current = {self._uris[m]: self._sig(item) for m, item in present.items()}
+        pending = entry.get(PENDING)
+        if pending is not None and self.converged(current, base, pending):
+            return True, _current
+
+        changed = [m for m, item in present.items() if base[m] != self._sig(item)]
+        deleted = [m for m in current if m not in present and base[m] is not None]
+        _first = next(iter(present.values()))
+        if len(present) == len(current) and (
+            not changed or all(self.identical(_first, i) for i in present.values())
+        ):
+            return True, _current
+
+        _base = {k: v for k, v in entry.items() if k != PENDING}
+        _parent, _name = posixpath.split(relative_path)
+        if deleted and not changed:
+            for member in present:
+                logger.info(
+                    f"Checked: [DELETE] {member.joinpath(relative_path).as_uri()}"
+                )
+                self.plan_delete(member.joinpath(_parent), [_name])
+            return False, _base
+
+        winner = max(changed or present, key=lambda m: present[m].modified)
+        if deleted and changed:
+            self.add_conflict(relative_path, "删除与修改冲突, 保留修改")
+        if any(not self.identical(present[m], present[winner]) for m in changed):
+            self.add_conflict(relative_path, "多个成员同时修改, 保留最新的修改")
+
+        source_path = winner.joinpath(relative_path)
+        source_path.set_stat(present[winner])
+        targets = {}
+        for member in current:
+            if member == winner:
+                continue
+            # 未修改的成员在没有修改时一致; 内容相同的成员不需要复制
+            if member in present and (
+                not changed or self.identical(present[member], present[winner])
+            ):
+                continue
+            target_path = member.joinpath(relative_path)
+            if member in present:
+                target_path.set_stat(present[member])
+            logger.info(
+                f"Checked: [COPY] {source_path.as_uri()} -> {target_path.as_uri()}"
+            )
+            targets[self._uris[member]] = (
+                self._sig(present[member]) if member in present else None
+            )
+            yield self.create_worker(
+                type_="copy",
+                source_path=source_path,
+                target_path=target_path,
+                source_stat=present[winner],
+            )
+        if not targets:
+            return False, _base
+        return False, {
+            **_base,
+            PENDING: {
+                "from": self._uris[winner],
+                "sig": self._sig(present[winner]),
+                "to": targets,
+            },
+        }
+
+    def add_conflict(self, relative_path: str, reason: str):
+        logger.warning(f"Conflict: [{self.sync_group.name}] {relative_path}: {reason}")
+        self.conflict.add(relative_path)
 
 
 class CheckerSyncIncr(Checker):
-    """"""
+    """增量同步
+
+    每次同步成功后记录源文件的修改时间与大小，
+    源文件的修改时间不晚于记录时，不再获取Target的信息，直接跳过。
+    """
+
+    def walk_members(self) -> list[AlistPath]:
+        return self.sync_group.group[:1]
+
+    def checker(
+        self, source_stat: SyncRawItem, target_stat: SyncRawItem
+    ) -> "Worker|None":
+        _source, _target = source_stat.stat, target_stat.stat
+        if (
+            _target is not None
+            and _target.size == _source.size
+            and _target.modified >= _source.modified
+        ):
+            logger.info(f"Checked: [JUMP] {source_stat.path.as_uri()}")
+            with profiler.stage("persist"):
+                sync_config.handle.update_file_item(target_stat.path, _source)
+            return None
+
+        logger.info(
+            f"Checked: [COPY] {source_stat.path.as_uri()} -> {target_stat.path.as_uri()}"
+        )
+        return self.create_worker(
+            type_="copy",
+            source_path=source_stat.path,
+            target_path=target_stat.path,
+            source_stat=_source,
+        )
+
+    def checker_dir(
+        self, relative_path: str, listings: dict[AlistPath, dict[str, Item] | None]
+    ) -> Iterator["Worker|None"]:
+        source = self.sync_group.group[0]
+        source_items = {
+            name: item
+            for name, item in listings[source].items()
+            if not item.is_dir and not self.ignore(posixpath.join(relative_path, name))
+        }
+        if not source_items:
+            return
+
+        for member in self.sync_group.group[1:]:
+            _target_dir = member.joinpath(relative_path)
+            states = sync_config.handle.get_file_items(
+                _target_dir.joinpath(name) for name in source_items
+            )
+            changed = {
+                name: item
+                for name, item in source_items.items()
+                if (state := states.get(_target_dir.joinpath(name).as_uri())) is None
+                or state.size != item.size
+                or item.modified > state.modified
+            }
+            logger.debug(
+                "Incr: %s 中 %d/%d 个文件有变化",
+                _target_dir.as_uri(),
+                len(changed),
+                len(source_items),
+            )
+            if not changed:
+                continue
+
+            target_items = self.list_dir(_target_dir)
+            for name, item in changed.items():
+                source_path = source.joinpath(relative_path, name)
+                source_path.set_stat(item)
+                target_path = _target_dir.joinpath(name)
+                if (target_item := target_items.get(name)) is not None:
+                    target_path.set_stat(target_item)
+                yield self.checker(
+                    SyncRawItem(path=source_path, stat=item),
+                    SyncRawItem(path=target_path, stat=target_item),
+                )
 
 
 def get_checker(type_: str) -> type[Checker]:
@@ -1,12 +1,11 @@
 #!/bin/env python3
-"""
+""" """
 
-"""
 import collections
 import fnmatch
 import logging
+import posixpath
 import threading
-import time
 from functools import lru_cache
 from queue import Queue
 from typing import Callable
@@ -15,10 +14,11 @@ import alist_sdk
 
 from alist_sdk import AlistPath, login_server
 
-from alist_sync.d_worker import Workers
+from alist_sync import metrics
+from alist_sync.d_worker import Workers, AsyncWorkers
 from alist_sync.thread_pool import MyThreadPoolExecutor
 from alist_sync.config import SyncGroup, create_config, AlistServer
-from alist_sync.common import beautify_size, all_thread_name
+from alist_sync.common import beautify_size
 from alist_sync.d_checker import get_checker
 
 sync_config = create_config()
@@ -31,7 +31,22 @@ def login_alist(server: AlistServer):
     logger.info("Login: %s[%s] Success.", _c.base_url, _c.login_username)
 
 
+def login_groups():
+    """登录全部启用的同步组用到的服务器, 每个服务器一次"""
+    _servers: dict[str, AlistServer] = {}
+    for sync_group in sync_config.sync_groups:
+        if sync_group.enable is False:
+            continue
+        for uri in sync_group.group:
+            server = sync_config.get_server(uri.as_uri())
+            _servers.setdefault(server.base_url, server)
+    for server in _servers.values():
+        login_alist(server)
+
+
 def _make_ignore(_sync_group):
+    """按黑名单忽略路径, 只用于 main_debug; 同步使用 Checker.ignore"""
+
     @lru_cache(64)
     def split_path(_sync_group, path: AlistPath) -> tuple[AlistPath, str]:
         """将Path切割为sync_dir和相对路径"""
@@ -57,40 +72,49 @@ def _make_ignore(_sync_group):
 
 
 def scaner(url: AlistPath, _queue, i_func: Callable[[str | AlistPath], bool] = None):
-    def _scaner(_url: AlistPath, _s_num):
+    """遍历目录, 将文件放入队列, 全部目录列出后返回
+
+    同步与检查使用 Checker.walk 同时遍历全部成员, 不再使用该函数;
+    保留用于基准测试的 scan 阶段, 测量单个目录树的列出速度
+    """
+
+    def _submit(_url: AlistPath, _modified=None):
+        with _cond:
+            _pending[0] += 1
+        pool.submit(_scaner, _url, _modified)
+
+    def _scaner(_url: AlistPath, _modified=None):
         """ """
-        if i_func is not None and i_func(_url):
-            return
-        logger.debug(f"Scaner: {_url}")
         try:
-            _s_num.append(1)
-            for item in _url.iterdir():
-                if item.is_file():
+            if i_func is not None and i_func(_url):
+                return
+            logger.debug(f"Scaner: {_url}")
+            for name, _item in sync_config.dir_cache.list_dir(_url, _modified).items():
+                item = _url.joinpath(name)
+                item.set_stat(_item)
+                if _item.is_dir:
+                    _submit(item, _item.modified)
+                else:
                     logger.debug(f"Find File: {item}")
                     _queue.put(item)
-                elif item.is_dir():
-                    pool.submit(_scaner, item, _s_num)
         except alist_sdk.AlistError:
             pass
         except Exception as _e:
             logger.error("Scaner Error: %s", _e, exc_info=_e)
         finally:
-            _s_num.pop()
+            with _cond:
+                _pending[0] -= 1
+                _cond.notify_all()
 
     assert url.exists(), f"目录不存在{url.as_uri()}"
 
-    s_sum = []
+    # 已提交、未完成的目录数量, 子目录在父目录完成之前提交, 归零即遍历结束
+    _pending = [0]
+    _cond = threading.Condition()
     with MyThreadPoolExecutor(5, thread_name_prefix=f"scaner_{url.as_uri()}") as pool:
-        pool.submit(_scaner, url, s_sum)
-        time.sleep(5)
-        while s_sum:
-            time.sleep(2)
-            logger.debug(
-                "Scaner Size: %s, %d, Threads[%s]",
-                url,
-                len(s_sum),
-                all_thread_name(),
-            )
+        _submit(url)
+        with _cond:
+            _cond.wait_for(lambda: _pending[0] == 0)
 
 
 def checker(sync_group: SyncGroup, _queue_worker: Queue) -> threading.Thread | None:
@@ -101,35 +125,49 @@ def checker(sync_group: SyncGroup, _queue_worker: Queue) -> threading.Thread | N
 
     logger.info("Checker: %s", sync_group.name)
 
-    for uri in sync_group.group:
-        login_alist(sync_config.get_server(uri.as_uri()))
-
-    _queue_scaner = Queue(30)
-    _scaner_pool = MyThreadPoolExecutor(5, "scaner_")
-
-    _ct = get_checker(sync_group.type)(sync_group, _queue_scaner, _queue_worker).start()
-
-    _sign = ["copy"]
-    __ignore = _make_ignore(sync_group)
-    if sync_group.type in _sign:
-        logger.debug(f"Copy 只需要扫描 {sync_group.group[0].as_uri() = }")
-        scaner(sync_group.group[0], _queue_scaner, __ignore)
-    else:
-        for uri in sync_group.group:
-            scaner(uri, _queue_scaner, __ignore)
-
-    return _ct
-
-
-def main():
-    """"""
-    _queue_worker = Queue(30)
-    _tw = Workers().start(_queue_worker)
+    # 同时列出全部成员上的同一相对目录，按目录给出决策
+    return get_checker(sync_group.type)(
+        sync_group, Queue(30), _queue_worker
+    ).start_walker()
+
+
+def start_metrics() -> metrics.TextfileWriter | None:
+    """按配置启动指标的 HTTP 服务与指标文件"""
+    _config = sync_config.metrics
+    if _config.port:
+        metrics.start_http_server(_config.port, _config.addr)
+    if _config.textfile is not None:
+        return metrics.TextfileWriter(_config.textfile, _config.interval).start()
+    return None
+
+
+def main(engine: str = "thread"):
+    """
+    :param engine: thread: 每个Worker占用一个线程; async: 全部Worker运行在一个事件循环中
+    """
+    _textfile = start_metrics()
+    # 按 scheduler 配置的策略排队, 有空闲时才取出
+    _queue_worker = sync_config.scheduler.create()
+    metrics.register_queue("worker", _queue_worker.qsize)
+    login_groups()
+    _workers = AsyncWorkers() if engine == "async" else Workers()
+    # 上次运行中未完成的Worker先于新的检查结果执行
+    _tr = _workers.recover(_queue_worker)
+    _tw = _workers.start(_queue_worker)
 
     for sync_group in sync_config.sync_groups:
-        checker(sync_group, _queue_worker)
-
+        _ct = checker(sync_group, _queue_worker)
+        if _ct is not None:
+            _ct.join()
+    if _tr is not None:
+        _tr.join()
+
+    # 全部 Checker 已结束, Workers 在队列取空并执行完成后立即退出
+    if sync_config.daemon is False:
+        _queue_worker.close()
     _tw.join()
+    if _textfile is not None:
+        _textfile.stop()
 
 
 def main_check():
@@ -141,24 +179,37 @@ def main_check():
                 worker = _queue_worker.get()
                 if worker is None:
                     break
+                if worker.delete_names is not None:
+                    _dir = posixpath.normpath(worker.relative_path)
+                    _target = worker.target_path.as_uri()
+                    if _dir != ".":
+                        _target = _target.removesuffix(_dir)
+                    for name in worker.delete_names:
+                        rest[worker.group_name][
+                            posixpath.normpath(posixpath.join(_dir, name))
+                        ] = (worker.type, "", _target, "")
+                    continue
                 rest[worker.group_name][worker.relative_path] = (
                     worker.type,
                     worker.source_path.as_uri().replace(worker.relative_path, ""),
                     worker.target_path.as_uri().replace(worker.relative_path, ""),
                     beautify_size(worker.file_size),
                 )
-                total_size += worker.file_size
+                total_size += worker.file_size or 0
             except Exception as e:
                 logger.error(f"Main Checker Error: {e}", exc_info=e)
 
     sync_config.daemon = False
+    login_groups()
     queue_worker = Queue()
+    metrics.register_queue("worker", queue_worker.qsize)
     rest = collections.defaultdict(dict)
     _tc = threading.Thread(target=_checker, args=(queue_worker,))
     _tc.start()
     for sync_group in sync_config.sync_groups:
         cc = checker(sync_group, queue_worker)
-        cc.join()
+        if cc is not None:
+            cc.join()
     queue_worker.put(None)
     _tc.join()
 
@@ -182,7 +233,6 @@ def main_check():
         table.add_row(end_section=True)
 
     console = Console(record=True, width=180)
-    time.sleep(2)
     console.print(table)
     console.save_html("sync_info.html", clear=False)
     console.save_svg("sync_info.svg")
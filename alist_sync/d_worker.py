@@ -1,27 +1,59 @@
+import asyncio
 import atexit
+import contextlib
 import datetime
+import functools
 import logging
 import threading
 import time
 import traceback
+from concurrent.futures import Future
+from functools import cached_property
 from pathlib import Path
-from queue import Queue, Empty
-from typing import Literal, Any, Type
+from typing import Literal, Any, Type, ClassVar
 
-from pydantic import BaseModel, computed_field, Field
+from pydantic import BaseModel, computed_field, Field, PrivateAttr
 from pymongo.collection import Collection
-from httpx import Client, TimeoutException, Timeout
+from httpx import AsyncClient, TimeoutException, Timeout
+from alist_sdk import AlistError, Item
 from alist_sdk.path_lib import AbsAlistPathType, AlistPath
 
 from alist_sync.config import create_config
-from alist_sync.common import sha1, prefix_in_threads, transfer_speed
-from alist_sync.err import WorkerError, RetryError
+from alist_sync.downloader import (
+    stream_copy,
+    download_file,
+    adownload_file,
+    iter_file,
+    aiter_file,
+    STREAM_CHUNK_SIZE,
+)
+from alist_sync.alist_client import (
+    wait_copy_task,
+    async_wait_copy_task,
+    copy_task_ids,
+    existing_copy_tasks,
+    async_existing_copy_tasks,
+    create_async_client,
+    AlistClient,
+)
+from alist_sync.common import (
+    sha1,
+    transfer_speed,
+    hash_info_dict,
+    hash_match,
+    ContentHash,
+)
+from alist_sync.err import WorkerError, RetryError, HashMismatch
+from alist_sync import metrics, profiler
+from alist_sync.rate_limit import Throttle
+from alist_sync.http_pool import AsyncPoolTransport
+from alist_sync.scheduler import WorkerScheduler
 from alist_sync.thread_pool import MyThreadPoolExecutor
 from alist_sync.version import __version__
 
 sync_config = create_config()
 
-WorkerType = ("delete", "copy")
+WorkerType = ("delete", "copy", "move")
 
 # noinspection PyTypeHints,PyCompatibility
 WorkerTypeModify = Literal[*WorkerType]
@@ -33,6 +65,7 @@ WorkerStatus = (
     "downloaded",
     "uploaded",
     "copied",
+    "moved",
     "done",
     "failed",
 )
@@ -41,9 +74,8 @@ WorkerStatusModify = Literal[*WorkerStatus]
 
 logger = logging.getLogger("alist-sync.worker")
 
-downloader_client = Client(
-    headers={"User-Agent": sync_config.ua or f"alist-sync/{__version__}"}
-)
+# 下载使用源服务器的 download_client, 与扫描、检查共用该服务器的连接池
+download_headers = {"User-Agent": sync_config.ua or f"alist-sync/{__version__}"}
 
 
 # noinspection PyTypeHints
@@ -51,21 +83,37 @@ class Worker(BaseModel):
     owner: str = sync_config.name
     group_name: str = None
 
-    created_at: datetime.datetime = datetime.datetime.now()
+    created_at: datetime.datetime = Field(default_factory=datetime.datetime.now)
     done_at: datetime.datetime | None = None
     type: WorkerTypeModify
     need_backup: bool
     backup_dir: AbsAlistPathType | None = None
+    transfer_mode: Literal["file", "stream"] = "file"
+    # 断点续传: {"size": 源文件大小, "modified": 源文件修改时间, "segments": [[start, end, done]]}
+    download_progress: dict | None = None
 
     relative_path: str | None = None
     source_path: AbsAlistPathType | None = None
+    # 源文件的大小与修改时间, 由 Checker 从目录列表中带入, 序列化时不再查询
+    file_size: int | None = None
+    source_modified: datetime.datetime | None = None
+    # 源文件的 hash_info {算法: 散列}, verify_hash 时用于校验传输的内容与目标文件
+    source_hash: dict[str, str] | None = None
+    verify_hash: bool = False
     target_path: AbsAlistPathType  # 永远只操作Target文件，删除也是作为Target
+    # 批量删除: target_path 为目录, 删除其中的这些名称
+    delete_names: list[str] | None = None
+    # 移动: 目标服务器上与源文件相同的已有文件, 移动到 target_path, 失败时改为复制
+    move_from: AbsAlistPathType | None = None
     status: WorkerStatusModify = "init"
     error_info: str | None = None
 
     # 私有属性
     workers: "Workers | None" = Field(None, exclude=True)
     collection: Collection | None = Field(None, exclude=True)
+    _progress_lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _progress_saved: float = PrivateAttr(default=0)
+    _started_at: datetime.datetime | None = PrivateAttr(default=None)
 
     model_config = {
         "arbitrary_types_allowed": True,
@@ -81,27 +129,54 @@ class Worker(BaseModel):
     def __repr__(self):
         return f"<Worker {self.type}: {self.source_path} -> {self.target_path}>"
 
-    @computed_field()
-    @property
-    def file_size(self) -> int | None:
-        if self.source_path is None:
-            return None
-        return self.source_path.stat().size
+    def source_stat(self):
+        """源文件的大小与修改时间, Checker 没有带入时查询一次"""
+        if self.file_size is None or self.source_modified is None:
+            with profiler.stage("stat"):
+                _stat = self.source_path.raw_stat()
+            self.file_size, self.source_modified = _stat.size, _stat.modified
+            self.source_hash = hash_info_dict(_stat.hash_info)
+        return self.file_size, self.source_modified
 
+    # id 与 tmp_file 由创建后不再变化的字段计算, 只计算一次
     @computed_field(return_type=str, alias="_id")
-    @property
+    @cached_property
     def id(self) -> str:
-        return sha1(f"{self.type}{self.source_path}{self.created_at}")
+        return sha1(f"{self.type}{self.source_path}{self.target_path}{self.created_at}")
 
     @property
     def short_id(self) -> str:
         return self.id[:8]
 
-    @computed_field()
     @property
+    def target_dir(self) -> AlistPath:
+        """Worker会修改的目录"""
+        if self.delete_names is not None:
+            return self.target_path
+        return self.target_path.parent
+
+    @property
+    def target_paths(self) -> list[AlistPath]:
+        """Worker会修改的全部文件"""
+        if self.delete_names is not None:
+            return [self.target_path.joinpath(n) for n in self.delete_names]
+        return [self.target_path]
+
+    @property
+    def same_server(self) -> bool:
+        """源文件与目标文件在同一个AList服务器上"""
+        return sync_config.get_server(
+            self.source_path.as_uri()
+        ) == sync_config.get_server(self.target_path.as_uri())
+
+    @computed_field()
+    @cached_property
     def tmp_file(self) -> Path:
-        return sync_config.cache_dir.joinpath(f"download_tmp_{sha1(self.source_path)}")
+        return sync_config.cache_dir.joinpath(
+            f"download_tmp_{sha1(f'{self.source_path}{self.target_path}')}"
+        )
 
+    @profiler.timed("persist")
     def update(self, **field: Any):
         if (status := field.get("status", "init")) not in WorkerStatus:
             raise ValueError(f"Unknown Status: {status}, allow: {WorkerStatus}.")
@@ -113,31 +188,84 @@ class Worker(BaseModel):
         if self.status in ["done", "failed"]:
             logger.info(f"Worker[{self.short_id}] is {self.status}.")
             self.done_at = datetime.datetime.now()
+            metrics.worker_status(self.id, self.group_name, None)
+            metrics.record_file(self.group_name, self.type, self.status)
             sync_config.handle.create_log(self)
-            if self.status == "done":
+            if self.status == "done" and self.type in ("copy", "move"):
+                self.record_state()
+                _start = self._started_at or self.created_at
                 logger.info(
                     f"Worker[{self.short_id}] "
                     f"{self.source_path} -> {self.target_path} "
                     f"平均传输速度: "
-                    f"{transfer_speed(self.file_size, self.done_at, self.created_at)}"
+                    f"{transfer_speed(self.file_size, _start, self.done_at)}"
                 )
             self.tmp_file.unlink(missing_ok=True)
+            sync_config.dir_cache.invalidate(self.target_dir)
+            if self.workers is not None:
+                self.workers.release_lock(self.target_path)
             return sync_config.handle.delete_worker(self.id)
 
+        metrics.worker_status(self.id, self.group_name, self.status)
         return sync_config.handle.update_worker(self, *field.keys())
 
+    def _record_transfer(self, *directions: str):
+        """传输完成, 计入传输指标: download 计入源服务器, 其他计入目标服务器"""
+        for direction in directions:
+            _path = self.source_path if direction == "download" else self.target_path
+            metrics.record_transfer(
+                self.group_name,
+                sync_config.get_server(_path.as_uri()).base_url,
+                direction,
+                self.file_size,
+            )
+
+    def record_state(self):
+        """记录本次复制的源文件的修改时间与大小, sync-incr 据此跳过未变化的文件"""
+        _group = sync_config.get_sync_group(self.group_name)
+        if _group is None or _group.type != "sync-incr":
+            return
+        _size, _modified = self.source_stat()
+        sync_config.handle.update_file_item(
+            self.target_path,
+            Item(
+                name=self.source_path.name,
+                size=_size,
+                is_dir=False,
+                modified=_modified,
+                created=None,
+                sign="",
+                thumb="",
+                type=0,
+                hash_info=self.source_hash,
+            ),
+        )
+
+    @profiler.timed("backup")
     def backup(self):
         """备份"""
         if self.backup_dir is None:
             raise ValueError("Need Backup, But no Dir.")
-        _backup_file = self.target_path
+        self.backup_dir.mkdir(parents=True, exist_ok=True)
+        for _backup_file in self.target_paths:
+            self._backup_one(_backup_file)
+
+        self.update(status="back-upped")
+        logger.info(f"Worker[{self.short_id}] Backup Success.")
+
+    def _backup_one(self, _backup_file: AlistPath):
+        try:
+            _old_stat = _backup_file.re_stat()
+        except FileNotFoundError:
+            logger.debug(f"Worker[{self.short_id}] 无需备份: {_backup_file}")
+            return
         _target_name = (
             f"{sha1(_backup_file.as_posix())}_"
-            f"{int(_backup_file.stat().modified.timestamp())}.history"
+            f"{int(_old_stat.modified.timestamp())}.history"
         )
         _backup_target = self.backup_dir.joinpath(_target_name)
         _backup_target_json = self.backup_dir.joinpath(_target_name + ".json")
-        _old_info = _backup_file.stat().model_dump_json()
+        _old_info = _old_stat.model_dump_json()
 
         assert (
             not _backup_target.exists() and not _backup_target_json.exists()
@@ -148,9 +276,6 @@ class Worker(BaseModel):
         _backup_target_json.write_text(_old_info)
         assert _backup_target_json.re_stat() is not None
 
-        self.update(status="back-upped")
-        logger.info(f"Worker[{self.short_id}] Backup Success.")
-
     def __retry(
         self,
         retry: int,
@@ -159,10 +284,11 @@ class Worker(BaseModel):
         *args,
         **kwargs,
     ):
-        while retry > 0:
+        while True:
             try:
                 return func(*args, **kwargs)
             except excepts as _e:
+                retry -= 1
                 if retry <= 0:
                     logger.error(
                         f"Worker[{self.short_id}] Retry Error [{func.__name__}]: "
@@ -173,59 +299,250 @@ class Worker(BaseModel):
                     f"Worker[{self.short_id}] {retry = } [{func.__name__}]: "
                     f"{type(_e)} - {_e}"
                 )
-                retry -= 1
-                continue
 
-    def downloader(self):
-        """HTTP多线程下载"""
-        # download
-        with self.tmp_file.open("wb") as _tmp:
-            with downloader_client.stream(
-                "GET",
-                self.source_path.get_download_uri(),
-                follow_redirects=True,
-            ) as _res:
-                logger.debug(
-                    f"Worker[{self.short_id}] Downloading from {self.source_path}"
+    progress_interval: ClassVar[int] = 5
+
+    def _save_progress(self, segments: list[list[int]], force=False):
+        """保存下载进度，最多每 progress_interval 秒写入一次"""
+        with self._progress_lock:
+            self.download_progress["segments"] = segments
+            if (
+                not force
+                and time.time() - self._progress_saved < self.progress_interval
+            ):
+                return
+            self._progress_saved = time.time()
+            self.update(download_progress=self.download_progress)
+
+    async def _async_save_progress(self, segments: list[list[int]], force=False):
+        """_save_progress 的异步版本, 数据库写入放到线程中执行"""
+        self.download_progress["segments"] = segments
+        if not force and time.time() - self._progress_saved < self.progress_interval:
+            return
+        self._progress_saved = time.time()
+        await self.async_update(download_progress=self.download_progress)
+
+    def _load_progress(self) -> dict | None:
+        """接管上次运行中未完成的同一复制留下的下载进度"""
+        if self.download_progress is not None or not self.tmp_file.exists():
+            return self.download_progress
+        for _w in sync_config.handle.get_workers({"tmp_file": str(self.tmp_file)}):
+            if (
+                _w.get("id") != self.id
+                and str(_w.get("tmp_file")) == str(self.tmp_file)
+                and _w.get("download_progress")
+            ):
+                logger.info(
+                    f"Worker[{self.short_id}] 接管 Worker[{_w['id'][:8]}] 的下载进度"
                 )
-                for i in _res.iter_bytes(chunk_size=1024 * 1024):
-                    _tmp.write(i)
+                sync_config.handle.delete_worker(_w["id"])
+                return _w["download_progress"]
+        return None
+
+    def _prepare_download(self, _stat):
+        """载入可以继续的下载进度，源文件已变化时重新下载"""
+        _progress = self._load_progress()
+        if _progress is not None and (
+            _progress.get("size") != _stat.size
+            or _progress.get("modified") != _stat.modified.timestamp()
+        ):
+            logger.info(f"Worker[{self.short_id}] 源文件已变化, 重新下载")
+            _progress = None
+        self.file_size, self.source_modified = _stat.size, _stat.modified
+        self.source_hash = hash_info_dict(_stat.hash_info)
+        self.download_progress = {
+            "size": _stat.size,
+            "modified": _stat.modified.timestamp(),
+            "segments": _progress["segments"] if _progress else None,
+        }
+
+    def _throttle(self, *paths: AlistPath) -> Throttle:
+        """传输限速: 全局、同步组与路径所在服务器的带宽上限"""
+        _group = sync_config.get_sync_group(self.group_name)
+        return Throttle(
+            sync_config.bandwidth,
+            _group.bandwidth if _group is not None else None,
+            *(sync_config.get_server(p.as_uri()).bandwidth for p in paths),
+        )
+
+    @profiler.timed("download")
+    def downloader(self):
+        """HTTP多线程下载, 按源服务器的配置分段, 中断后从已下载的位置继续"""
+        _server = sync_config.get_server(self.source_path.as_uri())
+        _stat = self.source_path.raw_stat()
+        self._prepare_download(_stat)
+
+        logger.debug(f"Worker[{self.short_id}] Downloading from {self.source_path}")
+        try:
+            self.download_progress["segments"] = download_file(
+                _server.download_client,
+                _stat.raw_url,
+                self.tmp_file,
+                _stat.size,
+                segments=_server.download_segments,
+                min_segment_size=_server.min_segment_size,
+                progress=self.download_progress["segments"],
+                on_progress=self._save_progress,
+                headers=download_headers,
+                throttle=self._throttle(self.source_path),
+            )
+        finally:
+            if self.download_progress["segments"] is not None:
+                self._save_progress(self.download_progress["segments"], force=True)
         assert (
-            self.tmp_file.exists()
-            and self.tmp_file.stat().st_size == self.source_path.stat().size
+            self.tmp_file.exists() and self.tmp_file.stat().st_size == _stat.size
         ), "下载后文件大小不一致"
+        self._record_transfer("download")
         self.update(status="downloaded")
 
-    def uploader(self):
+    def _content_hash(self) -> ContentHash | None:
+        """需要校验时, 按源文件的散列在传输中计算; 驱动没有提供散列时不校验"""
+        if not self.verify_hash:
+            return None
+        return ContentHash.create(self.source_hash)
+
+    def _verify_content(self, hasher: ContentHash | None):
+        """传输的内容与源文件不一致时删除目标文件, 避免下次检查时因大小相同而跳过"""
+        if hasher is None or hasher.verify():
+            return
+        logger.error(f"Worker[{self.short_id}] 内容校验失败: {hasher}")
+        self.target_path.unlink(missing_ok=True)
+        raise HashMismatch(f"内容校验失败 [{hasher.name}]: {self.target_path}")
+
+    def _upload_headers(self) -> dict:
         import urllib.parse
 
+        return {
+            "As-Task": "false",
+            "Content-Type": "application/octet-stream",
+            "Last-Modified": str(int(self.source_stat()[1].timestamp() * 1000)),
+            "File-Path": urllib.parse.quote(str(self.target_path.as_posix())),
+        }
+
+    @profiler.timed("upload")
+    def uploader(self):
         # upload
-        with self.tmp_file.open("rb") as fs:
-            res = self.target_path.client.verify_request(
-                "PUT",
-                "/api/fs/put",
-                headers={
-                    "As-Task": "false",
-                    "Content-Type": "application/octet-stream",
-                    "Last-Modified": str(
-                        int(self.source_path.stat().modified.timestamp() * 1000)
-                    ),
-                    "File-Path": urllib.parse.quote(str(self.target_path.as_posix())),
-                },
-                content=fs,
-                timeout=Timeout(300, read=300, write=300, connect=300),
-            )
+        headers = self._upload_headers()
+        headers["Content-Length"] = str(self.tmp_file.stat().st_size)
+        hasher = self._content_hash()
+        res = self.target_path.client.verify_request(
+            "PUT",
+            "/api/fs/put",
+            headers=headers,
+            content=iter_file(
+                self.tmp_file, throttle=self._throttle(self.target_path), hasher=hasher
+            ),
+            timeout=Timeout(300, read=300, write=300, connect=300),
+        )
 
         assert res.code == 200
+        self._verify_content(hasher)
         logger.info(
             f"Worker[{self.short_id}] Upload File "
             f"[{self.target_path}] [{res.code}]{res.message}."
         )
+        self._record_transfer("upload")
+        self.update(status="uploaded")
+
+    @profiler.timed("stream")
+    def streamer(self):
+        """边下载边上传，不经过临时文件"""
+        _size, _ = self.source_stat()
+        hasher = self._content_hash()
+        res, total = stream_copy(
+            sync_config.get_server(self.source_path.as_uri()).download_client,
+            self.source_path.raw_stat().raw_url,
+            self.target_path,
+            headers=self._upload_headers() | {"Content-Length": str(_size)},
+            timeout=Timeout(300, read=300, write=300, connect=300),
+            download_headers=download_headers,
+            throttle=self._throttle(self.source_path, self.target_path),
+            hasher=hasher,
+        )
+        assert res.code == 200, f"流式上传失败: [{res.code}]{res.message}"
+        assert total == _size, "流式复制后文件大小不一致"
+        self._verify_content(hasher)
+        logger.info(
+            f"Worker[{self.short_id}] Stream File "
+            f"[{self.target_path}] [{res.code}]{res.message}."
+        )
+        self._record_transfer("download", "upload")
+        self.update(status="uploaded")
+
+    def _target_exists(self) -> bool:
+        """查询一次目标文件是否存在
+
+        不使用 AlistPath.exists: 文件不存在时它会等待后重试, 每个新文件等待 1 秒以上
+        """
+        res = self.target_path.client.get_item_info(self.target_path.as_posix())
+        if res.code == 200:
+            return True
+        if res.code == 500 and "not found" in res.message:
+            return False
+        raise AlistError(
+            f"查询文件失败: {self.target_path.as_uri()} [{res.code}]{res.message}"
+        )
+
+    def _remove_target(self):
+        res = self.target_path.client.remove(
+            self.target_path.parent.as_posix(), [self.target_path.name]
+        )
+        assert res.code == 200, f"删除失败: [{res.code}]{res.message}"
+
+    @profiler.timed("prepare")
+    def _prepare_target(self):
+        """删除已存在的目标文件, 不存在时创建目标目录 (已存在的目录不会报错)"""
+        if self._target_exists():
+            return self._remove_target()
+        res = self.target_path.client.mkdir(self.target_path.parent.as_posix())
+        assert res.code == 200, f"创建目录失败: [{res.code}]{res.message}"
+
+    @profiler.timed("copy")
+    def server_copier(self):
+        """源与目标在同一AList服务器上, 使用 /api/fs/copy 由服务器复制, 不经过本机"""
+        self._prepare_target()
+        _client = self.source_path.client
+        _src, _dst = self.source_path.as_posix(), self.target_path.parent.as_posix()
+        _existing = existing_copy_tasks(_client, _src, _dst)
+        res = _client.copy(
+            self.source_path.parent.as_posix(), _dst, [self.source_path.name]
+        )
+        assert res.code == 200, f"服务器复制失败: [{res.code}]{res.message}"
+        status = wait_copy_task(
+            _client, _src, _dst, ignore=_existing, task_ids=copy_task_ids(res.data)
+        )
+        assert status != "failed", "服务器复制任务失败"
+        logger.info(
+            f"Worker[{self.short_id}] Server Copy File [{self.target_path}] {status}."
+        )
+        self._record_transfer("copy")
         self.update(status="uploaded")
 
     def copy_type(self):
-        """复制任务"""
+        """复制任务, 同一服务器上由服务器复制, 跨服务器时下载后上传"""
         logger.debug(f"Worker[{self.short_id}] Start Copping")
+        if self.same_server and self.status in ["init", "back-upped"]:
+            self.server_copier()
+            return self.update(status="copied")
+
+        if self.workers is None:
+            return self._transfer()
+        with self.workers.limit(self.source_path, self.target_path):
+            return self._transfer()
+
+    def _transfer(self):
+        """跨服务器传输, 占用源与目标服务器的并发名额"""
+        if self.transfer_mode == "stream" and self.status in ["init", "back-upped"]:
+            self._prepare_target()
+            try:
+                self.streamer()
+            except Exception as _e:
+                # 流式复制无法从中断处重试，重试时使用临时文件
+                logger.warning(
+                    f"Worker[{self.short_id}] 流式复制失败, 使用临时文件重试: "
+                    f"{type(_e)} - {_e}"
+                )
+
         if self.status not in ["downloaded", "uploaded"]:
             self.__retry(
                 3,
@@ -234,8 +551,7 @@ class Worker(BaseModel):
             )
 
         if self.status != "uploaded":
-            self.target_path.unlink(missing_ok=True)
-            self.target_path.parent.mkdir(parents=True, exist_ok=True)
+            self._prepare_target()
             self.__retry(
                 3,
                 (TimeoutException, AssertionError),
@@ -244,19 +560,86 @@ class Worker(BaseModel):
 
         return self.update(status="copied")
 
+    @profiler.timed("move")
+    def move_type(self) -> bool:
+        """在目标服务器上重命名、移动已有的相同文件, 代替下载与上传
+
+        先在原目录中重命名, 再移动到目标目录, 新名称已被占用时放弃;
+        失败时返回 False, 由后续的复制完成
+        """
+        _from, _to = self.move_from, self.target_path
+        try:
+            if _from.name != _to.name:
+                assert _to.name not in sync_config.dir_cache.fetch(
+                    _from.parent
+                ), f"原目录中已存在 {_to.name}"
+                res = _to.client.rename(_to.name, _from.as_posix())
+                assert res.code == 200, f"重命名失败: [{res.code}]{res.message}"
+                _from = _from.with_name(_to.name)
+            if _from.parent != _to.parent:
+                _to.parent.mkdir(parents=True, exist_ok=True)
+                assert _to.name not in sync_config.dir_cache.fetch(
+                    _to.parent
+                ), f"目标目录中已存在 {_to.name}"
+                res = _to.client.move(
+                    _from.parent.as_posix(), _to.parent.as_posix(), [_to.name]
+                )
+                assert res.code == 200, f"移动失败: [{res.code}]{res.message}"
+        except Exception as _e:
+            logger.warning(
+                f"Worker[{self.short_id}] 移动失败, 改为复制: {type(_e)} - {_e}"
+            )
+            return False
+        finally:
+            sync_config.dir_cache.invalidate(self.move_from.parent)
+        logger.info(f"Worker[{self.short_id}] Move File [{self.move_from}] -> [{_to}]")
+        self.update(status="moved")
+        return True
+
+    @profiler.timed("delete")
     def delete_type(self):
-        """删除任务"""
-        self.target_path.unlink(missing_ok=True)
-        assert not self.target_path.exists()
+        """删除任务, 批量删除时一次请求删除目录中的全部名称"""
+        if self.delete_names is None:
+            if self._target_exists():
+                self._remove_target()
+            assert not self._target_exists()
+        else:
+            _exists = sync_config.dir_cache.fetch(self.target_path)
+            _names = [n for n in self.delete_names if n in _exists]
+            if _names:
+                res = self.target_path.client.remove(
+                    self.target_path.as_posix(), _names
+                )
+                assert res.code == 200, f"批量删除失败: [{res.code}]{res.message}"
+            logger.info(
+                f"Worker[{self.short_id}] 删除 {self.target_path} 中的 {len(_names)} 项."
+            )
         self.update(status="deleted")
 
+    def recheck_delete(self) -> bool:
+        """一次列出目录, 确认批量删除的名称都已经不存在"""
+        _exists = sync_config.dir_cache.fetch(self.target_path)
+        return not any(n in _exists for n in self.delete_names)
+
     def recheck_copy(self, retry=5, re_time=2):
-        """再次检查当前Worker的结果是否符合预期。"""
+        """再次检查当前Worker的结果是否符合预期。
+
+        verify_hash 时目标文件的 hash_info 与源文件的散列不一致, 删除目标文件
+        """
         try:
-            return (
-                self.target_path.re_stat(retry=retry, timeout=re_time).size
-                == self.source_path.re_stat().size
-            )
+            _target = self.target_path.re_stat(retry=retry, timeout=re_time)
+            # 源文件的大小由 Checker 带入, 下载时以当前的源文件更新
+            if _target.size != self.source_stat()[0]:
+                return False
+            _target_hash = hash_info_dict(_target.hash_info)
+            if self.verify_hash and hash_match(self.source_hash, _target_hash) is False:
+                logger.error(
+                    f"Worker[{self.short_id}] Recheck Error: 目标文件的散列不一致 "
+                    f"{_target_hash} != {self.source_hash}"
+                )
+                self.target_path.unlink(missing_ok=True)
+                return False
+            return True
         except FileNotFoundError:
             if retry > 0:
                 return self.recheck_copy(retry=retry - 1, re_time=re_time)
@@ -265,13 +648,15 @@ class Worker(BaseModel):
             )
             return False
 
+    @profiler.timed("recheck")
     def recheck(self) -> bool:
         """再次检查当前Worker的结果是否符合预期。"""
-        if self.type == "copy":
+        if self.type in ("copy", "move"):
             return self.recheck_copy(retry=3, re_time=3)
+        elif self.type == "delete" and self.delete_names is not None:
+            return self.recheck_delete()
         elif self.type == "delete":
-            self.target_path.re_stat(retry=5, timeout=2)
-            return not self.target_path.exists()
+            return not self._target_exists()
         else:
             raise ValueError(f"Unknown Worker Type {self.type}.")
 
@@ -279,6 +664,7 @@ class Worker(BaseModel):
         """启动Worker"""
         if is_retry is False:
             logger.info(f"worker[{self.short_id}] 已经开始工作.")
+            self._started_at = datetime.datetime.now()
             self.update()
 
         try:
@@ -288,7 +674,10 @@ class Worker(BaseModel):
             if self.need_backup and self.status in ["init"]:
                 self.backup()
 
-            if self.type == "copy" and self.status in [
+            if self.type == "move" and self.status in ["init", "back-upped"]:
+                self.move_type()
+
+            if self.type in ("copy", "move") and self.status in [
                 "init",
                 "back-upped",
                 "downloaded",
@@ -315,7 +704,210 @@ class Worker(BaseModel):
         except Exception as _e:
             return self.__error_exec(_e)
 
+    # 异步引擎: 与 run 的状态流转相同, 传输使用 AsyncWorkers 中的异步客户端,
+    # 备份、删除、检查等短小的元数据操作放到线程中执行
+
+    async def async_update(self, **field: Any):
+        """update 会写入数据库, 放到线程中执行"""
+        return await asyncio.to_thread(self.update, **field)
+
+    async def __async_retry(self, retry: int, func, *args):
+        while True:
+            try:
+                return await func(*args)
+            except (TimeoutException, AssertionError) as _e:
+                retry -= 1
+                if retry <= 0:
+                    logger.error(
+                        f"Worker[{self.short_id}] Retry Error [{func.__name__}]: "
+                        f"{type(_e)} - {_e}"
+                    )
+                    raise RetryError(f"Retry {func.__name__} Error.") from _e
+                logger.warning(
+                    f"Worker[{self.short_id}] {retry = } [{func.__name__}]: "
+                    f"{type(_e)} - {_e}"
+                )
+
+    @profiler.timed("download")
+    async def async_downloader(self):
+        """downloader 的异步版本"""
+        _server = sync_config.get_server(self.source_path.as_uri())
+        _stat = await asyncio.to_thread(self.source_path.raw_stat)
+        self._prepare_download(_stat)
+        try:
+            self.download_progress["segments"] = await adownload_file(
+                self.workers.download_client(self.source_path),
+                _stat.raw_url,
+                self.tmp_file,
+                _stat.size,
+                segments=_server.download_segments,
+                min_segment_size=_server.min_segment_size,
+                progress=self.download_progress["segments"],
+                on_progress=self._async_save_progress,
+                headers=download_headers,
+                throttle=self._throttle(self.source_path),
+            )
+        finally:
+            if self.download_progress["segments"] is not None:
+                await self._async_save_progress(
+                    self.download_progress["segments"], force=True
+                )
+        assert (
+            self.tmp_file.exists() and self.tmp_file.stat().st_size == _stat.size
+        ), "下载后文件大小不一致"
+        self._record_transfer("download")
+        await self.async_update(status="downloaded")
+
+    async def _async_put(self, content, headers: dict):
+        res = await self.workers.api_client(self.target_path).verify_request(
+            "PUT",
+            "/api/fs/put",
+            headers=headers,
+            content=content,
+            timeout=Timeout(300, read=300, write=300, connect=300),
+        )
+        assert res.code == 200, f"上传失败: [{res.code}]{res.message}"
+        return res
+
+    @profiler.timed("upload")
+    async def async_uploader(self):
+        """uploader 的异步版本"""
+        headers = await asyncio.to_thread(self._upload_headers)
+        hasher = self._content_hash()
+        res = await self._async_put(
+            aiter_file(
+                self.tmp_file, throttle=self._throttle(self.target_path), hasher=hasher
+            ),
+            headers | {"Content-Length": str(self.tmp_file.stat().st_size)},
+        )
+        await asyncio.to_thread(self._verify_content, hasher)
+        logger.info(
+            f"Worker[{self.short_id}] Upload File "
+            f"[{self.target_path}] [{res.code}]{res.message}."
+        )
+        self._record_transfer("upload")
+        await self.async_update(status="uploaded")
+
+    @profiler.timed("stream")
+    async def async_streamer(self):
+        """streamer 的异步版本, 下载的响应直接作为上传的请求体"""
+        headers = await asyncio.to_thread(self._upload_headers)
+        _url = (await asyncio.to_thread(self.source_path.raw_stat)).raw_url
+        _size, _ = await asyncio.to_thread(self.source_stat)
+        throttle = self._throttle(self.source_path, self.target_path)
+        hasher = self._content_hash()
+        total = 0
+
+        async with self.workers.download_client(self.source_path).stream(
+            "GET", _url, headers=download_headers, follow_redirects=True
+        ) as _res:
+            _res.raise_for_status()
+
+            async def _chunks():
+                nonlocal total
+                async for chunk in _res.aiter_bytes(STREAM_CHUNK_SIZE):
+                    if throttle:
+                        await throttle.async_wait(len(chunk))
+                    if hasher is not None:
+                        hasher.update(chunk)
+                    total += len(chunk)
+                    yield chunk
+
+            res = await self._async_put(
+                _chunks(), headers | {"Content-Length": str(_size)}
+            )
+        assert total == _size, "流式复制后文件大小不一致"
+        await asyncio.to_thread(self._verify_content, hasher)
+        logger.info(
+            f"Worker[{self.short_id}] Stream File "
+            f"[{self.target_path}] [{res.code}]{res.message}."
+        )
+        self._record_transfer("download", "upload")
+        await self.async_update(status="uploaded")
+
+    @profiler.timed("copy")
+    async def async_server_copier(self):
+        """server_copier 的异步版本"""
+        await asyncio.to_thread(self._prepare_target)
+        _client = self.workers.api_client(self.source_path)
+        _key = (self.source_path.as_posix(), self.target_path.parent.as_posix())
+        _existing = await async_existing_copy_tasks(_client, _key)
+        res = await _client.copy(
+            self.source_path.parent.as_posix(), _key[1], [self.source_path.name]
+        )
+        assert res.code == 200, f"服务器复制失败: [{res.code}]{res.message}"
+        status = await async_wait_copy_task(
+            _client, _key, ignore=_existing, task_ids=copy_task_ids(res.data)
+        )
+        assert status != "failed", "服务器复制任务失败"
+        logger.info(
+            f"Worker[{self.short_id}] Server Copy File [{self.target_path}] {status}."
+        )
+        self._record_transfer("copy")
+        await self.async_update(status="uploaded")
+
+    async def async_copy_type(self):
+        """copy_type 的异步版本, 跨服务器传输期间占用源与目标服务器的并发名额"""
+        if self.same_server and self.status in ["init", "back-upped"]:
+            await self.async_server_copier()
+            return await self.async_update(status="copied")
+
+        async with self.workers.limit(self.source_path, self.target_path):
+            if self.transfer_mode == "stream" and self.status in [
+                "init",
+                "back-upped",
+            ]:
+                await asyncio.to_thread(self._prepare_target)
+                try:
+                    await self.async_streamer()
+                except Exception as _e:
+                    logger.warning(
+                        f"Worker[{self.short_id}] 流式复制失败, 使用临时文件重试: "
+                        f"{type(_e)} - {_e}"
+                    )
+
+            if self.status not in ["downloaded", "uploaded"]:
+                await self.__async_retry(3, self.async_downloader)
+
+            if self.status != "uploaded":
+                await asyncio.to_thread(self._prepare_target)
+                await self.__async_retry(3, self.async_uploader)
+
+        return await self.async_update(status="copied")
+
+    async def async_run(self):
+        """在 AsyncWorkers 的事件循环中启动Worker"""
+        logger.info(f"worker[{self.short_id}] 已经开始工作.")
+        self._started_at = datetime.datetime.now()
+        await self.async_update()
+        try:
+            if self.status in ["done", "failed"]:
+                await self.async_update()
+                return
+            if self.need_backup and self.status in ["init"]:
+                await asyncio.to_thread(self.backup)
+
+            if self.type == "move" and self.status in ["init", "back-upped"]:
+                await asyncio.to_thread(self.move_type)
+
+            if self.type in ("copy", "move") and self.status in [
+                "init",
+                "back-upped",
+                "downloaded",
+                "uploaded",
+            ]:
+                await self.async_copy_type()
+
+            elif self.type == "delete" and self.status in ["init", "back-upped"]:
+                await asyncio.to_thread(self.delete_type)
+
+            assert await asyncio.to_thread(self.recheck)
+            await self.async_update(status="done")
+        except Exception as _e:
+            await asyncio.to_thread(self.__error_exec, _e)
+
     def __error_exec(self, _e: Exception):
+        metrics.record_error(self.group_name, _e)
         logger.error(
             f"Worker[{self.short_id}] 出现错误:: ({type(_e)}){_e}",
             exc_info=_e,
@@ -330,72 +922,166 @@ class Worker(BaseModel):
 
 
 class Workers:
-    def __init__(self):
+    def __init__(self, max_workers: int = 20):
         self.thread_pool = MyThreadPoolExecutor(
-            20,
+            max_workers,
             "worker_",
         )
+        # 空闲线程, 有空闲时才从队列中取出Worker, 排队的顺序由队列决定
+        self._idle = threading.Semaphore(max_workers)
 
         self.lockers: set[AlistPath] = set()
+        # 从上次运行中接管的Worker id 与它们的Target
+        self._recovered: set[str] = set()
+        self._recovered_targets: set[AlistPath] = set()
+        self._limits: dict[str, threading.Semaphore] = {}
+        self._limits_lock = threading.Lock()
 
         atexit.register(self.__del__)
 
+    def _limit(self, server: str) -> threading.Semaphore:
+        with self._limits_lock:
+            if server not in self._limits:
+                self._limits[server] = threading.Semaphore(
+                    sync_config.get_server(server).max_connect
+                )
+            return self._limits[server]
+
+    @contextlib.contextmanager
+    def limit(self, *paths: AlistPath):
+        """占用路径所在服务器的并发名额, 按服务器排序获取, 避免死锁
+
+        每个传输最多在一个服务器上占用连接的同时等待另一个服务器的连接,
+        限制每个服务器上同时进行的传输不超过 max_connect, 连接池不会互相等待。
+        """
+        with contextlib.ExitStack() as stack:
+            for server in sorted(
+                {sync_config.get_server(p.as_uri()).base_url for p in paths}
+            ):
+                stack.enter_context(self._limit(server))
+            yield
+
+    @staticmethod
+    def _group_active(group_name: str | None) -> bool:
+        """同步组在本次运行中启用"""
+        _group = sync_config.get_sync_group(group_name)
+        return _group is not None and _group.enable is not False
+
     def __del__(self):
+        """清理临时文件
+
+        本次运行中未完成的Worker保留临时文件与进度，下次运行时继续下载;
+        本次运行的同步组中, 之前运行遗留、本次没有被接管的Worker视为放弃，一并清理。
+        没有启用的同步组的Worker留给之后启用它的运行。
+        """
+        _start = datetime.datetime.fromtimestamp(sync_config.start_time)
+        _keep = set()
+        try:
+            for _w in list(sync_config.handle.get_workers()):
+                if (
+                    _w.get("owner") != sync_config.name
+                    or not self._group_active(_w.get("group_name"))
+                    or _w["id"] in self._recovered
+                    or datetime.datetime.fromisoformat(str(_w["created_at"])) >= _start
+                ):
+                    _keep.add(str(_w.get("tmp_file")))
+                else:
+                    sync_config.handle.delete_worker(_w["id"])
+        except Exception as _e:
+            logger.warning(f"读取未完成的Worker失败, 保留全部临时文件: {_e}")
+            return
         for i in sync_config.cache_dir.iterdir():
-            if i.name.startswith("download_tmp_"):
+            if i.name.startswith("download_tmp_") and str(i) not in _keep:
                 i.unlink(missing_ok=True)
 
     def release_lock(self, *items: AlistPath):
         for p in items:
-            self.lockers.remove(p)
+            self.lockers.discard(p)
 
-    def add_worker(self, worker: Worker, is_loader=False):
-        if not is_loader and (
-            worker.source_path in self.lockers or worker.target_path in self.lockers
-        ):
-            logger.warning(f"Worker[{worker.id}]中有路径被锁定.")
-            return
+    def recover(self, queue: WorkerScheduler) -> threading.Thread | None:
+        """接管上次运行中未完成的Worker, 需要在 Checker 开始之前调用
+
+        这些Worker的Target在整个运行期间保留, Checker 为同一Target创建的Worker
+        不再执行, 即使接管的Worker已经完成 (否则会删除目标后重新传输);
+        Worker 在后台线程中以 urgent 放入队列, 排在新的检查结果之前,
+        从记录的状态继续执行 (例如已经下载完成的Worker直接上传)。
+        """
+        _workers = []
+        for _w in sync_config.handle.get_workers({"owner": sync_config.name}):
+            if not self._group_active(_w.get("group_name")):
+                continue
+            try:
+                worker = Worker(**_w)
+            except Exception as _e:
+                logger.warning(f"无法恢复Worker[{str(_w.get('id'))[:8]}]: {_e}")
+                continue
+            if worker.status in ["done", "failed"]:
+                continue
+            self.lockers.add(worker.target_path)
+            self._recovered.add(worker.id)
+            self._recovered_targets.add(worker.target_path)
+            _workers.append(worker)
+
+        if not _workers:
+            return None
+        logger.info(f"接管上次运行中未完成的Worker: {len(_workers)}")
+
+        def _put():
+            for _worker in _workers:
+                queue.put(_worker, urgent=True)
+
+        _t = threading.Thread(target=_put, name="workers_recover")
+        _t.start()
+        return _t
 
-        self.lockers.add(worker.source_path)
+    def _locked(self, worker: Worker, is_loader=False) -> bool:
+        """Worker 的Target被锁定时不执行, 否则锁定该Target"""
+        # 接管的Worker在恢复时已经锁定
+        if is_loader or worker.id in self._recovered:
+            self.lockers.add(worker.target_path)
+            return False
+        if worker.target_path in self._recovered_targets:
+            logger.info(f"Worker[{worker.id}]的Target由接管的Worker处理, 跳过.")
+            return True
+        # 只锁定Target, 同一个Source可以同时复制到多个Target
+        if worker.target_path in self.lockers:
+            logger.warning(f"Worker[{worker.id}]中有路径被锁定.")
+            return True
         self.lockers.add(worker.target_path)
+        return False
+
+    def add_worker(self, worker: Worker, is_loader=False) -> Future | None:
+        if self._locked(worker, is_loader):
+            return None
 
         worker.workers = self
-        self.thread_pool.submit_wait(worker.run)
+        future = self.thread_pool.submit(worker.run)
         logger.info(f"Worker[{worker.id}] added to ThreadPool.")
+        return future
 
-    def run(self, queue: Queue):
-        """"""
-        # self.lockers |= sync_config.handle.load_locker()
-        # for i in sync_config.handle.get_workers():
-        #     self.add_worker(Worker(**i), is_loader=True)
-        _started = False
+    def run(self, queue: WorkerScheduler):
+        """有空闲线程时从队列中取出Worker, 队列关闭并取空后等待全部Worker完成"""
         while True:
-            if (
-                queue.empty()
-                and sync_config.daemon is False
-                and not prefix_in_threads("checker_")
-                and time.time() - sync_config.start_time > sync_config.timeout
-            ):
-                logger.info(
-                    f"等待Worker执行完成, 排队中的数量: {self.thread_pool.work_qsize()}"
-                )
-                self.thread_pool.shutdown(wait=True, cancel_futures=False)
-                logger.info(f"循环线程退出 - {threading.current_thread().name}")
-                return
+            self._idle.acquire()
+            worker = queue.get()
+            if worker is None:
+                self._idle.release()
+                break
 
-            try:
-                _started = True
-                self.add_worker(queue.get(timeout=3))
-            except Empty:
-                if _started:
-                    continue
-                logger.info(
-                    f"Checkers: 空 Scaner 队列, 如果没有新的任务, "
-                    f"{sync_config.timeout - (time.time() - sync_config.start_time):d}"
-                    f"秒后退出"
-                )
+            future = self.add_worker(worker)
+            if future is None:
+                self._idle.release()
+                queue.done(worker)
+                continue
+            future.add_done_callback(
+                lambda _f, _w=worker: (self._idle.release(), queue.done(_w))
+            )
+
+        logger.info("等待Worker执行完成")
+        self.thread_pool.shutdown(wait=True, cancel_futures=False)
+        logger.info(f"循环线程退出 - {threading.current_thread().name}")
 
-    def start(self, queue: Queue) -> threading.Thread:
+    def start(self, queue: WorkerScheduler) -> threading.Thread:
         _t = threading.Thread(
             target=self.run,
             args=(queue,),
@@ -406,6 +1092,107 @@ class Workers:
         return _t
 
 
+class AsyncWorkers(Workers):
+    """异步引擎: 在一个事件循环中同时运行大量Worker
+
+    每个服务器同时进行的传输不超过 AlistServer.max_connect,
+    同时运行的Worker不超过 max_workers, 超出时不再从队列中读取。
+    """
+
+    def __init__(self, max_workers: int = 1000):
+        super().__init__(max_workers)
+        self.max_workers = max_workers
+        self._limits: dict[str, asyncio.Semaphore] = {}
+        self._transports: dict[str, AsyncPoolTransport] = {}
+        self._api_clients: dict[str, AlistClient] = {}
+        self._download_clients: dict[str, AsyncClient] = {}
+
+    @contextlib.asynccontextmanager
+    async def limit(self, *paths: AlistPath):
+        """占用路径所在服务器的并发名额, 按服务器排序获取, 避免死锁"""
+        async with contextlib.AsyncExitStack() as stack:
+            for server in sorted(
+                {sync_config.get_server(p.as_uri()).base_url for p in paths}
+            ):
+                if server not in self._limits:
+                    self._limits[server] = asyncio.Semaphore(
+                        sync_config.get_server(server).max_connect
+                    )
+                await stack.enter_async_context(self._limits[server])
+            yield
+
+    def _transport(self, server: str) -> AsyncPoolTransport:
+        """服务器的异步连接池, API 请求与下载共用"""
+        if server not in self._transports:
+            self._transports[server] = sync_config.get_server(server).async_transport()
+        return self._transports[server]
+
+    def api_client(self, path: AlistPath) -> AlistClient:
+        """路径所在服务器的 AlistClient, 每个服务器一个"""
+        server = sync_config.get_server(path.as_uri()).base_url
+        if server not in self._api_clients:
+            self._api_clients[server] = create_async_client(
+                path.client, self._transport(server)
+            )
+        return self._api_clients[server]
+
+    def download_client(self, path: AlistPath) -> AsyncClient:
+        """下载 raw_url 的客户端, 不带 AList 的 Token, 见 AlistServer.download_client"""
+        server = sync_config.get_server(path.as_uri()).base_url
+        if server not in self._download_clients:
+            self._download_clients[server] = sync_config.get_server(
+                server
+            ).async_download_client(self._transport(server))
+        return self._download_clients[server]
+
+    def add_worker(self, worker: Worker, is_loader=False) -> asyncio.Task | None:
+        if self._locked(worker, is_loader):
+            return None
+
+        worker.workers = self
+        logger.info(f"Worker[{worker.id}] added to EventLoop.")
+        return asyncio.create_task(worker.async_run(), name=f"worker_{worker.id}")
+
+    async def _run(self, queue: WorkerScheduler):
+        # 备份、删除、检查等元数据操作使用的线程
+        asyncio.get_running_loop().set_default_executor(
+            MyThreadPoolExecutor(32, thread_name_prefix="worker_meta_")
+        )
+        _running = asyncio.Semaphore(self.max_workers)
+        tasks: set[asyncio.Task] = set()
+
+        def _done(_task: asyncio.Task, _worker: Worker):
+            tasks.discard(_task)
+            _running.release()
+            queue.done(_worker)
+
+        while True:
+            await _running.acquire()
+            worker = await asyncio.to_thread(queue.get)
+            if worker is None:
+                _running.release()
+                break
+            task = self.add_worker(worker)
+            if task is None:
+                _running.release()
+                queue.done(worker)
+                continue
+            tasks.add(task)
+            task.add_done_callback(functools.partial(_done, _worker=worker))
+
+        logger.info(f"等待Worker执行完成, 运行中的数量: {len(tasks)}")
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for _client in self._api_clients.values():
+            await _client.aclose()
+        for _transport in self._transports.values():
+            await _transport.aclose()
+
+    def run(self, queue: WorkerScheduler):
+        """"""
+        asyncio.run(self._run(queue))
+        logger.info(f"循环线程退出 - {threading.current_thread().name}")
+
+
 if __name__ == "__main__":
     from alist_sdk import AlistPath, login_server
 
@@ -6,15 +6,22 @@
 @Date-Time  : 2024/2/27 22:15
 
 """
+
 import abc
+import atexit
 import datetime
 import json
 import logging
 import shelve
+import sqlite3
+import threading
+import time
 from pathlib import Path
 from typing import TYPE_CHECKING, Iterable
 
-from alist_sdk import AlistPath
+from alist_sdk import AlistPath, Item
+
+from alist_sync import profiler
 
 if TYPE_CHECKING:
     from alist_sync.d_worker import Worker
@@ -35,6 +42,19 @@ class HandleBase(metaclass=abc.ABCMeta):
         """删除Worker"""
         raise NotImplementedError
 
+    def bulk_update_workers(
+        self, updates: Iterable[tuple["Worker", tuple]], deletes: Iterable[str]
+    ):
+        """批量更新与删除Worker, 每个Worker最多出现一次
+
+        :param updates: (Worker, 更新的字段), 字段为空时写入整个Worker
+        :param deletes: 删除的Worker id
+        """
+        for worker, field in updates:
+            self.update_worker(worker, *field)
+        for worker_id in deletes:
+            self.delete_worker(worker_id)
+
     @abc.abstractmethod
     def get_worker(self, worker_id: str):
         """获取Worker"""
@@ -69,6 +89,17 @@ class HandleBase(metaclass=abc.ABCMeta):
         """获取FileItem"""
         raise NotImplementedError
 
+    def get_file_items(self, paths: Iterable["AlistPath"]) -> dict[str, "Item"]:
+        """批量获取FileItem, 返回 {path.as_uri(): Item}, 不存在的路径不返回"""
+        _items = {}
+        for path in paths:
+            item = self.get_file_item(path)
+            if item is not None:
+                _items[path.as_uri()] = (
+                    Item.model_validate(item) if isinstance(item, dict) else item
+                )
+        return _items
+
     @abc.abstractmethod
     def create_log(self, worker: "Worker"):
         """"""
@@ -103,6 +134,31 @@ class MongoHandle(HandleBase):
         logger.debug("删除Worker: %s", worker_id)
         return self._workers.delete_one({"_id": worker_id})
 
+    def bulk_update_workers(
+        self, updates: Iterable[tuple["Worker", tuple]], deletes: Iterable[str]
+    ):
+        from pymongo import UpdateOne, DeleteOne
+
+        requests = [
+            UpdateOne(
+                {"_id": worker.id},
+                {
+                    "$set": (
+                        worker.model_dump(mode="json")
+                        if field == ()
+                        else {k: worker.__dict__.get(k) for k in field}
+                    )
+                },
+                upsert=field == (),
+            )
+            for worker, field in updates
+        ] + [DeleteOne({"_id": worker_id}) for worker_id in deletes]
+        if not requests:
+            return None
+        logger.debug("批量写入Worker: %d", len(requests))
+        # 每个Worker只有一个操作, 不需要按顺序执行
+        return self._workers.bulk_write(requests, ordered=False)
+
     def get_worker(self, worker_id: str):
         logger.debug("获取Worker: %s", worker_id)
         return self._workers.find_one({"_id": worker_id})
@@ -144,7 +200,6 @@ class MongoHandle(HandleBase):
             {"_id": path.as_uri()},
             {
                 "$set": {
-                    "_id": item.id,
                     "update_time": datetime.datetime.now(),
                     "item": data,
                 },
@@ -153,7 +208,17 @@ class MongoHandle(HandleBase):
         )
 
     def get_file_item(self, item_id: AlistPath):
-        return self._items.find_one({"_id": item_id.as_uri()})["item"]
+        doc = self._items.find_one({"_id": item_id.as_uri()})
+        return doc["item"] if doc else None
+
+    def get_file_items(self, paths: Iterable["AlistPath"]) -> dict[str, "Item"]:
+        return {
+            doc["_id"]: Item.model_validate(doc["item"])
+            for doc in self._items.find(
+                {"_id": {"$in": [p.as_uri() for p in paths]}},
+                {"item": True},
+            )
+        }
 
 
 class ShelveHandle(HandleBase):
@@ -167,6 +232,8 @@ class ShelveHandle(HandleBase):
         self._logs = save_dir.joinpath(
             "alist-sync-files.log",
         ).open("a+")
+        self._items_lock = threading.Lock()
+        self._workers_lock = threading.Lock()
 
     def __del__(self):
         self._workers.close()
@@ -179,31 +246,47 @@ class ShelveHandle(HandleBase):
 
     def update_worker(self, worker: "Worker", *field):
         logger.debug(f"Shelve[{worker.id}] update to workers")
-        self._workers[worker.id] = worker.model_dump(mode="json")
-        self._workers.sync()
+        data = worker.model_dump(mode="json")
+        with self._workers_lock:
+            self._workers[worker.id] = data
+            self._workers.sync()
 
     def delete_worker(self, worker_id: str):
         logger.debug(f"Worker[{worker_id}] remove from workers")
-        try:
-            self._workers.pop(worker_id)
-        except KeyError:
-            pass
+        with self._workers_lock:
+            self._workers.pop(worker_id, None)
+
+    def bulk_update_workers(
+        self, updates: Iterable[tuple["Worker", tuple]], deletes: Iterable[str]
+    ):
+        _data = {worker.id: worker.model_dump(mode="json") for worker, _ in updates}
+        deletes = list(deletes)
+        logger.debug(f"Shelve batch: {len(_data)} update, {len(deletes)} delete")
+        with self._workers_lock:
+            self._workers.update(_data)
+            for worker_id in deletes:
+                self._workers.pop(worker_id, None)
+            self._workers.sync()
 
     def get_worker(self, worker_id: str):
         logger.debug(f"get Worker[{worker_id}] from workers")
-        return self._workers.get(worker_id)
+        with self._workers_lock:
+            return self._workers.get(worker_id)
 
     def get_workers(self, query=None) -> Iterable["Worker"]:
         logger.debug(f"get Workers from workers")
-        for _w in self._workers.values():
-            yield _w
+        with self._workers_lock:
+            _workers = list(self._workers.values())
+        yield from _workers
 
     def load_locker(self) -> set[AlistPath]:
         logger.debug("正在加载Shelve中保存的锁。")
+        with self._workers_lock:
+            _workers = list(self._workers.values())
         return {
             AlistPath(p)
-            for _w in self._workers.values()
-            for p in (_w.source_path, _w.target_path)
+            for _w in _workers
+            for p in (_w.get("source_path"), _w.get("target_path"))
             if p is not None
         }
 
@@ -212,12 +295,368 @@ class ShelveHandle(HandleBase):
 
     def update_file_item(self, path: AlistPath, item, *field):
         logger.debug(f"FileItem[{path}] update to items")
-        self._items[path.as_uri()] = {
-            "id": path,
-            "update_time": datetime.datetime.now(),
-            "item": item,
-        }
+        with self._items_lock:
+            self._items[path.as_uri()] = {
+                "id": path,
+                "update_time": datetime.datetime.now(),
+                "item": item,
+            }
 
     def get_file_item(self, item_id: AlistPath):
         logger.debug(f"get FileItem[{item_id}] from items")
-        return self._items.get(item_id.as_uri(), {}).get("item")
+        with self._items_lock:
+            return self._items.get(item_id.as_uri(), {}).get("item")
+
+
+class SQLiteHandle(HandleBase):
+    """本地 SQLite 数据库 (WAL 模式), 未配置 MongoDB 时使用
+
+    Worker 以 JSON 保存, source_path、target_path、tmp_file 单独成列并建立索引,
+    按路径查询不需要读取全部Worker。删除的空间在程序退出时回收。
+    """
+
+    # 单独成列的字段, get_workers 的查询条件中这些字段使用索引
+    worker_columns = ("owner", "status", "source_path", "target_path", "tmp_file")
+
+    def __init__(self, db_file: Path):
+        self._conn = sqlite3.connect(
+            db_file, check_same_thread=False, isolation_level=None
+        )
+        self._lock = threading.Lock()
+        with self._lock:
+            # auto_vacuum 只能在建表之前设置
+            self._conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS workers ("
+                "id TEXT PRIMARY KEY, owner TEXT, status TEXT, "
+                "source_path TEXT, target_path TEXT, tmp_file TEXT, "
+                "data TEXT NOT NULL)"
+            )
+            for _column in ("source_path", "target_path", "tmp_file"):
+                self._conn.execute(
+                    f"CREATE INDEX IF NOT EXISTS workers_{_column} "
+                    f"ON workers ({_column})"
+                )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS items ("
+                "id TEXT PRIMARY KEY, update_time REAL NOT NULL, item TEXT NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS logs ("
+                "id TEXT NOT NULL, status TEXT, done_at TEXT, data TEXT NOT NULL)"
+            )
+        atexit.register(self.compact)
+
+    def compact(self):
+        """回收删除的空间, 并将 WAL 写回数据库文件"""
+        with self._lock:
+            self._conn.execute("PRAGMA incremental_vacuum")
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def close(self):
+        atexit.unregister(self.compact)
+        self.compact()
+        with self._lock:
+            self._conn.close()
+
+    def import_shelve(self, save_dir: Path) -> int:
+        """一次性导入 ShelveHandle 在 save_dir 中保存的Worker与文件记录
+
+        已经存在的记录不覆盖; 导入后原文件加上 .imported 后缀保留, 不再重复导入。
+        无法读取时保留原文件, 只记录警告。
+
+        :return: 导入的Worker数量
+        """
+        _files = [
+            f
+            for f in save_dir.glob("alist_cache_*.shelve*")
+            if not f.name.endswith(".imported")
+        ]
+        if not _files:
+            return 0
+
+        try:
+            with shelve.open(
+                str(save_dir.joinpath("alist_cache_workers.shelve")), "r"
+            ) as _s:
+                workers = [self._data_row(_w) for _w in _s.values()]
+            with shelve.open(
+                str(save_dir.joinpath("alist_cache_items.shelve")), "r"
+            ) as _s:
+                items = [
+                    (
+                        _id,
+                        _v["update_time"].timestamp(),
+                        _v["item"].model_dump_json(),
+                    )
+                    for _id, _v in _s.items()
+                ]
+        except Exception as _e:
+            logger.warning(
+                f"无法读取旧版本的 Shelve 状态文件 {[f.name for f in _files]}: {_e}; "
+                f"未完成的Worker与 sync-incr 的记录没有导入, 将重新检查与传输。"
+            )
+            return 0
+
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO workers VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    workers,
+                )
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO items VALUES (?, ?, ?)", items
+                )
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+        for f in _files:
+            f.rename(f.with_name(f.name + ".imported"))
+        logger.warning(
+            f"已从 Shelve 导入 {len(workers)} 个Worker与 {len(items)} 条文件记录, "
+            f"原文件已改名为 *.imported"
+        )
+        return len(workers)
+
+    def _worker_row(self, worker: "Worker") -> tuple:
+        return self._data_row(worker.model_dump(mode="json"))
+
+    def _data_row(self, data: dict) -> tuple:
+        return (
+            data["id"],
+            *(data.get(k) for k in self.worker_columns),
+            json.dumps(data, ensure_ascii=False),
+        )
+
+    def create_log(self, worker: "Worker"):
+        logger.debug(f"create log for: {worker.id}")
+        data = worker.model_dump(mode="json")
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO logs VALUES (?, ?, ?, ?)",
+                (
+                    data["id"],
+                    data["status"],
+                    data["done_at"],
+                    json.dumps(data, ensure_ascii=False),
+                ),
+            )
+
+    def update_worker(self, worker: "Worker", *field):
+        logger.debug(f"SQLite[{worker.id}] update to workers")
+        self.bulk_update_workers([(worker, field)], [])
+
+    def delete_worker(self, worker_id: str):
+        logger.debug(f"Worker[{worker_id}] remove from workers")
+        self.bulk_update_workers([], [worker_id])
+
+    def bulk_update_workers(
+        self, updates: Iterable[tuple["Worker", tuple]], deletes: Iterable[str]
+    ):
+        # 字段更新也写入整个Worker, 在事务之外序列化
+        rows = [self._worker_row(worker) for worker, _ in updates]
+        deletes = [(worker_id,) for worker_id in deletes]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO workers VALUES (?, ?, ?, ?, ?, ?, ?)", rows
+                )
+                self._conn.executemany("DELETE FROM workers WHERE id = ?", deletes)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def get_worker(self, worker_id: str):
+        logger.debug(f"get Worker[{worker_id}] from workers")
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM workers WHERE id = ?", (worker_id,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get_workers(self, query=None) -> Iterable[dict]:
+        """:param query: {字段: 值}, 全部相等时返回"""
+        logger.debug(f"get Workers from workers: {query}")
+        query = {k: str(v) if v is not None else v for k, v in (query or {}).items()}
+        _columns = {k: v for k, v in query.items() if k in self.worker_columns}
+        _where = " AND ".join(f"{k} IS ?" for k in _columns) or "1"
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT data FROM workers WHERE {_where}", tuple(_columns.values())
+            ).fetchall()
+        for (data,) in rows:
+            data = json.loads(data)
+            if all(
+                str(data.get(k)) == v if v is not None else data.get(k) is None
+                for k, v in query.items()
+            ):
+                yield data
+
+    def load_locker(self) -> set[AlistPath]:
+        logger.debug("正在加载SQLite中保存的锁。")
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT source_path, target_path FROM workers"
+            ).fetchall()
+        return {AlistPath(p) for row in rows for p in row if p is not None}
+
+    def path_in_workers(self, path: AlistPath) -> bool:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM workers WHERE source_path = ? "
+                "UNION ALL SELECT 1 FROM workers WHERE target_path = ? LIMIT 1",
+                (path.as_uri(), path.as_uri()),
+            ).fetchone()
+        return row is not None
+
+    def update_file_item(self, path: AlistPath, item, *field):
+        logger.debug(f"FileItem[{path}] update to items")
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO items VALUES (?, ?, ?)",
+                (path.as_uri(), time.time(), item.model_dump_json()),
+            )
+
+    def get_file_item(self, item_id: AlistPath):
+        logger.debug(f"get FileItem[{item_id}] from items")
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT item FROM items WHERE id = ?", (item_id.as_uri(),)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get_file_items(self, paths: Iterable["AlistPath"]) -> dict[str, "Item"]:
+        _ids = [p.as_uri() for p in paths]
+        rows = []
+        with self._lock:
+            # SQLite 参数数量有上限, 分批查询
+            for i in range(0, len(_ids), 500):
+                _batch = _ids[i : i + 500]
+                rows += self._conn.execute(
+                    f"SELECT id, item FROM items "
+                    f"WHERE id IN ({', '.join('?' * len(_batch))})",
+                    _batch,
+                ).fetchall()
+        return {_id: Item.model_validate_json(item) for _id, item in rows}
+
+
+class WriteBehindHandle(HandleBase):
+    """Worker 状态的延迟写入
+
+    update_worker 与 delete_worker 只记录在内存中, 同一个Worker的多次更新合并为一次,
+    积累 max_pending 个Worker或每隔 flush_interval 秒, 由后台线程批量写入 handle。
+    读取Worker之前与程序退出时写入全部未保存的状态。
+    进程崩溃时最多丢失 flush_interval 秒内的状态变化, 下次运行会重做这些步骤。
+    """
+
+    def __init__(
+        self, handle: HandleBase, flush_interval: float = 1, max_pending: int = 500
+    ):
+        self.handle = handle
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        # {worker_id: (Worker, 更新的字段) | None}, None 表示删除
+        self._pending: dict[str, tuple["Worker", tuple] | None] = {}
+        self._cond = threading.Condition()
+        # 写入过程中不允许另一次写入, 保证同一个Worker的写入顺序
+        self._flush_lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(
+            target=self._flusher, name="handle_flusher", daemon=True
+        )
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _flusher(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(
+                    lambda: self._closed or len(self._pending) >= self.max_pending,
+                    self.flush_interval,
+                )
+                if self._closed:
+                    return
+            try:
+                self.flush()
+            except Exception as _e:
+                logger.error(f"写入Worker状态失败: {_e}", exc_info=_e)
+
+    def flush(self):
+        """写入全部未保存的状态"""
+        with self._flush_lock:
+            with self._cond:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return
+            try:
+                with profiler.stage("persist"):
+                    self.handle.bulk_update_workers(
+                        [v for v in pending.values() if v is not None],
+                        [k for k, v in pending.items() if v is None],
+                    )
+            except Exception:
+                # 放回未写入的状态, 不覆盖期间的新状态
+                with self._cond:
+                    self._pending = pending | self._pending
+                raise
+
+    def close(self):
+        """停止后台线程并写入全部状态, 之后的更新直接写入"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self.flush()
+
+    def update_worker(self, worker: "Worker", *field):
+        with self._cond:
+            _old = self._pending.get(worker.id)
+            if _old is not None and _old[1] != () and field != ():
+                # 合并更新的字段
+                field = tuple(dict.fromkeys(_old[1] + field))
+            elif _old is not None:
+                field = ()
+            self._pending[worker.id] = (worker, field)
+            if len(self._pending) >= self.max_pending:
+                self._cond.notify_all()
+        if self._closed:
+            self.flush()
+
+    def delete_worker(self, worker_id: str):
+        with self._cond:
+            self._pending[worker_id] = None
+        if self._closed:
+            self.flush()
+
+    def get_worker(self, worker_id: str):
+        self.flush()
+        return self.handle.get_worker(worker_id)
+
+    def get_workers(self, query=None) -> Iterable["Worker"]:
+        self.flush()
+        return self.handle.get_workers(query)
+
+    def load_locker(self) -> set["AlistPath"]:
+        self.flush()
+        return self.handle.load_locker()
+
+    def path_in_workers(self, path: "AlistPath") -> bool:
+        self.flush()
+        return self.handle.path_in_workers(path)
+
+    def update_file_item(self, path: "AlistPath", item, *field):
+        return self.handle.update_file_item(path, item, *field)
+
+    def get_file_item(self, item_id: "AlistPath"):
+        return self.handle.get_file_item(item_id)
+
+    def get_file_items(self, paths: Iterable["AlistPath"]) -> dict[str, "Item"]:
+        return self.handle.get_file_items(paths)
+
+    def create_log(self, worker: "Worker"):
+        return self.handle.create_log(worker)
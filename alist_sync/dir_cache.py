@@ -0,0 +1,234 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+@File Name  : dir_cache.py
+@Author     : LeeCQ
+@Date-Time  : 2024/3/16 10:12
+
+目录列表缓存
+
+扫描器列出目录时填充缓存，检查器从缓存中读取文件信息，
+一次运行中，每个服务器上的每个目录只会被列出一次。
+
+配置了 dir_cache_ttl 时，目录列表还会持久化到 cache_dir 中的SQLite，
+下次运行时如果目录的修改时间没有变化且未过期，将直接使用上次的列表。
+
+目录的修改时间只在直接子项变化时更新，只有父目录在本次运行中从AList列出时，
+其中的修改时间才是当前的；父目录的列表来自持久化存储时，该目录重新列出。
+因此持久化的列表只对已实际列出的目录的下一层有效，不会逐层沿用。
+"""
+
+import datetime
+import json
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Iterable
+
+from alist_sdk import AlistPath, Item, AlistError
+
+from alist_sync import profiler
+
+logger = logging.getLogger("alist-sync.dir-cache")
+
+__all__ = ["DirCache", "DirStore"]
+
+CacheKey = tuple[str, str]
+
+
+class DirStore:
+    """跨运行持久化的目录列表，以 (服务器, 路径) 为键，保存目录的修改时间与子项"""
+
+    def __init__(self, db_file: Path):
+        self._conn = sqlite3.connect(
+            db_file, check_same_thread=False, isolation_level=None
+        )
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS dirs ("
+                "server TEXT NOT NULL, path TEXT NOT NULL, modified REAL, "
+                "update_time REAL NOT NULL, items TEXT NOT NULL, "
+                "PRIMARY KEY (server, path))"
+            )
+
+    def get(
+        self, key: CacheKey, modified: datetime.datetime, ttl: int
+    ) -> list[Item] | None:
+        """目录修改时间未变化且未过期时返回保存的子项"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT modified, update_time, items FROM dirs "
+                "WHERE server = ? AND path = ?",
+                key,
+            ).fetchone()
+        if row is None:
+            return None
+        _modified, update_time, items = row
+        if _modified != modified.timestamp() or time.time() - update_time > ttl:
+            return None
+        return [Item.model_validate(i) for i in json.loads(items)]
+
+    def put(
+        self,
+        key: CacheKey,
+        modified: datetime.datetime | None,
+        items: Iterable[Item],
+    ):
+        _items = json.dumps(
+            [i.model_dump(mode="json") for i in items], ensure_ascii=False
+        )
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO dirs VALUES (?, ?, ?, ?, ?)",
+                (
+                    *key,
+                    modified.timestamp() if modified else None,
+                    time.time(),
+                    _items,
+                ),
+            )
+
+    def delete(self, key: CacheKey):
+        with self._lock:
+            self._conn.execute("DELETE FROM dirs WHERE server = ? AND path = ?", key)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class DirCache:
+    """线程安全的目录列表缓存
+
+    :param store: 持久化存储，None 表示只在本次运行中缓存
+    :param ttl: 持久化列表的有效期 (秒)
+    """
+
+    def __init__(self, store: DirStore | None = None, ttl: int = 0):
+        self._dirs: dict[CacheKey, dict[str, Item]] = {}
+        self._loading: dict[CacheKey, threading.Event] = {}
+        # 本次运行中从AList列出的目录
+        self._live: set[CacheKey] = set()
+        self._lock = threading.Lock()
+        self.store = store
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.store_hits = 0
+
+    @staticmethod
+    def _key(path: AlistPath) -> CacheKey:
+        return path.drive, path.as_posix().rstrip("/") or "/"
+
+    def __contains__(self, path: AlistPath) -> bool:
+        return self._key(path) in self._dirs
+
+    def __len__(self):
+        return len(self._dirs)
+
+    def live(self, path: AlistPath) -> bool:
+        """目录的列表是否在本次运行中从AList列出, 其中子目录的修改时间是当前的"""
+        with self._lock:
+            return self._key(path) in self._live
+
+    @staticmethod
+    @profiler.timed("scan")
+    def fetch(path: AlistPath, missing_ok=True) -> dict[str, Item]:
+        """从AList列出目录，目录不存在时返回空字典
+
+        :param missing_ok: 为False时目录不存在 (包括存储未挂载) 抛出 FileNotFoundError
+        """
+        res = path.client.list_files(path.as_posix(), refresh=True)
+        if res.code == 200:
+            return {i.name: i for i in res.data.content or []}
+        if res.code == 500 and (
+            "object not found" in res.message or "storage not found" in res.message
+        ):
+            if not missing_ok:
+                raise FileNotFoundError(f"目录不存在: {path.as_uri()} {res.message}")
+            return {}
+        raise AlistError(f"列出目录失败: {path.as_uri()} [{res.code}]{res.message}")
+
+    def set_dir(self, path: AlistPath, items: Iterable[Item]) -> dict[str, Item]:
+        """写入一个目录的列表"""
+        _items = {i.name: i for i in items}
+        with self._lock:
+            self._dirs[self._key(path)] = _items
+        return _items
+
+    def list_dir(
+        self,
+        path: AlistPath,
+        modified: datetime.datetime | None = None,
+        missing_ok=True,
+    ) -> dict[str, Item]:
+        """获取目录列表，多个线程同时请求同一目录时只会请求一次
+
+        :param path: 目录
+        :param modified: 父目录列表中该目录的修改时间，用于校验持久化的列表,
+            父目录不是在本次运行中列出时不使用持久化的列表
+        :param missing_ok: 见 fetch
+        """
+        key = self._key(path)
+        while True:
+            with self._lock:
+                if key in self._dirs:
+                    self.hits += 1
+                    return self._dirs[key]
+                event = self._loading.get(key)
+                if event is None:
+                    event = self._loading[key] = threading.Event()
+                    self.misses += 1
+                    break
+            event.wait()
+
+        try:
+            if (
+                self.store is not None
+                and modified is not None
+                and self.live(path.parent)
+            ):
+                items = self.store.get(key, modified, self.ttl)
+                if items is not None:
+                    self.store_hits += 1
+                    logger.debug("使用持久化的目录列表: %s", path.as_uri())
+                    return self.set_dir(path, items)
+
+            logger.debug("缓存未命中, 列出目录: %s", path.as_uri())
+            items = self.fetch(path, missing_ok).values()
+            if self.store is not None:
+                self.store.put(key, modified, items)
+            with self._lock:
+                self._live.add(key)
+            return self.set_dir(path, items)
+        finally:
+            with self._lock:
+                self._loading.pop(key, None)
+            event.set()
+
+    def get_item(self, path: AlistPath) -> Item | None:
+        """从父目录的列表中获取文件信息，不存在返回None"""
+        if path.as_posix() == "/":
+            return path.raw_stat()
+        return self.list_dir(path.parent).get(path.name)
+
+    def discard(self, path: AlistPath):
+        """移除一个目录的缓存"""
+        with self._lock:
+            self._dirs.pop(self._key(path), None)
+
+    def invalidate(self, path: AlistPath):
+        """目录内容被修改，同时移除内存与持久化的缓存"""
+        self.discard(path)
+        if self.store is not None:
+            self.store.delete(self._key(path))
+
+    def clear(self):
+        with self._lock:
+            self._dirs.clear()
+            self._live.clear()
@@ -5,140 +5,480 @@
 @Author     : LeeCQ
 @Date-Time  : 2024/2/25 21:17
 
-下载器使用一个单独线程启动，它创建一个事件循环并在其内部保持同步。
+分段下载: 文件按 Range 切分为多段，每段一个连接，写入预分配的临时文件的对应位置。
+服务器不支持 Range 时，退回单连接下载。每段已完成的字节数记录在进度中，
+中断后从进度处继续下载。download_file 与 adownload_file 分别用于线程与异步引擎。
+
+流式复制: 一个线程从源文件下载，分块放入有界的内存管道，
+上传请求直接从管道中读取，不经过本地磁盘。
+管道写满时下载线程阻塞，内存占用不超过 chunk_size * max_chunks。
+
+内容校验: 上传读取临时文件与流式复制的下载循环中，每个分块同时更新 ContentHash，
+传输结束即得到内容的散列。分段下载的分块不按顺序到达，不在下载中计算。
 """
+
+import asyncio
+import logging
 import queue
-import time
-import urllib.parse
-from typing import TYPE_CHECKING
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Awaitable, Callable
 
 from alist_sdk import AlistPath
+from alist_sdk.models import Resp
+from httpx import Client, AsyncClient, Timeout
 
-from alist_sync.alist_client import create_async_client, AlistClient
+from alist_sync.common import ContentHash
+from alist_sync.rate_limit import Throttle
 
-if TYPE_CHECKING:
-    ...
+logger = logging.getLogger("alist-sync.downloader")
 
+__all__ = [
+    "ChunkPipe",
+    "PipeClosed",
+    "stream_copy",
+    "split_ranges",
+    "download_file",
+    "RangeNotSupported",
+    "adownload_file",
+    "iter_file",
+    "aiter_file",
+]
 
-def upload_stream(source_path: AlistPath, target_path: AlistPath):
-    import asyncio
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
 
-    _queue = asyncio.Queue()
+STREAM_CHUNK_SIZE = 1024 * 1024
+STREAM_MAX_CHUNKS = 8
 
-    # noinspection PyArgumentList
-    async def put_stream():
-        _c: AlistClient = create_async_client(source_path.client)
-        async with _c.stream(
-            "GET",
-            source_path.as_download_uri(),
-            follow_redirects=True,
-        ) as stream_resp:
-            async for chunk in stream_resp.aiter_bytes():
-                print("Put Chunk size:", len(chunk), "bytes.")
-                await _queue.put(chunk)
-            else:
-                await _queue.put(None)
+_EOF = object()
 
-    async def put_test():
-        a = open("/Users/lcq/Downloads/drunbility.pdf", "rb")
-        while True:
-            chunk = a.read(1024)
-            if not chunk:
-                await _queue.put(None)
-                break
-            await _queue.put(chunk)
 
-    async def get_chunk():
-        while True:
-            chunk = await _queue.get()
-            if chunk is None:
-                break
-            yield chunk
+class RangeNotSupported(Exception):
+    """服务器没有按照 Range 返回 206"""
 
-    # noinspection PyAsyncCall
-    async def main():
 
-        asyncio.create_task(put_test())
-        return await create_async_client(target_path.client).put(
-            "/api/fs/put",
-            headers={
-                "As-Task": "false",
-                "Content-Type": "application/octet-stream",
-                "Last-Modified": str(int(time.time() * 1000)),
-                "File-Path": urllib.parse.quote_plus(str(target_path.as_posix())),
-            },
-            content=get_chunk(),
+def split_ranges(
+    size: int, segments: int, min_segment_size: int
+) -> list[tuple[int, int]]:
+    """将文件切分为不超过 segments 段，每段不小于 min_segment_size，返回闭区间"""
+    if size <= 0:
+        return []
+    count = max(1, min(segments, size // max(min_segment_size, 1)))
+    step = -(-size // count)
+    return [(start, min(start + step, size) - 1) for start in range(0, size, step)]
+
+
+def _init_progress(
+    file: Path,
+    size: int,
+    segments: int,
+    min_segment_size: int,
+    progress: list[list[int]] | None,
+) -> list[list[int]]:
+    if progress is None or not file.exists() or file.stat().st_size != size:
+        with file.open("wb") as _fp:
+            _fp.truncate(size)
+        return [
+            [start, end, 0]
+            for start, end in split_ranges(size, segments, min_segment_size)
+        ]
+    logger.info(
+        "继续下载 %s: 已完成 %d/%d", file.name, sum(p[2] for p in progress), size
+    )
+    return progress
+
+
+def _download_segment(
+    client: Client,
+    url: str,
+    file: Path,
+    segment: list[int],
+    chunk_size: int,
+    ranged: bool,
+    on_progress: Callable[[], None] | None,
+    headers: dict | None = None,
+    throttle: Throttle | None = None,
+):
+    """下载一段 [start, end, done]，从 start + done 处继续，done 随写入更新"""
+    start, end, done = segment
+    if start + done > end:
+        return
+    _range = {"Range": f"bytes={start + done}-{end}"} if ranged or done else {}
+    with client.stream(
+        "GET", url, headers=(headers or {}) | _range, follow_redirects=True
+    ) as _res:
+        _res.raise_for_status()
+        if _range and _res.status_code != 206:
+            if ranged:
+                raise RangeNotSupported(f"[{_res.status_code}] {url}")
+            logger.warning("服务器不支持断点续传, 从头下载: %s", url)
+            segment[2] = 0
+        with file.open("r+b") as _fp:
+            _fp.seek(start + segment[2])
+            for chunk in _res.iter_bytes(chunk_size=chunk_size):
+                if throttle:
+                    throttle.wait(len(chunk))
+                _fp.write(chunk)
+                segment[2] += len(chunk)
+                if on_progress is not None:
+                    on_progress()
+    assert segment[2] == end - start + 1, f"分段 {start}-{end} 下载不完整: {segment[2]}"
+
+
+def download_file(
+    client: Client,
+    url: str,
+    file: Path,
+    size: int,
+    segments: int = 1,
+    min_segment_size: int = 16 * 1024 * 1024,
+    chunk_size: int = DOWNLOAD_CHUNK_SIZE,
+    progress: list[list[int]] | None = None,
+    on_progress: Callable[[list[list[int]]], None] | None = None,
+    headers: dict | None = None,
+    throttle: Throttle | None = None,
+) -> list[list[int]]:
+    """下载到本地文件，文件足够大时使用多个连接分段下载
+
+    :param size: 文件大小，用于预分配与切分
+    :param segments: 最大分段数
+    :param min_segment_size: 每段的最小大小
+    :param progress: 上次下载的进度 [[start, end, done], ...], 文件存在时从中断处继续
+    :param on_progress: 每写入一个分块后调用，参数为当前进度
+    :param headers: 下载请求额外的请求头
+    :param throttle: 传输限速, 各分段共用
+    :return: 下载进度
+    """
+    progress = _init_progress(file, size, segments, min_segment_size, progress)
+    _report = None if on_progress is None else lambda: on_progress(progress)
+    if len(progress) <= 1:
+        for segment in progress:
+            _download_segment(
+                client,
+                url,
+                file,
+                segment,
+                chunk_size,
+                False,
+                _report,
+                headers,
+                throttle,
+            )
+        return progress
+
+    logger.debug("分段下载 %d 段: %s", len(progress), url)
+    try:
+        with ThreadPoolExecutor(
+            len(progress), thread_name_prefix="download_range_"
+        ) as pool:
+            for _f in [
+                pool.submit(
+                    _download_segment,
+                    client,
+                    url,
+                    file,
+                    segment,
+                    chunk_size,
+                    True,
+                    _report,
+                    headers,
+                    throttle,
+                )
+                for segment in progress
+            ]:
+                _f.result()
+    except RangeNotSupported as _e:
+        logger.warning("服务器不支持分段下载, 使用单连接下载: %s", _e)
+        progress = [[0, size - 1, 0]]
+        _download_segment(
+            client,
+            url,
+            file,
+            progress[0],
+            chunk_size,
+            False,
+            _report,
+            headers,
+            throttle,
         )
+    return progress
 
-    return asyncio.run(main())
 
+async def _adownload_segment(
+    client: AsyncClient,
+    url: str,
+    file: Path,
+    segment: list[int],
+    chunk_size: int,
+    ranged: bool,
+    on_progress: Callable[[], Awaitable[None]] | None,
+    headers: dict | None = None,
+    throttle: Throttle | None = None,
+):
+    """_download_segment 的异步版本"""
+    start, end, done = segment
+    if start + done > end:
+        return
+    _range = {"Range": f"bytes={start + done}-{end}"} if ranged or done else {}
+    async with client.stream(
+        "GET", url, headers=(headers or {}) | _range, follow_redirects=True
+    ) as _res:
+        _res.raise_for_status()
+        if _range and _res.status_code != 206:
+            if ranged:
+                raise RangeNotSupported(f"[{_res.status_code}] {url}")
+            logger.warning("服务器不支持断点续传, 从头下载: %s", url)
+            segment[2] = 0
+        with file.open("r+b") as _fp:
+            _fp.seek(start + segment[2])
+            async for chunk in _res.aiter_bytes(chunk_size=chunk_size):
+                if throttle:
+                    await throttle.async_wait(len(chunk))
+                _fp.write(chunk)
+                segment[2] += len(chunk)
+                if on_progress is not None:
+                    await on_progress()
+    assert segment[2] == end - start + 1, f"分段 {start}-{end} 下载不完整: {segment[2]}"
 
-def upload_stream_thread(source_path: AlistPath, target_path: AlistPath):
-    """"""
 
-    def put_stream():
-        with source_path.client.stream(
-            "GET", source_path.as_download_uri(), follow_redirects=True
-        ) as stream_resp:
-            total = 0
-            for i in stream_resp.iter_bytes():
-                total += len(i)
-                print("Download Chunk size:", total, "bytes.")
-                _queue.put(i)
+async def _gather_or_cancel(coros):
+    """并发执行, 任意一个失败时取消并等待其余的结束, 再抛出该异常
 
-            print("None Putted")
-            _queue.put(None)
+    asyncio.gather 出错时不会取消其余的协程, 重试或退回单连接下载时会与它们
+    同时写入同一个分段和临时文件
+    """
+    tasks = [asyncio.ensure_future(_c) for _c in coros]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        for _t in done:
+            if _t.exception() is not None:
+                raise _t.exception()
+    finally:
+        for _t in tasks:
+            _t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
 
-    def get_chunk():
-        total = 0
-        while True:
-            chunk = _queue.get()
-            if chunk is None:
-                print("None Got")
-                break
-            total += len(chunk)
-            print(f"\rupload Chunk size: {total} bytes. [{time.time()}]", end="")
+
+async def adownload_file(
+    client: AsyncClient,
+    url: str,
+    file: Path,
+    size: int,
+    segments: int = 1,
+    min_segment_size: int = 16 * 1024 * 1024,
+    chunk_size: int = DOWNLOAD_CHUNK_SIZE,
+    progress: list[list[int]] | None = None,
+    on_progress: Callable[[list[list[int]]], Awaitable[None]] | None = None,
+    headers: dict | None = None,
+    throttle: Throttle | None = None,
+) -> list[list[int]]:
+    """download_file 的异步版本，各分段在同一个事件循环中并发下载
+
+    :param on_progress: 协程函数, 保存进度的数据库写入等阻塞操作应放到线程中执行
+    """
+    progress = _init_progress(file, size, segments, min_segment_size, progress)
+    _report = None if on_progress is None else lambda: on_progress(progress)
+    if len(progress) <= 1:
+        for segment in progress:
+            await _adownload_segment(
+                client,
+                url,
+                file,
+                segment,
+                chunk_size,
+                False,
+                _report,
+                headers,
+                throttle,
+            )
+        return progress
+
+    try:
+        await _gather_or_cancel(
+            _adownload_segment(
+                client,
+                url,
+                file,
+                segment,
+                chunk_size,
+                True,
+                _report,
+                headers,
+                throttle,
+            )
+            for segment in progress
+        )
+    except RangeNotSupported as _e:
+        logger.warning("服务器不支持分段下载, 使用单连接下载: %s", _e)
+        progress = [[0, size - 1, 0]]
+        await _adownload_segment(
+            client,
+            url,
+            file,
+            progress[0],
+            chunk_size,
+            False,
+            _report,
+            headers,
+            throttle,
+        )
+    return progress
+
+
+def iter_file(
+    file: Path,
+    chunk_size: int = DOWNLOAD_CHUNK_SIZE,
+    throttle: Throttle | None = None,
+    hasher: ContentHash | None = None,
+):
+    """分块读取本地文件，用作上传的请求体
+
+    :param hasher: 读取的同时计算内容的散列
+    """
+    with file.open("rb") as _fp:
+        while chunk := _fp.read(chunk_size):
+            if throttle:
+                throttle.wait(len(chunk))
+            if hasher is not None:
+                hasher.update(chunk)
             yield chunk
 
-    import threading
-
-    _queue = queue.Queue()
-
-    threading.Thread(target=put_stream).start()
-    print("启动线程")
-    return target_path.client.put(
-        "/api/fs/put",
-        timeout=0,
-        headers={
-            "As-Task": "false",
-            "Content-Type": "application/octet-stream",
-            "Last-Modified": str(int(time.time() * 1000)),
-            "File-Path": urllib.parse.quote_plus(str(target_path.as_posix())),
-        },
-        # content=open("/Users/lcq/Movies/志愿军-雄军出击-含广告.mp4", "rb"),
-        content=get_chunk(),
-    )
 
+async def aiter_file(
+    file: Path,
+    chunk_size: int = DOWNLOAD_CHUNK_SIZE,
+    throttle: Throttle | None = None,
+    hasher: ContentHash | None = None,
+):
+    """iter_file 的异步版本"""
+    with file.open("rb") as _fp:
+        while chunk := _fp.read(chunk_size):
+            if throttle:
+                await throttle.async_wait(len(chunk))
+            if hasher is not None:
+                hasher.update(chunk)
+            yield chunk
 
 
+class PipeClosed(Exception):
+    """管道的读取端已经关闭"""
 
-if __name__ == "__main__":
-    from alist_sync.config import create_config, AlistServer
-    from alist_sdk import login_server
 
-    import logging
+class ChunkPipe:
+    """有界的内存分块管道，写满时阻塞写入端"""
 
-    logging.basicConfig(level=logging.DEBUG)
+    def __init__(self, max_chunks: int = STREAM_MAX_CHUNKS):
+        self._queue = queue.Queue(max_chunks)
+        self._aborted = threading.Event()
+        self.error: BaseException | None = None
+        self.total = 0
 
-    sync_config = create_config()
-    for _ in sync_config.alist_servers:
-        _: AlistServer
-        login_server(**_.dump_for_alist_path())
+    def put(self, chunk):
+        """写入一个分块，读取端关闭时抛出 PipeClosed"""
+        while not self._aborted.is_set():
+            try:
+                return self._queue.put(chunk, timeout=1)
+            except queue.Full:
+                continue
+        raise PipeClosed()
 
-    source = AlistPath("https://alist.leecq.cn/local/Country.mmdb")
-    target = AlistPath("http://localhost:5244/local/Country.mmdb")
+    def close(self, error: BaseException | None = None):
+        """写入结束，error 会在读取端抛出"""
+        self.error = error
+        try:
+            self.put(_EOF)
+        except PipeClosed:
+            pass
 
-    print(source.stat())
-    # a = upload_stream_thread(source, target)
-    a = upload_big_file(target)
-    print(a.text)
+    def abort(self):
+        """读取端不再读取，唤醒阻塞的写入端"""
+        self._aborted.set()
+
+    def __iter__(self):
+        while True:
+            chunk = self._queue.get()
+            if chunk is _EOF:
+                if self.error is not None:
+                    raise self.error
+                return
+            self.total += len(chunk)
+            yield chunk
+
+
+def _download_to_pipe(
+    client: Client,
+    url: str,
+    pipe: ChunkPipe,
+    chunk_size: int,
+    headers: dict | None,
+    throttle: Throttle | None,
+    hasher: ContentHash | None = None,
+):
+    try:
+        with client.stream("GET", url, headers=headers, follow_redirects=True) as _res:
+            _res.raise_for_status()
+            for chunk in _res.iter_bytes(chunk_size=chunk_size):
+                if throttle:
+                    throttle.wait(len(chunk))
+                if hasher is not None:
+                    hasher.update(chunk)
+                pipe.put(chunk)
+    except PipeClosed:
+        logger.debug("上传已经结束, 停止下载: %s", url)
+    except Exception as _e:
+        pipe.close(_e)
+        return
+    pipe.close()
+
+
+def stream_copy(
+    client: Client,
+    source_url: str,
+    target_path: AlistPath,
+    headers: dict,
+    chunk_size: int = STREAM_CHUNK_SIZE,
+    max_chunks: int = STREAM_MAX_CHUNKS,
+    timeout: Timeout | float = 300,
+    download_headers: dict | None = None,
+    throttle: Throttle | None = None,
+    hasher: ContentHash | None = None,
+) -> tuple[Resp, int]:
+    """边下载边上传，返回上传的响应与传输的字节数
+
+    :param client: 用于下载源文件的客户端
+    :param source_url: 源文件的下载地址
+    :param target_path: 目标文件
+    :param headers: /api/fs/put 的请求头，需要包含 Content-Length
+    :param download_headers: 下载请求额外的请求头
+    :param throttle: 传输限速, 在下载端等待, 上传端随管道同速
+    :param hasher: 在下载端计算内容的散列, 返回后可以校验
+    """
+    pipe = ChunkPipe(max_chunks)
+    _t = threading.Thread(
+        target=_download_to_pipe,
+        args=(
+            client,
+            source_url,
+            pipe,
+            chunk_size,
+            download_headers,
+            throttle,
+            hasher,
+        ),
+        name=f"stream_download_{target_path.name}",
+        daemon=True,
+    )
+    _t.start()
+    try:
+        res = target_path.client.verify_request(
+            "PUT",
+            "/api/fs/put",
+            headers=headers,
+            content=iter(pipe),
+            timeout=timeout,
+        )
+    finally:
+        pipe.abort()
+        _t.join()
+    return res, pipe.total
@@ -38,3 +38,7 @@ class UploadError(WorkerError):
 
 class RecheckError(WorkerError):
     pass
+
+
+class HashMismatch(WorkerError):
+    """传输的内容与源文件的散列不一致"""
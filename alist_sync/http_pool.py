@@ -0,0 +1,111 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+@File Name  : http_pool.py
+@Author     : LeeCQ
+@Date-Time  : 2024/3/19 21:10
+
+每个 AList 服务器一个连接池，扫描、检查与传输共用。
+
+连接池大小为 AlistServer.max_connect，空闲连接保持 keepalive_expiry 秒。
+进行中的请求 (包括未读完的流式响应) 数量由信号量限制，不超过连接池大小:
+请求在信号量上排队，而不是在 httpcore 的连接池中排队 ——
+多线程共用一个已满的连接池时，httpcore 可能关闭另一个线程刚取得的连接。
+"""
+
+import asyncio
+import threading
+
+from httpx import (
+    HTTPTransport,
+    AsyncHTTPTransport,
+    Limits,
+    Request,
+    Response,
+    SyncByteStream,
+    AsyncByteStream,
+)
+
+__all__ = ["PoolTransport", "AsyncPoolTransport", "pool_limits"]
+
+
+def pool_limits(max_connect: int, keepalive_expiry: float) -> Limits:
+    """连接全部保持长连接"""
+    return Limits(
+        max_connections=max_connect,
+        max_keepalive_connections=max_connect,
+        keepalive_expiry=keepalive_expiry,
+    )
+
+
+class _ReleaseStream(SyncByteStream):
+    """响应关闭时归还名额"""
+
+    def __init__(self, stream: SyncByteStream, release):
+        self._stream = stream
+        self._release = release
+
+    def __iter__(self):
+        yield from self._stream
+
+    def close(self):
+        try:
+            self._stream.close()
+        finally:
+            release, self._release = self._release, None
+            if release is not None:
+                release()
+
+
+class _AsyncReleaseStream(AsyncByteStream):
+    def __init__(self, stream: AsyncByteStream, release):
+        self._stream = stream
+        self._release = release
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            release, self._release = self._release, None
+            if release is not None:
+                release()
+
+
+class PoolTransport(HTTPTransport):
+    """同时进行的请求不超过 max_connect 的连接池"""
+
+    def __init__(self, max_connect: int, keepalive_expiry: float = 30, **kwargs):
+        super().__init__(limits=pool_limits(max_connect, keepalive_expiry), **kwargs)
+        self._semaphore = threading.BoundedSemaphore(max_connect)
+
+    def handle_request(self, request: Request) -> Response:
+        self._semaphore.acquire()
+        try:
+            response = super().handle_request(request)
+        except BaseException:
+            self._semaphore.release()
+            raise
+        response.stream = _ReleaseStream(response.stream, self._semaphore.release)
+        return response
+
+
+class AsyncPoolTransport(AsyncHTTPTransport):
+    """PoolTransport 的异步版本, 只能在创建它的事件循环中使用"""
+
+    def __init__(self, max_connect: int, keepalive_expiry: float = 30, **kwargs):
+        super().__init__(limits=pool_limits(max_connect, keepalive_expiry), **kwargs)
+        self._semaphore = asyncio.BoundedSemaphore(max_connect)
+
+    async def handle_async_request(self, request: Request) -> Response:
+        await self._semaphore.acquire()
+        try:
+            response = await super().handle_async_request(request)
+        except BaseException:
+            self._semaphore.release()
+            raise
+        response.stream = _AsyncReleaseStream(response.stream, self._semaphore.release)
+        return response
@@ -0,0 +1,361 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+@File Name  : metrics.py
+@Author     : LeeCQ
+@Date-Time  : 2024/3/24 20:10
+
+运行指标，Prometheus 文本格式 (text/plain; version=0.0.4)。
+
+通过 HTTP (/metrics) 提供，或者定时写入 node_exporter 的 textfile collector 目录。
+队列深度等瞬时值在输出时采样，计数器在事件发生时累加。
+"""
+
+import logging
+import os
+import threading
+import time
+import weakref
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Iterable
+
+from httpx import Request, Response
+
+from alist_sync.rate_limit import api_family
+
+logger = logging.getLogger("alist-sync.metrics")
+
+__all__ = [
+    "Metric",
+    "Summary",
+    "REGISTRY",
+    "render",
+    "register_queue",
+    "register_pool",
+    "worker_status",
+    "record_transfer",
+    "record_file",
+    "record_error",
+    "request_hook",
+    "response_hook",
+    "async_request_hook",
+    "async_response_hook",
+    "start_http_server",
+    "TextfileWriter",
+]
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+class Metric:
+    """一个指标与它的全部标签组合
+
+    :param collect: 输出时调用, 返回 {标签值: 数值}, 用于采样队列深度等瞬时值
+    """
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        type_: str = "counter",
+        labelnames: tuple[str, ...] = (),
+        collect: Callable[[], dict[tuple, float]] | None = None,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.type = type_
+        self.labelnames = labelnames
+        self._collect = collect
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(k, "")) for k in self.labelnames)
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def get(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> dict[tuple, float]:
+        if self._collect is not None:
+            return self._collect()
+        with self._lock:
+            return dict(self._values)
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.type}"
+        for key, value in sorted(self.samples().items()):
+            _labels = ",".join(
+                f'{k}="{_escape(v)}"' for k, v in zip(self.labelnames, key)
+            )
+            _name = f"{self.name}{{{_labels}}}" if _labels else self.name
+            yield f"{_name} {value}"
+
+
+class Summary(Metric):
+    """只有总数与总和的 summary: name_sum, name_count"""
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        super().__init__(name, documentation, "summary", labelnames)
+        self._count: dict[tuple, int] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+            self._count[key] = self._count.get(key, 0) + 1
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.type}"
+        with self._lock:
+            _samples = [
+                (key, value, self._count[key])
+                for key, value in sorted(self._values.items())
+            ]
+        for key, value, count in _samples:
+            _labels = ",".join(
+                f'{k}="{_escape(v)}"' for k, v in zip(self.labelnames, key)
+            )
+            yield f"{self.name}_sum{{{_labels}}} {value}"
+            yield f"{self.name}_count{{{_labels}}} {count}"
+
+
+REGISTRY: list[Metric] = []
+
+
+def render() -> str:
+    lines = []
+    for metric in REGISTRY:
+        try:
+            lines.extend(metric.render())
+        except Exception as _e:
+            logger.warning(f"采集指标 {metric.name} 失败: {_e}")
+    return "\n".join(lines) + "\n"
+
+
+# 队列与线程池, 输出时采样; 线程池结束后自动移除
+_queues: dict[str, Callable[[], int]] = {}
+_pools: "weakref.WeakValueDictionary[str, object]" = weakref.WeakValueDictionary()
+
+
+def register_queue(name: str, qsize: Callable[[], int]):
+    """登记队列, name 相同时替换"""
+    _queues[name] = qsize
+
+
+def register_pool(name: str, pool):
+    """登记 MyThreadPoolExecutor"""
+    _pools[name] = pool
+
+
+def _collect_queues() -> dict[tuple, float]:
+    return {(name,): qsize() for name, qsize in list(_queues.items())}
+
+
+def _collect_pools(attr: str) -> Callable[[], dict[tuple, float]]:
+    def _collect():
+        return {(name,): getattr(pool, attr)() for name, pool in list(_pools.items())}
+
+    return _collect
+
+
+queue_depth = Metric(
+    "alist_sync_queue_depth",
+    "排队中的数量",
+    "gauge",
+    ("queue",),
+    collect=_collect_queues,
+)
+pool_queue = Metric(
+    "alist_sync_thread_pool_queued",
+    "线程池中等待线程的任务数量 (work_qsize)",
+    "gauge",
+    ("pool",),
+    collect=_collect_pools("work_qsize"),
+)
+pool_pending = Metric(
+    "alist_sync_thread_pool_pending",
+    "线程池中未完成的任务数量",
+    "gauge",
+    ("pool",),
+    collect=_collect_pools("pending"),
+)
+
+# Worker 当前的状态, 结束后移除
+_worker_status: dict[str, tuple[str, str]] = {}
+_worker_status_lock = threading.Lock()
+
+
+def _collect_workers() -> dict[tuple, float]:
+    _count: dict[tuple, float] = {}
+    with _worker_status_lock:
+        for key in _worker_status.values():
+            _count[key] = _count.get(key, 0) + 1
+    return _count
+
+
+workers = Metric(
+    "alist_sync_workers",
+    "运行中的Worker, 按所在阶段",
+    "gauge",
+    ("group", "status"),
+    collect=_collect_workers,
+)
+
+
+def worker_status(worker_id: str, group: str, status: str | None):
+    """记录Worker所在的阶段, status 为 None 时移除"""
+    with _worker_status_lock:
+        if status is None:
+            _worker_status.pop(worker_id, None)
+        else:
+            _worker_status[worker_id] = (group, status)
+
+
+transfer_bytes = Metric(
+    "alist_sync_transfer_bytes_total",
+    "传输完成的字节数; download: 从服务器下载, upload: 上传到服务器, copy: 服务器复制",
+    "counter",
+    ("group", "server", "direction"),
+)
+files = Metric(
+    "alist_sync_files_total",
+    "结束的Worker数量",
+    "counter",
+    ("group", "type", "status"),
+)
+errors = Metric(
+    "alist_sync_errors_total",
+    "Worker 出现的错误",
+    "counter",
+    ("group", "error"),
+)
+
+
+def record_transfer(group: str, server: str, direction: str, size: int | None):
+    transfer_bytes.inc(
+        size or 0, group=group, server=server.rstrip("/"), direction=direction
+    )
+
+
+def record_file(group: str, type_: str, status: str):
+    files.inc(group=group, type=type_, status=status)
+
+
+def record_error(group: str, error: BaseException):
+    errors.inc(group=group, error=type(error).__name__)
+
+
+api_requests = Metric(
+    "alist_sync_api_requests_total",
+    "AList 请求数量, 按服务器、API 类别与响应码",
+    "counter",
+    ("server", "family", "code"),
+)
+api_seconds = Summary(
+    "alist_sync_api_request_seconds",
+    "AList 请求从发出到收到响应头的耗时 (包括排队等待连接)",
+    ("server", "family"),
+)
+
+
+def request_hook(request: Request):
+    """httpx request 事件钩子, 记录开始时间"""
+    request.extensions["alist_sync_start"] = time.monotonic()
+
+
+def response_hook(response: Response):
+    """httpx response 事件钩子, 记录请求数量与耗时"""
+    request = response.request
+    server = f"{request.url.scheme}://{request.url.netloc.decode()}"
+    # 服务器地址带有路径时, 由 RateLimiter.family 去掉该路径后得到类别
+    family = request.extensions.get("alist_sync_family", api_family(request.url.path))
+    family = family or "other"
+    api_requests.inc(server=server, family=family, code=response.status_code)
+    _start = request.extensions.get("alist_sync_start")
+    if _start is not None:
+        api_seconds.observe(time.monotonic() - _start, server=server, family=family)
+
+
+async def async_request_hook(request: Request):
+    request_hook(request)
+
+
+async def async_response_hook(response: Response):
+    response_hook(response)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+
+def start_http_server(port: int, addr: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """在后台线程中提供 /metrics"""
+    server = ThreadingHTTPServer((addr, port), _Handler)
+    server.daemon_threads = True
+    threading.Thread(
+        target=server.serve_forever, name="metrics_http", daemon=True
+    ).start()
+    logger.info(f"Metrics: http://{addr}:{server.server_port}/metrics")
+    return server
+
+
+class TextfileWriter:
+    """每隔 interval 秒将指标写入文件, 先写临时文件再改名, 采集方不会读到一半的文件"""
+
+    def __init__(self, path: Path, interval: float = 15):
+        self.path = Path(path)
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="metrics_textfile", daemon=True
+        )
+
+    def write(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        _tmp = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+        _tmp.write_text(render(), encoding="utf-8")
+        _tmp.replace(self.path)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.write()
+            except Exception as _e:
+                logger.warning(f"写入指标文件失败: {_e}")
+
+    def start(self) -> "TextfileWriter":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """停止并写入最后一次"""
+        self._stop.set()
+        self.write()
@@ -0,0 +1,231 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+@File Name  : profiler.py
+@Author     : LeeCQ
+@Date-Time  : 2024/3/26 20:30
+
+性能分析，由 sync 与 check 命令的 --profile 开启，默认关闭，关闭时几乎没有开销。
+
+阶段耗时: 在各阶段的入口计时，按阶段累计次数与墙上时间 (全部线程的总和)。
+    scan:    列出目录
+    stat:    查询文件信息
+    check:   对比目录, 给出决策
+    prepare: 删除已存在的目标文件, 创建目标目录
+    download, upload, stream, copy: 传输
+    recheck: 传输后的检查
+    persist: 写入状态
+阶段可以嵌套 (如传输结束时写入状态)，耗时包括嵌套的阶段。
+
+调用栈采样: 后台线程定时采样全部线程的调用栈 (sys._current_frames)，
+可以覆盖 MyThreadPoolExecutor 中的全部线程，保存为 collapsed stack 格式，
+可以使用 flamegraph.pl 或 speedscope 查看。
+"""
+
+import collections
+import contextlib
+import functools
+import inspect
+import logging
+import re
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Iterable, Iterator, TypeVar
+
+logger = logging.getLogger("alist-sync.profiler")
+
+__all__ = [
+    "stage",
+    "timed",
+    "timed_iter",
+    "Sampler",
+    "profiling",
+    "report",
+    "enabled",
+]
+
+T = TypeVar("T")
+
+_enabled = False
+# {阶段: [次数, 累计秒数, 最大秒数]}
+_stages: dict[str, list] = {}
+_lock = threading.Lock()
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def record(name: str, seconds: float):
+    with _lock:
+        _s = _stages.setdefault(name, [0, 0.0, 0.0])
+        _s[0] += 1
+        _s[1] += seconds
+        _s[2] = max(_s[2], seconds)
+
+
+class stage:
+    """阶段计时的上下文管理器, 同步与异步代码中都可以使用
+
+    with profiler.stage("scan"):
+        ...
+    """
+
+    __slots__ = ("name", "_start")
+
+    def __init__(self, name: str):
+        self.name = name
+        self._start = None
+
+    def __enter__(self):
+        if _enabled:
+            self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *_):
+        if self._start is not None:
+            record(self.name, time.perf_counter() - self._start)
+
+
+def timed(name: str):
+    """阶段计时的装饰器, 支持普通函数与协程函数"""
+
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def _async_wrapper(*args, **kwargs):
+                with stage(name):
+                    return await func(*args, **kwargs)
+
+            return _async_wrapper
+
+        @functools.wraps(func)
+        def _wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+
+        return _wrapper
+
+    return decorator
+
+
+def timed_iter(name: str, iterable: Iterable[T]) -> Iterator[T]:
+    """只计入生成下一个元素的时间, 不计入调用方处理元素的时间"""
+    if not _enabled:
+        yield from iterable
+        return
+    _iter = iter(iterable)
+    while True:
+        with stage(name):
+            try:
+                item = next(_iter)
+            except StopIteration:
+                return
+        yield item
+
+
+class Sampler:
+    """定时采样全部线程的调用栈
+
+    :param path: 保存的文件, collapsed stack 格式: 线程;外层函数;...;内层函数 次数
+    :param interval: 采样间隔 (秒)
+    """
+
+    def __init__(self, path: Path, interval: float = 0.01):
+        self.path = Path(path)
+        self.interval = interval
+        self.samples: collections.Counter = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="profile_sampler", daemon=True
+        )
+
+    @staticmethod
+    def _thread_name(name: str) -> str:
+        """去掉线程名称末尾的序号, 同一线程池的线程合并在一起"""
+        return re.sub(r"[_-]*\d+(_\d+)*$", "", name) or name
+
+    @staticmethod
+    def _frame_name(frame) -> str:
+        code = frame.f_code
+        return f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})"
+
+    def sample(self):
+        _names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == self._thread.ident:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._frame_name(frame))
+                frame = frame.f_back
+            stack.append(self._thread_name(_names.get(ident, str(ident))))
+            self.samples[";".join(reversed(stack))] += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def start(self) -> "Sampler":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.path.open("w", encoding="utf-8") as fs:
+            for stack, count in self.samples.most_common():
+                fs.write(f"{stack} {count}\n")
+        logger.info(f"调用栈采样已保存: {self.path}, 共 {self.samples.total()} 个")
+
+
+def report(elapsed: float | None = None):
+    """输出各阶段的耗时"""
+    from rich.console import Console
+    from rich.table import Table
+
+    table = Table(
+        title="Profile" + (f" - 总耗时 {elapsed:.2f}s" if elapsed is not None else ""),
+        caption="累计耗时为全部线程的总和, 包括嵌套的阶段",
+    )
+    table.add_column("Stage")
+    table.add_column("Count", justify="right")
+    table.add_column("Total(s)", justify="right")
+    table.add_column("Avg(ms)", justify="right")
+    table.add_column("Max(ms)", justify="right")
+    with _lock:
+        _rows = sorted(_stages.items(), key=lambda x: -x[1][1])
+    for name, (count, total, _max) in _rows:
+        table.add_row(
+            name,
+            str(count),
+            f"{total:.3f}",
+            f"{total / count * 1000:.1f}",
+            f"{_max * 1000:.1f}",
+        )
+    Console(stderr=True).print(table)
+
+
+@contextlib.contextmanager
+def profiling(enable=True, output: Path | None = None, interval: float = 0.01):
+    """在 with 中开启阶段计时, 退出时输出; output 不为空时同时采样调用栈"""
+    global _enabled
+    if not enable and output is None:
+        yield
+        return
+
+    _enabled = True
+    _stages.clear()
+    sampler = Sampler(output, interval).start() if output is not None else None
+    _start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _enabled = False
+        if sampler is not None:
+            sampler.stop()
+        report(time.perf_counter() - _start)
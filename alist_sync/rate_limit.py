@@ -0,0 +1,175 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+@File Name  : rate_limit.py
+@Author     : LeeCQ
+@Date-Time  : 2024/3/20 20:30
+
+按服务器与 API 类别限制请求速率 (QPS)。
+
+每个服务器的每类 API 一个令牌桶，以 qps 的速率补充，最多累积 burst 个令牌。
+限速在 httpx 的 request 事件钩子中进行，早于占用连接池的名额，
+同步客户端与异步客户端共用同一个令牌桶。
+
+传输限速 (Throttle) 使用同样的令牌桶，令牌为字节: 每个分块按大小预支令牌，
+预支按先后顺序排队，同时传输的Worker平分带宽。
+"""
+
+import asyncio
+import logging
+import threading
+import time
+
+from httpx import Request, URL
+
+logger = logging.getLogger("alist-sync.rate-limit")
+
+__all__ = [
+    "TokenBucket",
+    "RateLimiter",
+    "Throttle",
+    "bandwidth_bucket",
+    "api_family",
+    "API_FAMILIES",
+]
+
+# API 类别: 请求路径前缀
+API_FAMILIES: dict[str, tuple[str, ...]] = {
+    "list": ("/api/fs/list", "/api/fs/dirs"),
+    "get": ("/api/fs/get", "/d/", "/p/"),
+    "put": (
+        "/api/fs/put",
+        "/api/fs/form",
+        "/api/fs/mkdir",
+        "/api/fs/copy",
+        "/api/fs/move",
+        "/api/fs/rename",
+    ),
+    "remove": ("/api/fs/remove",),
+}
+
+
+def api_family(path: str, base_path: str = "") -> str | None:
+    """请求路径所属的 API 类别, 不属于任何类别时返回 None
+
+    :param base_path: 服务器地址中的路径, 如 https://host/alist/ 中的 /alist
+    """
+    base_path = base_path.rstrip("/")
+    if base_path:
+        if not path.startswith(base_path + "/"):
+            return None
+        path = path[len(base_path) :]
+    for family, prefixes in API_FAMILIES.items():
+        if path.startswith(prefixes):
+            return family
+    return None
+
+
+class TokenBucket:
+    """令牌桶, 令牌可以预支: 取令牌时立即扣除, 返回需要等待的时间, 先到先得"""
+
+    def __init__(self, qps: float, burst: int = 1):
+        self.qps = qps
+        self.burst = max(burst, 1)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens: float = 1) -> float:
+        """取 tokens 个令牌, 返回需要等待的秒数"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._updated) * self.qps
+            )
+            self._updated = now
+            self._tokens -= tokens
+            return 0 if self._tokens >= 0 else -self._tokens / self.qps
+
+    def acquire(self, tokens: float = 1):
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def async_acquire(self, tokens: float = 1):
+        wait = self.reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class RateLimiter:
+    """一个服务器的限速器
+
+    :param base_url: 服务器地址, 重定向到其他主机的请求不限速
+    :param limits: {API 类别: (qps, burst)}, 没有配置的类别不限速
+    """
+
+    def __init__(self, base_url: str, limits: dict[str, tuple[float, int]]):
+        self.host = URL(base_url).host
+        self.port = URL(base_url).port
+        self.base_path = URL(base_url).path
+        self.buckets = {
+            family: TokenBucket(qps, burst)
+            for family, (qps, burst) in limits.items()
+            if qps and qps > 0
+        }
+
+    def family(self, request: Request) -> str | None:
+        """请求的 API 类别, 记录在 request.extensions 中供 metrics 使用"""
+        if request.url.host != self.host or request.url.port != self.port:
+            return None
+        family = api_family(request.url.path, self.base_path)
+        request.extensions["alist_sync_family"] = family
+        return family
+
+    def bucket(self, request: Request) -> TokenBucket | None:
+        family = self.family(request)
+        if not self.buckets:
+            return None
+        return self.buckets.get(family)
+
+    def hook(self, request: Request):
+        """同步客户端的 request 事件钩子"""
+        bucket = self.bucket(request)
+        if bucket is not None:
+            bucket.acquire()
+
+    async def async_hook(self, request: Request):
+        """异步客户端的 request 事件钩子"""
+        bucket = self.bucket(request)
+        if bucket is not None:
+            await bucket.async_acquire()
+
+
+def bandwidth_bucket(rate: int) -> TokenBucket | None:
+    """每秒 rate 字节的令牌桶, 最多累积 1 秒, rate <= 0 时不限速"""
+    if not rate or rate <= 0:
+        return None
+    return TokenBucket(rate, rate)
+
+
+class Throttle:
+    """传输限速, 每个分块同时从全部令牌桶中取令牌, 等待最久的一个
+
+    :param buckets: 全局、同步组、服务器的令牌桶, None 表示不限速
+    """
+
+    def __init__(self, *buckets: TokenBucket | None):
+        self.buckets = [b for b in buckets if b is not None]
+
+    def __bool__(self):
+        return bool(self.buckets)
+
+    def reserve(self, size: int) -> float:
+        return max((b.reserve(size) for b in self.buckets), default=0)
+
+    def wait(self, size: int):
+        """传输 size 字节前调用"""
+        wait = self.reserve(size)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def async_wait(self, size: int):
+        wait = self.reserve(size)
+        if wait > 0:
+            await asyncio.sleep(wait)
@@ -0,0 +1,168 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+@File Name  : scheduler.py
+@Author     : LeeCQ
+@Date-Time  : 2024/3/21 20:15
+
+Worker 调度队列，代替 Checker 与 Workers 之间的 FIFO 队列。
+
+Checker 放入 Worker，Workers 在有空闲线程时取出，取出的顺序由策略决定:
+    fifo:        按放入的顺序
+    small-first: 小文件优先
+    large-first: 大文件优先
+    lanes:       按文件大小分为多个车道，车道之间轮流取出，
+                 每个车道可以限制同时运行的数量，避免大文件占满全部线程
+
+priority 中的路径模式 (fnmatch, 匹配相对路径) 优先于以上策略，越靠前越优先。
+文件大小来自 Checker 创建 Worker 时已知的源文件大小，删除任务的大小视为 0。
+
+上次运行中未完成的 Worker 以 urgent 放入, 排在全部新的检查结果之前。
+
+全部 Checker 结束后调用 close, 队列取空后 get 返回 None, Workers 随即退出。
+"""
+
+import bisect
+import fnmatch
+import heapq
+import itertools
+import threading
+from queue import Empty, Full
+from typing import TYPE_CHECKING, Literal
+
+if TYPE_CHECKING:
+    from alist_sync.d_worker import Worker
+
+__all__ = ["WorkerScheduler", "SchedulePolicy"]
+
+SchedulePolicy = Literal["fifo", "small-first", "large-first", "lanes"]
+
+
+class WorkerScheduler:
+    """线程安全的 Worker 优先队列, 接口与 queue.Queue 相同
+
+    :param policy: 调度策略
+    :param lanes: lanes 策略的大小分界 (字节), n 个分界划分出 n + 1 个车道
+    :param lane_limits: 每个车道同时运行的最大数量, 0 或缺省表示不限
+    :param priority: 优先的相对路径模式
+    :param max_queued: 队列的最大长度, 0 表示不限; 队列越长, 可以参与排序的 Worker 越多
+    """
+
+    def __init__(
+        self,
+        policy: SchedulePolicy = "fifo",
+        lanes: list[int] = (),
+        lane_limits: list[int] = (),
+        priority: list[str] = (),
+        max_queued: int = 1000,
+    ):
+        self.policy = policy
+        self.lanes = sorted(lanes) if policy == "lanes" else []
+        self.lane_limits = [
+            (lane_limits[i] if i < len(lane_limits) else 0) or 0
+            for i in range(len(self.lanes) + 1)
+        ]
+        self.priority = list(priority)
+        self.max_queued = max_queued
+
+        self._heaps: list[list] = [[] for _ in self.lane_limits]
+        self._running = [0 for _ in self.lane_limits]
+        self._worker_lane: dict[int, int] = {}
+        self._next_lane = 0
+        self._size = 0
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def _rank(self, worker: "Worker") -> int:
+        path = worker.relative_path or ""
+        for i, pattern in enumerate(self.priority):
+            if fnmatch.fnmatchcase(path, pattern):
+                return i
+        return len(self.priority)
+
+    def _key(self, worker: "Worker", size: int, urgent: bool) -> tuple:
+        _rank = (0 if urgent else 1, self._rank(worker))
+        if self.policy == "small-first":
+            return *_rank, size
+        if self.policy == "large-first":
+            return *_rank, -size
+        return _rank
+
+    def _pick(self) -> int | None:
+        """选出下一个取出的车道: 优先级最高的队首, 相同时从上次之后的车道轮流"""
+        _lanes = len(self._heaps)
+        candidates = [
+            i
+            for i, heap in enumerate(self._heaps)
+            if heap
+            and not (self.lane_limits[i] and self._running[i] >= self.lane_limits[i])
+        ]
+        if not candidates:
+            return None
+        return min(
+            candidates,
+            key=lambda i: (
+                self._heaps[i][0][0][:2],
+                (i - self._next_lane) % _lanes,
+            ),
+        )
+
+    def put(self, worker: "Worker", block=True, timeout=None, urgent=False):
+        size = (worker.file_size or 0) if worker.type in ("copy", "move") else 0
+        with self._cond:
+            if self.max_queued > 0 and not self._cond.wait_for(
+                lambda: self._size < self.max_queued,
+                timeout if block else 0,
+            ):
+                raise Full
+            lane = bisect.bisect_right(self.lanes, size)
+            heapq.heappush(
+                self._heaps[lane],
+                (self._key(worker, size, urgent), next(self._seq), worker),
+            )
+            self._size += 1
+            self._cond.notify_all()
+
+    def get(self, block=True, timeout=None) -> "Worker | None":
+        """取出一个 Worker, 计入所在车道的运行数量, 运行结束后需要调用 done
+
+        已经 close 且队列为空时返回 None
+        """
+        with self._cond:
+            if not self._cond.wait_for(
+                lambda: self._pick() is not None or (self._closed and not self._size),
+                timeout if block else 0,
+            ):
+                raise Empty
+            lane = self._pick()
+            if lane is None:
+                return None
+            _, _, worker = heapq.heappop(self._heaps[lane])
+            self._next_lane = (lane + 1) % len(self._heaps)
+            self._running[lane] += 1
+            self._worker_lane[id(worker)] = lane
+            self._size -= 1
+            self._cond.notify_all()
+            return worker
+
+    def done(self, worker: "Worker"):
+        """Worker 运行结束, 释放车道的运行名额"""
+        with self._cond:
+            lane = self._worker_lane.pop(id(worker), None)
+            if lane is not None:
+                self._running[lane] -= 1
+                self._cond.notify_all()
+
+    def close(self):
+        """不再放入新的 Worker"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def qsize(self) -> int:
+        with self._cond:
+            return self._size
+
+    def empty(self) -> bool:
+        return self.qsize() == 0
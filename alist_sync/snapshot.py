@@ -0,0 +1,118 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+"""
+@File Name  : snapshot.py
+@Author     : LeeCQ
+@Date-Time  : 2024/3/17 16:40
+
+双向同步(sync)的基准快照
+
+每个同步组的每个相对目录保存一行:
+    entries:  上次全部成员一致时，每个文件在每个成员上的 [大小, 修改时间]，
+              计划了复制时另有 pending:
+              {from: 源成员, sig: 源文件的 [大小, 修改时间], to: {目标成员: 计划时的 [大小, 修改时间]}}
+    subdirs:  上次遍历时存在的子目录名称
+    dirs_sig: 上次一致时，该目录在每个成员上的修改时间
+    clean:    该目录中没有未完成的操作
+
+clean 且 dirs_sig 与本次列表一致时，跳过该目录中文件的对比。
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import NamedTuple, Iterable
+
+logger = logging.getLogger("alist-sync.snapshot")
+
+__all__ = ["BaseSnapshot", "SnapshotRow", "Entries"]
+
+# {文件名: {成员URI: [大小, 修改时间戳], "pending": 计划的复制}}
+Entries = dict[str, dict[str, list[float] | dict]]
+
+
+class SnapshotRow(NamedTuple):
+    update_time: float
+    clean: bool
+    dirs_sig: dict[str, float]
+    subdirs: list[str]
+    entries: Entries
+
+
+class BaseSnapshot:
+    """保存在SQLite中的基准快照"""
+
+    def __init__(self, db_file: Path):
+        self._conn = sqlite3.connect(
+            db_file, check_same_thread=False, isolation_level=None
+        )
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS base ("
+                "sync_group TEXT NOT NULL, path TEXT NOT NULL, "
+                "update_time REAL NOT NULL, clean INTEGER NOT NULL, "
+                "dirs_sig TEXT NOT NULL, subdirs TEXT NOT NULL, entries TEXT NOT NULL, "
+                "PRIMARY KEY (sync_group, path))"
+            )
+
+    def get(self, group: str, relative_path: str) -> SnapshotRow | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT update_time, clean, dirs_sig, subdirs, entries FROM base "
+                "WHERE sync_group = ? AND path = ?",
+                (group, relative_path),
+            ).fetchone()
+        if row is None:
+            return None
+        return SnapshotRow(row[0], bool(row[1]), *map(json.loads, row[2:]))
+
+    def put(
+        self,
+        group: str,
+        relative_path: str,
+        entries: Entries,
+        subdirs: Iterable[str],
+        dirs_sig: dict[str, float],
+        clean: bool,
+    ):
+        """写入一个目录的基准"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO base VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    group,
+                    relative_path,
+                    time.time(),
+                    int(clean),
+                    json.dumps(dirs_sig),
+                    json.dumps(sorted(subdirs), ensure_ascii=False),
+                    json.dumps(entries, ensure_ascii=False),
+                ),
+            )
+
+    def invalidate(self, group: str, relative_path: str):
+        """目录在下次运行时需要重新对比"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE base SET clean = 0 WHERE sync_group = ? AND path = ?",
+                (group, relative_path),
+            )
+
+    def delete(self, group: str, relative_path: str):
+        """删除目录及其全部子目录的基准"""
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM base WHERE sync_group = ? "
+                "AND (path = ? OR substr(path, 1, ?) = ?)",
+                (group, relative_path, len(relative_path) + 1, relative_path + "/"),
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
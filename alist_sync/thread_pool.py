@@ -1,16 +1,54 @@
-import time
+import threading
 from concurrent.futures import ThreadPoolExecutor
 
+from alist_sync import metrics
+
 
 class MyThreadPoolExecutor(ThreadPoolExecutor):
+    """记录未完成的任务数量, 等待由完成回调唤醒, 不再轮询"""
+
+    def __init__(self, *args, max_queued: int = 10, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._pending = 0
+        self._pending_cond = threading.Condition()
+        # submit_wait: 运行中与排队中的任务总数上限
+        self._slots = threading.Semaphore(self._max_workers + max_queued)
+        metrics.register_pool(self._thread_name_prefix, self)
+
+    def _task_done(self, _future):
+        with self._pending_cond:
+            self._pending -= 1
+            self._pending_cond.notify_all()
+
+    def submit(self, __fn, *args, **kwargs):
+        with self._pending_cond:
+            self._pending += 1
+        try:
+            future = super().submit(__fn, *args, **kwargs)
+        except BaseException:
+            self._task_done(None)
+            raise
+        future.add_done_callback(self._task_done)
+        return future
+
     def work_qsize(self):
         return self._work_queue.qsize()
 
+    def pending(self) -> int:
+        return self._pending
+
     def wait(self):
-        while self._work_queue.qsize():
-            time.sleep(3)
+        """等待已提交的任务全部完成"""
+        with self._pending_cond:
+            self._pending_cond.wait_for(lambda: self._pending == 0)
 
     def submit_wait(self, __fn, *args, **kwargs):
-        while self._work_queue.qsize() > 10:
-            time.sleep(5)
-        return self.submit(__fn, *args, **kwargs)
+        """排队的任务过多时阻塞, 直到有任务完成"""
+        self._slots.acquire()
+        try:
+            future = self.submit(__fn, *args, **kwargs)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _f: self._slots.release())
+        return future
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@File Name  : benchmark.py
+@Author     : LeeCQ
+@Date-Time  : 2024/3/25 20:30
+
+端到端性能基准，使用 fake_alist 替身服务器，不需要真实的AList。
+
+生成合成的目录树 (deep, wide, many-small, few-huge) 到源服务器的 /src，
+目标服务器的 /dst 为空，源与目标是两个服务器，文件经过下载与上传，分阶段测量:
+    scan:   d_main.scaner 遍历源目录
+    check:  d_main.main_check, 全部文件需要复制
+    sync:   d_main.main, 传输全部文件, 完成后比较两边的文件
+    resync: 再次 d_main.main, 目录已经一致, 只有检查
+
+替身服务器运行在当前进程中，每个阶段在独立的子进程中运行 (配置与登录状态是进程级的)，
+耗时由子进程测量，不包括启动解释器与导入的时间。
+
+    python -m tests.benchmark [deep wide ...] [--scale 1] [--latency 0.005]
+                              [--output result.json] [--baseline result.json]
+
+pytest 中默认跳过，设置 ALIST_SYNC_BENCHMARK=1 运行 tests/test_benchmark.py。
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable
+
+if __package__ in (None, ""):
+    sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from tests.fake_alist import FakeAlist
+
+__all__ = ["TREES", "PHASES", "run_tree", "format_results"]
+
+PHASES = ["scan", "check", "sync", "resync"]
+PROJECT_DIR = Path(__file__).parent.parent
+
+
+def _write(path: Path, size: int):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(os.urandom(size))
+
+
+def tree_deep(root: Path, scale: float):
+    """4 个分支, 每个分支 25 层, 每层 2 个小文件"""
+    for b in range(4):
+        _dir = root.joinpath(f"branch{b}")
+        for level in range(max(1, int(25 * scale))):
+            _dir = _dir.joinpath(f"l{level}")
+            for i in range(2):
+                _write(_dir.joinpath(f"f{i}.txt"), 512)
+
+
+def tree_wide(root: Path, scale: float):
+    """一个目录中 2000 个文件"""
+    for i in range(max(1, int(2000 * scale))):
+        _write(root.joinpath("wide", f"f{i:05d}.txt"), 256)
+
+
+def tree_many_small(root: Path, scale: float):
+    """20 个目录, 每个 100 个 1-4KiB 的文件"""
+    for d in range(20):
+        for i in range(max(1, int(100 * scale))):
+            _write(root.joinpath(f"d{d:02d}", f"f{i:03d}.txt"), 1024 * (1 + i % 4))
+
+
+def tree_few_huge(root: Path, scale: float):
+    """4 个 32MiB 的文件"""
+    for i in range(4):
+        _write(root.joinpath(f"huge{i}.bin"), max(1, int(32 * 1024 * 1024 * scale)))
+
+
+TREES: dict[str, Callable[[Path, float], None]] = {
+    "deep": tree_deep,
+    "wide": tree_wide,
+    "many-small": tree_many_small,
+    "few-huge": tree_few_huge,
+}
+
+
+def _config(workdir: Path, phase: str, source: str, target: str, mode: str) -> Path:
+    # resync 复用 sync 的缓存目录, 与再次运行时相同
+    cache = workdir.joinpath("cache_sync" if phase == "resync" else f"cache_{phase}")
+    config = workdir.joinpath(f"config_{phase}.yaml")
+    servers = "".join(
+        f"  - base_url: {url}/\n" f"    username: admin\n" f'    password: "123456"\n'
+        for url in (source, target)
+    )
+    config.write_text(
+        f"cache_dir: {cache.as_posix()}\n"
+        f"timeout: 60\n"
+        f"daemon: false\n"
+        f"alist_servers:\n{servers}"
+        f"sync_groups:\n"
+        f"  - name: benchmark\n"
+        f"    type: copy\n"
+        f"    transfer_mode: {mode}\n"
+        f"    group:\n"
+        f"      - {source}/src\n"
+        f"      - {target}/dst\n",
+        encoding="utf-8",
+    )
+    return config
+
+
+def _run_phase(phase: str, config: Path, engine: str) -> dict:
+    """在子进程中运行, 打印一行JSON结果"""
+    import builtins
+
+    from alist_sync.config import Config
+
+    builtins.sync_config = Config.load_from_yaml(config)
+
+    from alist_sync import d_main
+
+    d_main.login_groups()
+    result = {}
+    _start = time.perf_counter()
+    if phase == "scan":
+        from queue import Queue
+
+        from alist_sdk import AlistPath
+
+        _queue = Queue()
+        d_main.scaner(AlistPath(builtins.sync_config.sync_groups[0].group[0]), _queue)
+        result["found"] = _queue.qsize()
+    elif phase == "check":
+        d_main.main_check()
+    else:
+        d_main.main(engine)
+    result["elapsed"] = time.perf_counter() - _start
+    return result
+
+
+def _spawn(phase: str, config: Path, engine: str) -> dict:
+    env = dict(os.environ, PYTHONPATH=str(PROJECT_DIR))
+    proc = subprocess.run(
+        [sys.executable, "-m", "tests.benchmark", "--phase", phase]
+        + ["--phase-config", str(config), "--engine", engine],
+        cwd=config.parent,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"{phase} 失败:\n{proc.stderr[-4000:]}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def _files(root: Path) -> dict[str, bytes]:
+    return {
+        p.relative_to(root).as_posix(): p.read_bytes()
+        for p in root.rglob("*")
+        if p.is_file()
+    }
+
+
+def run_tree(
+    tree: str,
+    workdir: Path,
+    scale: float = 1,
+    latency: float = 0.0,
+    bandwidth: int | None = None,
+    engine: str = "thread",
+    transfer_mode: str = "file",
+    phases: list[str] = PHASES,
+) -> dict:
+    """生成目录树, 依次运行各阶段, 返回 {阶段: 结果}"""
+    workdir = Path(workdir)
+    source_root, target_root = workdir / "source", workdir / "target"
+    TREES[tree](source_root.joinpath("src"), scale)
+    target_root.joinpath("dst").mkdir(parents=True, exist_ok=True)
+
+    _sizes = [p.stat().st_size for p in source_root.rglob("*") if p.is_file()]
+    files, size = len(_sizes), sum(_sizes)
+    dirs = sum(1 for p in source_root.joinpath("src").rglob("*") if p.is_dir())
+
+    results = {}
+    with (
+        FakeAlist(source_root, latency, bandwidth) as source,
+        FakeAlist(target_root, latency, bandwidth) as target,
+    ):
+        for phase in phases:
+            source.counter.clear()
+            target.counter.clear()
+            config = _config(
+                workdir, phase, source.base_url, target.base_url, transfer_mode
+            )
+            result = _spawn(phase, config, engine)
+            result.update(
+                files=files,
+                dirs=dirs,
+                bytes=size if phase == "sync" else 0,
+                requests=sum(source.counter.values()) + sum(target.counter.values()),
+            )
+            if phase == "sync":
+                result["verified"] = _files(source_root / "src") == _files(
+                    target_root / "dst"
+                )
+            results[phase] = result
+    return results
+
+
+def format_results(results: dict[str, dict], baseline: dict | None = None) -> str:
+    """{树: {阶段: 结果}} 格式化为表格, 有 baseline 时给出耗时的变化"""
+    lines = [
+        f"{'tree':<12}{'phase':<8}{'elapsed':>10}{'files/s':>10}"
+        f"{'MiB/s':>10}{'requests':>10}{'change':>9}"
+    ]
+    for tree, phases in results.items():
+        for phase, r in phases.items():
+            _elapsed = max(r["elapsed"], 1e-9)
+            _change = ""
+            _base = (baseline or {}).get(tree, {}).get(phase)
+            if _base:
+                _change = f"{(r['elapsed'] / _base['elapsed'] - 1) * 100:+.1f}%"
+            lines.append(
+                f"{tree:<12}{phase:<8}{r['elapsed']:>9.2f}s"
+                f"{r['files'] / _elapsed:>10.1f}"
+                f"{r['bytes'] / 1024 / 1024 / _elapsed:>10.2f}"
+                f"{r['requests']:>10}{_change:>9}"
+            )
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="alist-sync 端到端性能基准")
+    parser.add_argument("trees", nargs="*", help=f"可选: {', '.join(TREES)}")
+    parser.add_argument("--scale", type=float, default=1, help="目录树的规模倍数")
+    parser.add_argument("--latency", type=float, default=0, help="每个API请求的延迟")
+    parser.add_argument("--bandwidth", type=int, default=0, help="服务器带宽 字节/秒")
+    parser.add_argument("--engine", default="thread", choices=["thread", "async"])
+    parser.add_argument("--transfer-mode", default="file", choices=["file", "stream"])
+    parser.add_argument("--output", type=Path, help="结果保存为JSON")
+    parser.add_argument("--baseline", type=Path, help="与之前保存的结果比较")
+    parser.add_argument("--phase", choices=PHASES, help=argparse.SUPPRESS)
+    parser.add_argument("--phase-config", type=Path, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.phase:
+        print(json.dumps(_run_phase(args.phase, args.phase_config, args.engine)))
+        return
+    for tree in args.trees:
+        if tree not in TREES:
+            parser.error(f"未知的目录树: {tree}, 可选: {', '.join(TREES)}")
+
+    results = {}
+    for tree in args.trees or TREES:
+        with tempfile.TemporaryDirectory(prefix=f"alist-sync-bench-{tree}-") as _d:
+            results[tree] = run_tree(
+                tree,
+                Path(_d),
+                args.scale,
+                args.latency,
+                args.bandwidth or None,
+                args.engine,
+                args.transfer_mode,
+            )
+    baseline = json.loads(args.baseline.read_text()) if args.baseline else None
+    print(format_results(results, baseline))
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@File Name  : conftest.py
+@Author     : LeeCQ
+@Date-Time  : 2024/3/28 20:00
+"""
+
+import builtins
+
+import pytest
+
+from alist_sync.config import Config
+
+
+@pytest.fixture(scope="session")
+def sync_config(tmp_path_factory):
+    """没有 config.yaml 时使用临时目录中的空配置, 不连接服务器
+
+    导入 d_checker、d_worker 等模块的测试需要, 在测试函数中导入这些模块
+    """
+    if not hasattr(builtins, "sync_config"):
+        _dir = tmp_path_factory.mktemp("sync_config")
+        _config = _dir.joinpath("config.yaml")
+        _config.write_text(f"cache_dir: {_dir.as_posix()}\n", encoding="utf-8")
+        builtins.sync_config = Config.load_from_yaml(_config)
+    return builtins.sync_config
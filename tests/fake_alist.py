@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@File Name  : fake_alist.py
+@Author     : LeeCQ
+@Date-Time  : 2024/3/16 14:20
+
+一个进程内的AList替身服务器，使用一个本地目录模拟存储，
+实现 fs/list, fs/get, fs/put, fs/remove, fs/copy, fs/move, fs/rename, fs/mkdir,
+复制任务接口以及带Range的下载，并支持配置延迟与带宽。
+"""
+
+import collections
+import datetime
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import urllib.parse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from pathlib import Path
+
+__all__ = ["FakeAlist"]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # 响应头与响应体分两次写出, 关闭 Nagle 避免与客户端的延迟确认叠加
+    disable_nagle_algorithm = True
+    server: "_Server"
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def alist(self) -> "FakeAlist":
+        return self.server.alist
+
+    def _send_json(self, data: dict, status=200):
+        body = json.dumps(data, ensure_ascii=False).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _resp(self, data=None, code=200, message="success"):
+        return self._send_json({"code": code, "message": message, "data": data})
+
+    def _read_body(self) -> bytes:
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int(self.rfile.readline().strip().split(b";")[0], 16)
+                if size == 0:
+                    self.rfile.readline()
+                    break
+                chunks.append(self.alist.throttle(self.rfile.read(size)))
+                self.rfile.readline()
+            return b"".join(chunks)
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.alist.throttle(self.rfile.read(length)) if length else b""
+
+    def _json(self) -> dict:
+        body = self._read_body()
+        return json.loads(body) if body else {}
+
+    def do_GET(self):
+        self.alist.hit(self.path.split("?")[0])
+        if self.path.startswith("/d/"):
+            return self._download()
+        if self.path == "/api/me":
+            return self._resp(self.alist.me())
+        if self.path.startswith("/api/admin/task/copy/"):
+            return self._resp(self.alist.tasks(self.path.endswith("/undone")))
+        return self._resp(code=404, message="not found")
+
+    def do_POST(self):
+        self.alist.hit(self.path)
+        try:
+            data = self._json()
+            handler = self.alist.routes.get(self.path)
+            if handler is None:
+                return self._resp(code=404, message="not found")
+            return self._resp(handler(data))
+        except FileNotFoundError as _e:
+            return self._resp(code=500, message=f"failed get objs: object not found")
+        except Exception as _e:
+            return self._resp(code=500, message=f"{type(_e).__name__}: {_e}")
+
+    def do_PUT(self):
+        self.alist.hit(self.path)
+        if self.path != "/api/fs/put":
+            return self._resp(code=404, message="not found")
+        path = urllib.parse.unquote_plus(self.headers.get("File-Path"))
+        modified = self.headers.get("Last-Modified")
+        data = self._read_body()
+        self.alist.put(path, data, int(modified) / 1000 if modified else None)
+        return self._resp()
+
+    def _download(self):
+        path = self.alist.local(urllib.parse.unquote(self.path[2:].split("?")[0]))
+        if not path.is_file():
+            return self._send_json({"code": 404}, 404)
+        size = path.stat().st_size
+        start, end = 0, size - 1
+        _range = self.headers.get("Range")
+        if _range and _range.startswith("bytes="):
+            _s, _, _e = _range[6:].partition("-")
+            start = int(_s or 0)
+            end = min(int(_e), size - 1) if _e else size - 1
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        else:
+            self.send_response(200)
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.send_header("Content-Type", "application/octet-stream")
+        self.end_headers()
+        with path.open("rb") as fs:
+            fs.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = fs.read(min(64 * 1024, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                self.wfile.write(self.alist.throttle(chunk))
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    alist: "FakeAlist"
+
+
+class FakeAlist:
+    """进程内的AList替身服务
+
+    :param root: 作为存储的本地目录
+    :param latency: 每个API请求的固定延迟 (秒)
+    :param bandwidth: 上传与下载的带宽 (字节/秒), None 不限速
+    :param hash_info: 是否在文件信息中返回SHA1
+    """
+
+    def __init__(
+        self,
+        root: Path,
+        latency: float = 0.0,
+        bandwidth: int | None = None,
+        hash_info=False,
+        host="127.0.0.1",
+        port=0,
+    ):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.hash_info = hash_info
+        self.counter: collections.Counter = collections.Counter()
+        self._tasks: dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self._server = _Server((host, port), _Handler)
+        self._server.alist = self
+        self._thread: threading.Thread | None = None
+        self.routes = {
+            "/api/auth/login": lambda _: {"token": "fake-token"},
+            "/api/fs/list": self.fs_list,
+            "/api/fs/get": self.fs_get,
+            "/api/fs/mkdir": self.mkdir,
+            "/api/fs/remove": self.remove,
+            "/api/fs/copy": self.copy,
+            "/api/fs/move": self.move,
+            "/api/fs/rename": self.rename,
+        }
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeAlist":
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="fake_alist", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *_):
+        self.stop()
+
+    def hit(self, endpoint: str):
+        with self._lock:
+            self.counter[endpoint] += 1
+        if self.latency and not endpoint.startswith("/d/"):
+            time.sleep(self.latency)
+
+    def throttle(self, chunk: bytes) -> bytes:
+        if self.bandwidth:
+            time.sleep(len(chunk) / self.bandwidth)
+        return chunk
+
+    def local(self, path: str) -> Path:
+        parts = [p for p in str(path).split("/") if p not in ("", ".", "..")]
+        return self.root.joinpath(*parts)
+
+    @staticmethod
+    def me():
+        return {
+            "id": 1,
+            "username": "admin",
+            "password": "",
+            "base_path": "/",
+            "role": 2,
+            "disabled": False,
+            "permission": 0,
+            "sso_id": "",
+            "otp": False,
+        }
+
+    def item(self, path: Path) -> dict:
+        st = path.stat()
+        _hash = None
+        if self.hash_info and path.is_file():
+            _hash = {"sha1": hashlib.sha1(path.read_bytes()).hexdigest()}
+        return {
+            "name": path.name,
+            "size": 0 if path.is_dir() else st.st_size,
+            "is_dir": path.is_dir(),
+            "modified": datetime.datetime.fromtimestamp(
+                st.st_mtime, datetime.timezone.utc
+            ).isoformat(),
+            "created": datetime.datetime.fromtimestamp(
+                st.st_ctime, datetime.timezone.utc
+            ).isoformat(),
+            "sign": "",
+            "thumb": "",
+            "type": 1 if path.is_dir() else 0,
+            "hashinfo": json.dumps(_hash) if _hash else "null",
+            "hash_info": _hash,
+        }
+
+    def fs_list(self, data: dict):
+        path = self.local(data["path"])
+        if not path.is_dir():
+            raise FileNotFoundError(data["path"])
+        content = [self.item(p) for p in sorted(path.iterdir())]
+        return {
+            "content": content,
+            "total": len(content),
+            "readme": "",
+            "header": "",
+            "write": True,
+            "provider": "Local",
+        }
+
+    def fs_get(self, data: dict):
+        path = self.local(data["path"])
+        if not path.exists():
+            raise FileNotFoundError(data["path"])
+        _item = self.item(path)
+        _item.update(
+            raw_url=f"{self.base_url}/d{urllib.parse.quote(data['path'])}",
+            readme="",
+            provider="Local",
+            related=None,
+        )
+        return _item
+
+    def put(self, path: str, data: bytes, modified: float | None):
+        local = self.local(path)
+        local.parent.mkdir(parents=True, exist_ok=True)
+        local.write_bytes(data)
+        if modified:
+            os.utime(local, (modified, modified))
+
+    def mkdir(self, data: dict):
+        self.local(data["path"]).mkdir(parents=True, exist_ok=True)
+
+    def remove(self, data: dict):
+        for name in data["names"]:
+            p = self.local(data["dir"]).joinpath(name)
+            if p.is_dir():
+                shutil.rmtree(p)
+            elif p.exists():
+                p.unlink()
+
+    def move(self, data: dict):
+        dst = self.local(data["dst_dir"])
+        dst.mkdir(parents=True, exist_ok=True)
+        for name in data["names"]:
+            src = self.local(data["src_dir"]).joinpath(name)
+            if not src.exists():
+                raise FileNotFoundError(src)
+            src.rename(dst.joinpath(name))
+
+    def rename(self, data: dict):
+        src = self.local(data["path"])
+        if not src.exists():
+            raise FileNotFoundError(src)
+        src.rename(src.with_name(data["name"]))
+
+    def copy(self, data: dict):
+        """与较新的 AList 相同, 返回创建的任务"""
+        tasks = []
+        for name in data["names"]:
+            task_id = hashlib.sha1(f"{data}{name}{time.time()}".encode()).hexdigest()
+            src_dir, dst_dir = data["src_dir"], data["dst_dir"]
+            task = {
+                "id": task_id,
+                "name": f"copy [/]({src_dir.rstrip('/')}/{name}) to [/]({dst_dir})",
+                "state": 1,
+                "status": "running",
+                "progress": 0,
+                "error": "",
+            }
+            with self._lock:
+                self._tasks[task_id] = task
+            tasks.append(dict(task))
+            threading.Thread(
+                target=self._run_copy, args=(task, src_dir, dst_dir, name), daemon=True
+            ).start()
+        return {"tasks": tasks}
+
+    def _run_copy(self, task: dict, src_dir: str, dst_dir: str, name: str):
+        src = self.local(src_dir).joinpath(name)
+        dst = self.local(dst_dir).joinpath(name)
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            if self.bandwidth and src.is_file():
+                time.sleep(src.stat().st_size / self.bandwidth)
+            if src.is_dir():
+                shutil.copytree(src, dst, dirs_exist_ok=True)
+            else:
+                shutil.copy2(src, dst)
+            task.update(state=2, status="success", progress=100)
+        except Exception as _e:
+            task.update(state=3, status="failed", error=str(_e))
+
+    def tasks(self, undone: bool) -> list[dict]:
+        with self._lock:
+            return [
+                dict(t)
+                for t in self._tasks.values()
+                if (t["state"] in (0, 1)) == undone
+            ]
+
+
+if __name__ == "__main__":
+    import sys
+
+    with FakeAlist(Path(sys.argv[1] if len(sys.argv) > 1 else ".")) as _fa:
+        print(_fa.base_url)
+        threading.Event().wait()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@File Name  : test_alist_client.py
+@Author     : LeeCQ
+@Date-Time  : 2024/3/28 22:00
+
+服务器复制任务的匹配: 同一对路径上之前的任务不能当作本次的任务
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from alist_sdk import Task
+
+pytestmark = pytest.mark.usefixtures("sync_config")
+
+KEY = ("/a/f.txt", "/b")
+
+
+def _task(id_, status="success", error=""):
+    return Task(
+        id=id_,
+        name="copy [/a](/f.txt) to [/b](/)",
+        state=1 if status == "running" else 2,
+        status=status,
+        progress=100 if status == "success" else 0,
+        error=error,
+    )
+
+
+class _Client:
+    """cached_* 返回 cached 中的任务, 直接请求返回 done/undone 中的任务"""
+
+    def __init__(self, done=(), undone=(), cached=None):
+        from alist_sync.alist_client import AlistClient
+
+        self._task_rtype = AlistClient._task_rtype
+        self.done, self.undone = list(done), list(undone)
+        self.cached = cached
+
+    async def task_done(self, _):
+        return SimpleNamespace(code=200, data=self.done)
+
+    async def task_undone(self, _):
+        return SimpleNamespace(code=200, data=self.undone)
+
+    async def cached_task_done(self, _, rtype, __):
+        return 0, self._task_rtype(rtype, self.done if self.cached is None else [])
+
+    async def cached_task_undone(self, _, rtype, __):
+        _undone = self.undone if self.cached is None else self.cached
+        return 0, self._task_rtype(rtype, _undone)
+
+
+def _status(client, **kwargs):
+    from alist_sync.alist_client import get_status
+
+    return asyncio.run(get_status(KEY, client, **kwargs))
+
+
+def test_ignore_existing_tasks():
+    from alist_sync.alist_client import async_existing_copy_tasks
+
+    # 之前复制同一个文件失败的任务
+    client = _Client(done=[_task("old", "failed", "error")])
+    ignore = asyncio.run(async_existing_copy_tasks(client, KEY))
+    assert ignore == {"old"}
+    assert _status(client)[0] == "failed"
+    with pytest.raises(ValueError):
+        _status(client, ignore=ignore)
+
+    client.undone.append(_task("new", "running"))
+    assert _status(client, ignore=ignore)[0] == "running"
+    client.undone.clear()
+    client.done.append(_task("new"))
+    assert _status(client, ignore=ignore) == ("success", 100)
+
+
+def test_task_ids():
+    client = _Client(done=[_task("old"), _task("new", "failed", "error")])
+    assert _status(client)[0] == "failed"
+    assert _status(client, task_ids={"old"})[0] == "success"
+    with pytest.raises(ValueError):
+        _status(client, task_ids={"other"})
+
+
+def test_fresh():
+    """缓存在发起复制之前获取, 第一次查询跳过缓存"""
+    client = _Client(undone=[_task("new", "running")], cached=[])
+    with pytest.raises(ValueError):
+        _status(client)
+    assert _status(client, fresh=True)[0] == "running"
+
+
+def test_copy_task_ids():
+    from alist_sdk.models import ListTask
+
+    from alist_sync.alist_client import copy_task_ids
+
+    assert copy_task_ids(None) == set()
+    assert copy_task_ids({"tasks": [{"id": "a"}]}) == {"a"}
+    assert copy_task_ids(ListTask(tasks=[_task("b")])) == {"b"}
@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@File Name  : test_benchmark.py
+@Author     : LeeCQ
+@Date-Time  : 2024/3/25 21:10
+
+性能基准, 默认跳过:
+    ALIST_SYNC_BENCHMARK=1 [ALIST_SYNC_BENCHMARK_SCALE=0.2] pytest -s tests/test_benchmark.py
+"""
+
+import os
+
+import pytest
+
+from tests.benchmark import TREES, format_results, run_tree
+
+pytestmark = pytest.mark.skipif(
+    not os.getenv("ALIST_SYNC_BENCHMARK"), reason="设置 ALIST_SYNC_BENCHMARK=1 运行"
+)
+
+
+@pytest.mark.parametrize("tree", TREES)
+def test_benchmark(tree, tmp_path):
+    results = run_tree(
+        tree,
+        tmp_path,
+        scale=float(os.getenv("ALIST_SYNC_BENCHMARK_SCALE", 1)),
+        engine=os.getenv("ALIST_SYNC_ENGINE", "thread"),
+    )
+    print("\n" + format_results({tree: results}))
+
+    assert results["scan"]["found"] == results["scan"]["files"]
+    assert results["sync"]["verified"]
+    # 目录已经一致, 再次同步不下载、不上传
+    assert results["resync"]["requests"] < results["sync"]["requests"]
@@ -29,10 +29,50 @@ def test_asyncio_all_task_name():
         pytest.param({"name": Task(status="success")}, True, "dict-success"),
         pytest.param([], True, "list-[]"),
         pytest.param(
-            [Task(status="success"), Task(status="running")], False, "list-running",
+            [Task(status="success"), Task(status="running")],
+            False,
+            "list-running",
         ),
         pytest.param([Task()], False, "list-[init]"),
     ],
 )
 def test_is_task_all_success(tasks, status, desc):
     assert common.is_task_all_success(tasks) == status, desc
+
+
+def test_transfer_speed():
+    import datetime
+
+    start = datetime.datetime(2024, 3, 1, 12, 0, 0)
+    end = start + datetime.timedelta(seconds=2, milliseconds=500)
+    assert common.transfer_speed(5 * 1024 * 1024, start, end) == "2.00MB/s"
+    assert common.transfer_speed(None, start, end) == "0.00B/s"
+    assert common.transfer_speed(100, end, start) == "0.00B/s"
+
+
+def test_content_hash():
+    import hashlib
+
+    from alist_sdk.models import HashInfo
+
+    data = b"alist-sync" * 1000
+    _sha1, _md5 = hashlib.sha1(data).hexdigest(), hashlib.md5(data).hexdigest()
+
+    assert common.hash_info_dict(None) is None
+    assert common.hash_info_dict(HashInfo()) is None
+    expected = common.hash_info_dict(HashInfo(sha1=_sha1.upper(), md5=_md5))
+    assert expected == {"sha1": _sha1, "md5": _md5}
+
+    assert common.ContentHash.create(None) is None
+    hasher = common.ContentHash.create(expected)
+    assert hasher.name == "sha1"
+    for i in range(0, len(data), 4096):
+        hasher.update(data[i : i + 4096])
+    assert hasher.verify()
+    hasher.update(b"x")
+    assert not hasher.verify()
+
+    assert common.hash_match(expected, {"md5": _md5}) is True
+    assert common.hash_match(expected, {"sha1": "0" * 40, "md5": _md5}) is False
+    assert common.hash_match({"md5": _md5}, {"sha1": _sha1}) is None
+    assert common.hash_match(None, expected) is None
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@File Name  : test_data_handle.py
+@Author     : LeeCQ
+@Date-Time  : 2024/3/23 20:10
+"""
+
+from alist_sync.data_handle import ShelveHandle, WriteBehindHandle
+
+
+class _Worker:
+    def __init__(self, _id, status="init"):
+        self.id = _id
+        self.status = status
+
+    def model_dump(self, mode=None):
+        return {"id": self.id, "status": self.status}
+
+
+class _PathWorker(_Worker):
+    def model_dump(self, mode=None):
+        return super().model_dump() | {
+            "source_path": f"http://localhost:5244/src/{self.id}",
+            "target_path": f"http://localhost:5244/dst/{self.id}",
+            "tmp_file": None,
+        }
+
+
+class _Shelve(ShelveHandle):
+    def __init__(self, save_dir):
+        super().__init__(save_dir)
+        self.batches = []
+
+    def bulk_update_workers(self, updates, deletes):
+        updates, deletes = list(updates), list(deletes)
+        self.batches.append((len(updates), len(deletes)))
+        return super().bulk_update_workers(updates, deletes)
+
+
+def test_write_behind(tmp_path):
+    shelve = _Shelve(tmp_path)
+    handle = WriteBehindHandle(shelve, flush_interval=60)
+
+    workers = [_Worker(f"w{i}") for i in range(3)]
+    for status in ("init", "downloaded", "uploaded"):
+        for w in workers:
+            w.status = status
+            handle.update_worker(w, "status")
+    handle.delete_worker("w2")
+    assert shelve.batches == []
+
+    # 读取前写入, 同一Worker的多次更新合并为一次
+    assert sorted(w["status"] for w in handle.get_workers()) == ["uploaded"] * 2
+    assert shelve.batches == [(2, 1)]
+
+    workers[0].status = "done"
+    handle.update_worker(workers[0], "status")
+    handle.close()
+    assert shelve.get_worker("w0")["status"] == "done"
+    # 关闭后直接写入
+    handle.delete_worker("w0")
+    assert shelve.get_worker("w0") is None
+
+
+def test_write_behind_max_pending(tmp_path):
+    shelve = _Shelve(tmp_path)
+    handle = WriteBehindHandle(shelve, flush_interval=60, max_pending=2)
+    handle.update_worker(_Worker("a"))
+    handle.update_worker(_Worker("b"))
+    handle._thread.join(0.5)
+    assert shelve.batches == [(2, 0)]
+    handle.close()
+
+
+def test_sqlite_handle(tmp_path):
+    from alist_sdk import AlistPath, Item
+
+    from alist_sync.data_handle import SQLiteHandle
+
+    handle = SQLiteHandle(tmp_path.joinpath("state.sqlite"))
+    handle.bulk_update_workers([(_PathWorker(f"w{i}"), ()) for i in range(3)], [])
+    handle.update_worker(_PathWorker("w1", "downloaded"), "status")
+    handle.delete_worker("w2")
+
+    assert handle.get_worker("w1")["status"] == "downloaded"
+    assert handle.get_worker("w2") is None
+    assert [w["id"] for w in handle.get_workers({"status": "init"})] == ["w0"]
+    assert [w["id"] for w in handle.get_workers({"tmp_file": None})] == ["w0", "w1"]
+    assert handle.path_in_workers(AlistPath("http://localhost:5244/dst/w1"))
+    assert not handle.path_in_workers(AlistPath("http://localhost:5244/dst/w2"))
+    assert len(handle.load_locker()) == 4
+
+    path = AlistPath("http://localhost:5244/dst/a.txt")
+    item = Item(
+        name="a.txt",
+        size=10,
+        is_dir=False,
+        modified="2024-03-01T00:00:00",
+        created="2024-03-01T00:00:00",
+        sign="",
+        thumb="",
+        type=0,
+    )
+    handle.update_file_item(path, item)
+    assert handle.get_file_item(path)["size"] == 10
+    assert handle.get_file_items([path, AlistPath("http://localhost:5244/b")]) == {
+        path.as_uri(): item
+    }
+    handle.close()
+
+
+def test_import_shelve(tmp_path):
+    """旧版本的 Shelve 状态只导入一次, 不覆盖已有的记录"""
+    from alist_sdk import AlistPath, Item
+
+    from alist_sync.data_handle import SQLiteHandle
+
+    old = ShelveHandle(tmp_path)
+    old.update_worker(_PathWorker("w0", "downloaded"))
+    old.update_worker(_PathWorker("w1", "downloaded"))
+    path = AlistPath("http://localhost:5244/dst/a.txt")
+    old.update_file_item(
+        path,
+        Item(
+            name="a.txt",
+            size=10,
+            is_dir=False,
+            modified="2024-03-01T00:00:00",
+            created="2024-03-01T00:00:00",
+            sign="",
+            thumb="",
+            type=0,
+        ),
+    )
+    old.__del__()
+
+    handle = SQLiteHandle(tmp_path.joinpath("state.sqlite"))
+    handle.update_worker(_PathWorker("w1", "uploaded"))
+    assert handle.import_shelve(tmp_path) == 2
+    assert handle.get_worker("w0")["status"] == "downloaded"
+    assert handle.get_worker("w1")["status"] == "uploaded"
+    assert handle.get_file_item(path)["size"] == 10
+    assert not list(tmp_path.glob("*.shelve"))
+    assert handle.import_shelve(tmp_path) == 0
+    handle.close()
+
+
+def test_import_shelve_unreadable(tmp_path):
+    """无法读取时保留原文件"""
+    from alist_sync.data_handle import SQLiteHandle
+
+    tmp_path.joinpath("alist_cache_workers.shelve").write_bytes(b"broken")
+    handle = SQLiteHandle(tmp_path.joinpath("state.sqlite"))
+    assert handle.import_shelve(tmp_path) == 0
+    assert tmp_path.joinpath("alist_cache_workers.shelve").exists()
+    handle.close()
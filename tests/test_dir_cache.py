@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@File Name  : test_dir_cache.py
+@Author     : LeeCQ
+@Date-Time  : 2024/3/16 11:02
+"""
+
+import datetime
+import threading
+import time
+
+from alist_sdk import AlistPath, Item
+
+from alist_sync.dir_cache import DirCache
+
+
+def _item(name, is_dir=False):
+    return Item(
+        name=name,
+        size=0 if is_dir else 10,
+        is_dir=is_dir,
+        modified=datetime.datetime.now(),
+        created=datetime.datetime.now(),
+        sign="",
+        thumb="",
+        type=1 if is_dir else 0,
+    )
+
+
+def test_list_dir_once(monkeypatch):
+    calls = []
+
+    def fetch(path, missing_ok=True):
+        calls.append(path.as_posix())
+        time.sleep(0.1)
+        return {"a.txt": _item("a.txt"), "b": _item("b", True)}
+
+    cache = DirCache()
+    monkeypatch.setattr(cache, "fetch", fetch)
+    root = AlistPath("http://localhost:5244/local")
+
+    threads = [
+        threading.Thread(target=cache.get_item, args=(root.joinpath(f),))
+        for f in ("a.txt", "b", "c.txt") * 5
+    ]
+    [t.start() for t in threads]
+    [t.join() for t in threads]
+
+    assert calls == ["/local"]
+    assert cache.get_item(root.joinpath("a.txt")).size == 10
+    assert cache.get_item(root.joinpath("c.txt")) is None
+    assert cache.misses == 1
+
+
+def test_set_dir(monkeypatch):
+    cache = DirCache()
+    monkeypatch.setattr(cache, "fetch", lambda path, missing_ok=True: {})
+    root = AlistPath("http://localhost:5244/local/")
+    cache.set_dir(root, [_item("x")])
+    assert root in cache
+    assert list(cache.list_dir(AlistPath("http://localhost:5244/local"))) == ["x"]
+    cache.discard(root)
+    assert cache.list_dir(root) == {}
+
+
+def test_dir_store(tmp_path, monkeypatch):
+    from alist_sync.dir_cache import DirStore
+
+    modified = datetime.datetime(2024, 3, 1, tzinfo=datetime.timezone.utc)
+    root = AlistPath("http://localhost:5244/local")
+    store = DirStore(tmp_path / "dirs.sqlite")
+
+    cache = DirCache(store, ttl=60)
+    monkeypatch.setattr(
+        cache, "fetch", lambda path, missing_ok=True: {"a.txt": _item("a.txt")}
+    )
+    cache.list_dir(root, modified)
+
+    cache = DirCache(store, ttl=60)
+    monkeypatch.setattr(cache, "fetch", lambda path, missing_ok=True: {})
+    # 只在父目录本次实际列出时使用持久化的列表
+    cache.list_dir(root.parent)
+    assert list(cache.list_dir(root, modified)) == ["a.txt"]
+    assert cache.store_hits == 1
+
+    cache.discard(root)
+    assert cache.list_dir(root, modified + datetime.timedelta(seconds=1)) == {}
+    cache.invalidate(root)
+    assert store.get(DirCache._key(root), modified, 60) is None
+
+
+def test_dir_store_live_parent(tmp_path, monkeypatch):
+    """父目录的列表来自持久化存储时, 其中子目录的修改时间不可信, 重新列出"""
+    from alist_sync.dir_cache import DirStore
+
+    modified = datetime.datetime(2024, 3, 1, tzinfo=datetime.timezone.utc)
+    root = AlistPath("http://localhost:5244/local")
+    a, b = root.joinpath("a"), root.joinpath("a/b")
+    store = DirStore(tmp_path / "dirs.sqlite")
+    listings = {"/local": ["a"], "/local/a": ["b"], "/local/a/b": ["c.txt"]}
+
+    def fetch(path, missing_ok=True):
+        calls.append(path.as_posix())
+        return {n: _item(n) for n in listings[path.as_posix()]}
+
+    calls = []
+    cache = DirCache(store, ttl=60)
+    monkeypatch.setattr(cache, "fetch", fetch)
+    for path in (root, a, b):
+        cache.list_dir(path, None if path == root else modified)
+
+    # /a/b 中的文件变化只更新 /a/b 的修改时间, /a 的修改时间不变
+    listings["/local/a/b"] = ["c.txt", "d.txt"]
+    calls = []
+    cache = DirCache(store, ttl=60)
+    monkeypatch.setattr(cache, "fetch", fetch)
+    cache.list_dir(root)
+    assert cache.live(root)
+    assert list(cache.list_dir(a, modified)) == ["b"]
+    assert not cache.live(a)
+    assert sorted(cache.list_dir(b, modified)) == ["c.txt", "d.txt"]
+    assert calls == ["/local", "/local/a/b"]
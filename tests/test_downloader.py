@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@File Name  : test_downloader.py
+@Author     : LeeCQ
+@Date-Time  : 2024/3/18 20:05
+"""
+
+import threading
+
+import pytest
+
+from alist_sync.downloader import ChunkPipe, PipeClosed
+
+
+def test_chunk_pipe():
+    pipe = ChunkPipe(2)
+
+    def producer():
+        for i in range(10):
+            pipe.put(b"x" * i)
+        pipe.close()
+
+    _t = threading.Thread(target=producer)
+    _t.start()
+    assert b"".join(pipe) == b"x" * 45
+    assert pipe.total == 45
+    _t.join()
+
+
+def test_chunk_pipe_error():
+    pipe = ChunkPipe(2)
+    pipe.put(b"a")
+    pipe.close(ValueError("download failed"))
+    with pytest.raises(ValueError):
+        list(pipe)
+
+
+def test_chunk_pipe_abort():
+    pipe = ChunkPipe(1)
+    pipe.put(b"a")
+    pipe.abort()
+    with pytest.raises(PipeClosed):
+        pipe.put(b"b")
+
+
+def test_split_ranges():
+    from alist_sync.downloader import split_ranges
+
+    assert split_ranges(0, 4, 10) == []
+    assert split_ranges(15, 4, 10) == [(0, 14)]
+    assert split_ranges(100, 4, 10) == [(0, 24), (25, 49), (50, 74), (75, 99)]
+    assert split_ranges(101, 4, 50) == [(0, 50), (51, 100)]
+
+
+def _client(data: bytes, ranged=True, requests: list = None):
+    import httpx
+
+    def handler(request: httpx.Request):
+        _range = request.headers.get("Range")
+        if requests is not None:
+            requests.append(_range)
+        if _range and ranged:
+            start, end = map(int, _range.removeprefix("bytes=").split("-"))
+            return httpx.Response(206, content=data[start : end + 1])
+        return httpx.Response(200, content=data)
+
+    return httpx.Client(transport=httpx.MockTransport(handler))
+
+
+def test_download_resume(tmp_path):
+    import os
+    from alist_sync.downloader import download_file
+
+    data = os.urandom(1000)
+    file = tmp_path / "download_tmp"
+    file.write_bytes(data[:600] + b"\0" * 400)
+    requests = []
+    progress = download_file(
+        _client(data, requests=requests),
+        "http://localhost:5244/d/f",
+        file,
+        1000,
+        segments=2,
+        min_segment_size=100,
+        progress=[[0, 499, 500], [500, 999, 100]],
+    )
+    assert file.read_bytes() == data
+    assert requests == ["bytes=600-999"]
+    assert progress == [[0, 499, 500], [500, 999, 500]]
+
+
+def test_download_no_range(tmp_path):
+    import os
+    from alist_sync.downloader import download_file
+
+    data = os.urandom(1000)
+    file = tmp_path / "download_tmp"
+    progress = download_file(
+        _client(data, ranged=False),
+        "http://localhost:5244/d/f",
+        file,
+        1000,
+        segments=4,
+        min_segment_size=100,
+    )
+    assert file.read_bytes() == data
+    assert progress == [[0, 999, 1000]]
+
+
+def test_adownload_no_range_cancel(tmp_path):
+    """一个分段失败时, 其余分段在退回单连接下载前已取消, 不会再写入临时文件"""
+    import asyncio
+    import os
+    import httpx
+    from alist_sync.downloader import adownload_file
+
+    data = os.urandom(1000)
+    late, saved = [], []
+
+    async def handler(request: httpx.Request):
+        _range = request.headers.get("Range")
+        if _range and not _range.startswith("bytes=0-"):
+            await asyncio.sleep(0.3)
+            late.append(_range)
+            return httpx.Response(206, content=b"\0" * 250)
+        return httpx.Response(200, content=data)
+
+    async def on_progress(progress):
+        saved.append([list(_s) for _s in progress])
+
+    async def _test():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as c:
+            progress = await adownload_file(
+                c,
+                "http://localhost:5244/d/f",
+                file,
+                1000,
+                segments=4,
+                min_segment_size=100,
+                on_progress=on_progress,
+            )
+        await asyncio.sleep(0.5)
+        return progress
+
+    file = tmp_path / "download_tmp"
+    assert asyncio.run(_test()) == [[0, 999, 1000]]
+    assert late == []
+    assert file.read_bytes() == data
+    assert saved[-1] == [[0, 999, 1000]]
+
+
+def test_iter_file_hash(tmp_path):
+    import hashlib
+    import os
+    from alist_sync.common import ContentHash
+    from alist_sync.downloader import iter_file
+
+    data = os.urandom(1000)
+    file = tmp_path / "upload_tmp"
+    file.write_bytes(data)
+    hasher = ContentHash({"md5": hashlib.md5(data).hexdigest()})
+    assert b"".join(iter_file(file, chunk_size=300, hasher=hasher)) == data
+    assert hasher.verify()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@File Name  : test_http_pool.py
+@Author     : LeeCQ
+@Date-Time  : 2024/3/19 21:40
+"""
+
+import asyncio
+
+import httpx
+
+from alist_sync.http_pool import PoolTransport, AsyncPoolTransport
+
+
+class _Stream(httpx.SyncByteStream, httpx.AsyncByteStream):
+    def __iter__(self):
+        yield b"data"
+
+    async def __aiter__(self):
+        yield b"data"
+
+
+def test_pool_transport(monkeypatch):
+    monkeypatch.setattr(
+        httpx.HTTPTransport,
+        "handle_request",
+        lambda self, request: httpx.Response(200, stream=_Stream()),
+    )
+    transport = PoolTransport(2)
+    client = httpx.Client(transport=transport)
+
+    with client.stream("GET", "http://localhost:5244/d/a"):
+        with client.stream("GET", "http://localhost:5244/d/b"):
+            # 两个未关闭的流式响应占满名额
+            assert not transport._semaphore.acquire(blocking=False)
+        assert client.get("http://localhost:5244/api/me").content == b"data"
+    assert transport._semaphore._value == 2
+
+
+def test_async_pool_transport(monkeypatch):
+    async def handle(self, request):
+        return httpx.Response(200, stream=_Stream())
+
+    monkeypatch.setattr(httpx.AsyncHTTPTransport, "handle_async_request", handle)
+
+    async def main():
+        transport = AsyncPoolTransport(1)
+        async with httpx.AsyncClient(transport=transport) as client:
+            async with client.stream("GET", "http://localhost:5244/d/a"):
+                assert transport._semaphore.locked()
+            assert not transport._semaphore.locked()
+            res = await client.get("http://localhost:5244/api/me")
+            assert res.content == b"data"
+
+    asyncio.run(main())
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@File Name  : test_metrics.py
+@Author     : LeeCQ
+@Date-Time  : 2024/3/24 21:00
+"""
+
+import httpx
+
+from alist_sync import metrics
+
+
+def test_render():
+    metrics.record_transfer("g1", "http://localhost:5244", "download", 100)
+    metrics.record_transfer("g1", "http://localhost:5244", "download", 50)
+    metrics.worker_status("w1", "g1", "downloaded")
+    metrics.register_queue("test", lambda: 3)
+
+    text = metrics.render()
+    assert "# TYPE alist_sync_transfer_bytes_total counter" in text
+    assert (
+        'alist_sync_transfer_bytes_total{group="g1",'
+        'server="http://localhost:5244",direction="download"} 150' in text
+    )
+    assert 'alist_sync_workers{group="g1",status="downloaded"} 1' in text
+    assert 'alist_sync_queue_depth{queue="test"} 3' in text
+
+    metrics.worker_status("w1", "g1", None)
+    assert 'status="downloaded"' not in metrics.render()
+
+
+def test_api_hooks():
+    client = httpx.Client(
+        transport=httpx.MockTransport(lambda r: httpx.Response(200)),
+        event_hooks={
+            "request": [metrics.request_hook],
+            "response": [metrics.response_hook],
+        },
+    )
+    client.post("http://localhost:5245/api/fs/list")
+    client.post("http://localhost:5245/api/fs/list")
+
+    labels = 'server="http://localhost:5245",family="list"'
+    text = metrics.render()
+    assert f'alist_sync_api_requests_total{{{labels},code="200"}} 2' in text
+    assert f"alist_sync_api_request_seconds_count{{{labels}}} 2" in text
+
+
+def test_api_hooks_base_path():
+    """服务器地址带有路径时, 使用限速器去掉该路径后得到的类别"""
+    from alist_sync.rate_limit import RateLimiter
+
+    limiter = RateLimiter("http://localhost:5246/alist/", {})
+    client = httpx.Client(
+        transport=httpx.MockTransport(lambda r: httpx.Response(200)),
+        event_hooks={
+            "request": [limiter.hook, metrics.request_hook],
+            "response": [metrics.response_hook],
+        },
+    )
+    client.post("http://localhost:5246/alist/api/fs/list")
+
+    labels = 'server="http://localhost:5246",family="list"'
+    assert f'alist_sync_api_requests_total{{{labels},code="200"}} 1' in metrics.render()
+
+
+def test_textfile(tmp_path):
+    writer = metrics.TextfileWriter(tmp_path / "alist_sync.prom", interval=60)
+    writer.start().stop()
+    assert "# HELP alist_sync_files_total" in writer.path.read_text()
+    assert list(tmp_path.iterdir()) == [writer.path]
+
+
+def test_checker_pools(sync_config):
+    """每个同步组的线程池分别登记, 不互相覆盖"""
+    from queue import Queue
+    from alist_sync.config import SyncGroup
+    from alist_sync.d_checker import CheckerCopy
+
+    checkers = [
+        CheckerCopy(
+            SyncGroup(
+                name=name,
+                type="copy",
+                group=["http://localhost:5244/src", "http://localhost:5244/dst"],
+            ),
+            Queue(),
+            Queue(),
+        )
+        for name in ("pool_a", "pool_b")
+    ]
+    try:
+        text = metrics.render()
+        for name in ("pool_a", "pool_b"):
+            assert f'pool="checker_list[{name}]_"' in text
+            assert f'pool="checker[{name}]_"' in text
+            assert f'queue="checker_walk[{name}]"' in text
+            assert f'queue="scaner[{name}]"' not in text
+    finally:
+        for checker in checkers:
+            checker.pool.shutdown()
+            checker.list_pool.shutdown()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@File Name  : test_move.py
+@Author     : LeeCQ
+@Date-Time  : 2024/3/27 21:00
+
+mirror 的移动检测: 需要复制的文件与目标上将要删除的相同文件对应时, 改为移动
+"""
+
+import datetime
+from queue import Queue
+
+import pytest
+from alist_sdk import AlistPath, Item
+from alist_sdk.models import HashInfo
+
+from alist_sync.config import SyncGroup
+
+pytestmark = pytest.mark.usefixtures("sync_config")
+
+SOURCE = "http://localhost:5244/src"
+TARGET = "http://localhost:5244/dst"
+MODIFIED = datetime.datetime(2024, 3, 1, tzinfo=datetime.timezone.utc)
+
+
+def _item(name, size=10, sha1=None, is_dir=False):
+    return Item(
+        name=name,
+        size=size,
+        is_dir=is_dir,
+        modified=MODIFIED,
+        created=MODIFIED,
+        sign="",
+        thumb="",
+        type=1 if is_dir else 0,
+        hash_info=HashInfo(sha1=sha1) if sha1 else None,
+    )
+
+
+def _checker(monkeypatch, listings: dict[str, dict[str, Item]]):
+    from alist_sync.d_checker import CheckerMirror
+
+    group = SyncGroup(
+        name="move", type="mirror", detect_move=True, group=[SOURCE, TARGET]
+    )
+    checker = CheckerMirror(group, Queue(), Queue())
+    monkeypatch.setattr(
+        checker, "list_dir", lambda path, modified=None: listings[path.as_posix()]
+    )
+    return checker
+
+
+def _copy(checker, relative, item):
+    worker = checker.create_worker(
+        "copy",
+        AlistPath(SOURCE).joinpath(relative),
+        AlistPath(TARGET).joinpath(relative),
+        source_stat=item,
+    )
+    checker.put_worker(worker)
+    return worker
+
+
+def test_move_workers(monkeypatch):
+    checker = _checker(monkeypatch, {"/dst/old": {"a.txt": _item("a.txt", sha1="aa")}})
+    target = AlistPath(TARGET)
+    orphans = {
+        "old": _item("old", 0, is_dir=True),
+        "x.txt": _item("x.txt", 20),
+        "y.txt": _item("y.txt", 30),
+        "z.txt": _item("z.txt", 30),
+    }
+    checker.plan_delete(target, orphans)
+    checker.plan_orphans(target, orphans)
+
+    # 散列相同: 从多余的目录中移动
+    _copy(checker, "new/a.txt", _item("a.txt", sha1="aa"))
+    # 散列不同: 复制
+    _copy(checker, "b.txt", _item("b.txt", sha1="bb"))
+    # 没有散列, 唯一对应: 重命名
+    _copy(checker, "x2.txt", _item("x2.txt", 20))
+    # 没有散列, 不能唯一对应: 复制
+    _copy(checker, "y2.txt", _item("y2.txt", 30))
+    assert checker.worker_queue.empty()
+
+    workers = {w.target_path.relative_to(target): w for w in checker.move_workers()}
+    assert {k: w.type for k, w in workers.items()} == {
+        "new/a.txt": "move",
+        "b.txt": "copy",
+        "x2.txt": "move",
+        "y2.txt": "copy",
+    }
+    assert workers["new/a.txt"].move_from == target.joinpath("old/a.txt")
+    assert workers["new/a.txt"].source_hash == {"sha1": "aa"}
+    assert workers["x2.txt"].move_from == target.joinpath("x.txt")
+    # 移走的文件与它所在的目录本次不删除
+    assert checker.delete_plans == {target: {"y.txt", "z.txt"}}
+
+
+def test_move_disabled(monkeypatch):
+    checker = _checker(monkeypatch, {})
+    checker.detect_move = False
+    worker = _copy(checker, "a.txt", _item("a.txt"))
+    assert checker.worker_queue.get_nowait() is worker
+    assert list(checker.move_workers()) == []
+
+
+def test_move_hold_limit(monkeypatch):
+    """暂缓的复制Worker达到上限后直接进入队列"""
+    checker = _checker(monkeypatch, {})
+    checker.move_hold_limit = 2
+    workers = [_copy(checker, f"{i}.txt", _item(f"{i}.txt")) for i in range(3)]
+    assert checker.worker_queue.get_nowait() is workers[2]
+    assert list(checker.move_workers()) == workers[:2]
+
+
+def test_move_unsupported():
+    from alist_sync.d_checker import CheckerCopy
+
+    group = SyncGroup(
+        name="copy", type="copy", detect_move=True, group=[SOURCE, TARGET]
+    )
+    checker = CheckerCopy(group, Queue(), Queue())
+    assert not checker.supports_move
+    assert not hasattr(checker, "relocate_worker")
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@File Name  : test_profiler.py
+@Author     : LeeCQ
+@Date-Time  : 2024/3/26 21:00
+"""
+
+import asyncio
+import threading
+import time
+
+from alist_sync import profiler
+
+
+@profiler.timed("sleep")
+def _sleep(seconds):
+    time.sleep(seconds)
+
+
+@profiler.timed("async_sleep")
+async def _async_sleep(seconds):
+    await asyncio.sleep(seconds)
+
+
+def _slow_items():
+    for i in range(3):
+        time.sleep(0.01)
+        yield i
+
+
+def test_stages():
+    _sleep(0.01)
+    assert "sleep" not in profiler._stages
+
+    with profiler.profiling():
+        _sleep(0.01)
+        _sleep(0.02)
+        asyncio.run(_async_sleep(0.01))
+        for _ in profiler.timed_iter("items", _slow_items()):
+            # 调用方处理元素的时间不计入
+            time.sleep(0.05)
+    assert not profiler.enabled()
+
+    count, total, _max = profiler._stages["sleep"]
+    assert count == 2 and 0.03 <= total < 0.1 and _max >= 0.02
+    assert profiler._stages["async_sleep"][0] == 1
+    count, total, _ = profiler._stages["items"]
+    assert count == 4 and total < 0.1
+
+
+def test_sampler(tmp_path):
+    _stop = threading.Event()
+    _t = threading.Thread(target=_stop.wait, name="worker_3")
+    _t.start()
+    with profiler.profiling(output=tmp_path / "stacks.txt", interval=0.005):
+        time.sleep(0.05)
+    _stop.set()
+    _t.join()
+
+    lines = (tmp_path / "stacks.txt").read_text().splitlines()
+    assert lines
+    # 线程池的线程按名称前缀合并
+    assert any(line.startswith("worker;") for line in lines)
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
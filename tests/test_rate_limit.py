@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@File Name  : test_rate_limit.py
+@Author     : LeeCQ
+@Date-Time  : 2024/3/20 21:00
+"""
+
+import time
+
+import httpx
+
+from alist_sync.rate_limit import TokenBucket, RateLimiter, api_family
+
+
+def test_api_family():
+    assert api_family("/api/fs/list") == "list"
+    assert api_family("/api/fs/get") == "get"
+    assert api_family("/d/onedrive/a.txt") == "get"
+    assert api_family("/api/fs/put") == "put"
+    assert api_family("/api/fs/remove") == "remove"
+    assert api_family("/api/me") is None
+
+    # 服务器地址带有路径
+    assert api_family("/alist/api/fs/list", "/alist/") == "list"
+    assert api_family("/alist/d/onedrive/a.txt", "/alist") == "get"
+    assert api_family("/api/fs/list", "/alist") is None
+
+
+def test_rate_limiter_base_path():
+    limiter = RateLimiter("https://host/alist/", {"list": (20, 1)})
+    request = httpx.Request("POST", "https://host/alist/api/fs/list")
+    assert limiter.bucket(request) is limiter.buckets["list"]
+    assert request.extensions["alist_sync_family"] == "list"
+    assert limiter.bucket(httpx.Request("POST", "https://host/alist/d/a")) is None
+
+
+def test_token_bucket():
+    bucket = TokenBucket(qps=10, burst=2)
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    assert 0.09 < bucket.reserve() <= 0.1
+    assert 0.19 < bucket.reserve() <= 0.2
+
+
+def test_rate_limiter():
+    limiter = RateLimiter("http://localhost:5244/", {"list": (20, 1)})
+    client = httpx.Client(
+        transport=httpx.MockTransport(lambda r: httpx.Response(200)),
+        event_hooks={"request": [limiter.hook]},
+    )
+    _start = time.monotonic()
+    for _ in range(5):
+        client.post("http://localhost:5244/api/fs/list")
+    assert time.monotonic() - _start >= 0.19
+
+    # 未配置的类别与其他主机不限速
+    _start = time.monotonic()
+    for _ in range(5):
+        client.post("http://localhost:5244/api/fs/get")
+        client.post("http://storage.example.com/api/fs/list")
+    assert time.monotonic() - _start < 0.1
+
+
+def test_throttle():
+    from alist_sync.rate_limit import Throttle, bandwidth_bucket
+
+    assert bandwidth_bucket(0) is None
+    assert not Throttle(None, bandwidth_bucket(0))
+
+    shared = bandwidth_bucket(1000)
+    throttle = Throttle(shared, bandwidth_bucket(4000))
+    assert throttle.reserve(1000) == 0
+    # 全局的令牌桶已经用完，另一个Worker需要排队
+    assert 0.49 < Throttle(shared).reserve(500) <= 0.5
+    assert 0.99 < throttle.reserve(500) <= 1
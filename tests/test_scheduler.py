@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@File Name  : test_scheduler.py
+@Author     : LeeCQ
+@Date-Time  : 2024/3/21 21:00
+"""
+
+import threading
+from queue import Empty, Full
+from types import SimpleNamespace
+
+import pytest
+
+from alist_sync.scheduler import WorkerScheduler
+
+
+def _worker(path, size, type_="copy"):
+    return SimpleNamespace(type=type_, relative_path=path, file_size=size)
+
+
+def _drain(scheduler: WorkerScheduler) -> list[str]:
+    paths = []
+    while not scheduler.empty():
+        worker = scheduler.get(block=False)
+        scheduler.done(worker)
+        paths.append(worker.relative_path)
+    return paths
+
+
+WORKERS = [("a", 300), ("b", 100), ("c", 200), ("d", 0, "delete")]
+
+
+@pytest.mark.parametrize(
+    "policy, expected",
+    [
+        ("fifo", ["a", "b", "c", "d"]),
+        ("small-first", ["d", "b", "c", "a"]),
+        ("large-first", ["a", "c", "b", "d"]),
+    ],
+)
+def test_policy(policy, expected):
+    scheduler = WorkerScheduler(policy)
+    for w in WORKERS:
+        scheduler.put(_worker(*w))
+    assert _drain(scheduler) == expected
+
+
+def test_priority():
+    scheduler = WorkerScheduler("small-first", priority=["c", "*.txt"])
+    for w in [("a.txt", 300), *WORKERS]:
+        scheduler.put(_worker(*w))
+    assert _drain(scheduler) == ["c", "a.txt", "d", "b", "a"]
+
+
+def test_lanes():
+    scheduler = WorkerScheduler("lanes", lanes=[150], lane_limits=[0, 1])
+    for w in [("big1", 1000), ("big2", 2000), ("s1", 10), ("s2", 20), ("s3", 30)]:
+        scheduler.put(_worker(*w))
+
+    # 车道之间轮流取出
+    assert scheduler.get(block=False).relative_path == "s1"
+    big1 = scheduler.get(block=False)
+    assert big1.relative_path == "big1"
+    # 大文件车道已满, 只取小文件
+    assert scheduler.get(block=False).relative_path == "s2"
+    assert scheduler.get(block=False).relative_path == "s3"
+    with pytest.raises(Empty):
+        scheduler.get(timeout=0.01)
+
+    scheduler.done(big1)
+    assert scheduler.get(block=False).relative_path == "big2"
+
+
+def test_max_queued():
+    scheduler = WorkerScheduler(max_queued=1)
+    scheduler.put(_worker("a", 1))
+    with pytest.raises(Full):
+        scheduler.put(_worker("b", 1), timeout=0.01)
+
+
+def test_close():
+    scheduler = WorkerScheduler()
+    scheduler.put(_worker("a", 1))
+    got = []
+    _t = threading.Thread(target=lambda: got.extend([scheduler.get(), scheduler.get()]))
+    _t.start()
+    scheduler.close()
+    _t.join(1)
+    assert [w and w.relative_path for w in got] == ["a", None]
+
+
+def test_urgent():
+    scheduler = WorkerScheduler("small-first", priority=["a"])
+    for w in WORKERS:
+        scheduler.put(_worker(*w))
+    scheduler.put(_worker("e", 500), urgent=True)
+    assert _drain(scheduler) == ["e", "a", "d", "b", "c"]
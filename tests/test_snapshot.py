@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@File Name  : test_snapshot.py
+@Author     : LeeCQ
+@Date-Time  : 2024/3/17 17:20
+"""
+
+from alist_sync.snapshot import BaseSnapshot
+
+
+def test_snapshot(tmp_path):
+    snapshot = BaseSnapshot(tmp_path / "base.sqlite")
+    entries = {"a.txt": {"http://localhost:5244/s1": [10, 1700000000.5]}}
+    snapshot.put("g1", "a", entries, {"b"}, {"http://localhost:5244/s1": 1.0}, True)
+    snapshot.put("g1", "a/b", {}, [], {}, True)
+    snapshot.put("g1", "ab", {}, [], {}, True)
+
+    row = snapshot.get("g1", "a")
+    assert row.clean and row.entries == entries and row.subdirs == ["b"]
+    assert snapshot.get("g2", "a") is None
+
+    snapshot.invalidate("g1", "a")
+    assert not snapshot.get("g1", "a").clean
+    assert snapshot.get("g1", "a/b").clean
+
+    snapshot.delete("g1", "a")
+    assert snapshot.get("g1", "a") is None
+    assert snapshot.get("g1", "a/b") is None
+    assert snapshot.get("g1", "ab") is not None
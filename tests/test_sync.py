@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@File Name  : test_sync.py
+@Author     : LeeCQ
+@Date-Time  : 2024/3/28 21:00
+
+双向同步 CheckerSync: 以基准快照做三方对比
+"""
+
+import datetime
+import itertools
+from queue import Queue
+
+import pytest
+from alist_sdk import Item
+from alist_sdk.models import HashInfo
+
+from alist_sync.config import SyncGroup
+
+pytestmark = pytest.mark.usefixtures("sync_config")
+
+A = "http://localhost:5244/a"
+B = "http://localhost:5244/b"
+_groups = itertools.count()
+
+
+def _t(n: int) -> datetime.datetime:
+    return datetime.datetime(2024, 3, 1, tzinfo=datetime.timezone.utc) + (
+        datetime.timedelta(hours=n)
+    )
+
+
+def _item(name, size=10, modified=0, sha1=None, is_dir=False):
+    return Item(
+        name=name,
+        size=size,
+        is_dir=is_dir,
+        modified=_t(modified),
+        created=_t(0),
+        sign="",
+        thumb="",
+        type=1 if is_dir else 0,
+        hash_info=HashInfo(sha1=sha1) if sha1 else None,
+    )
+
+
+class Runner:
+    """每次 run 相当于一次同步中对一个目录的检查"""
+
+    def __init__(self):
+        from alist_sync.d_checker import CheckerSync
+
+        group = SyncGroup(name=f"sync{next(_groups)}", type="sync", group=[A, B])
+        self.checker = CheckerSync(group, Queue(), Queue())
+        self.a, self.b = group.group
+
+    def run(self, a: dict, b: dict, relative_path="", dirs=None):
+        self.checker._local.dirs = dirs
+        return list(self.checker.checker_dir(relative_path, {self.a: a, self.b: b}))
+
+    def entry(self, name, relative_path=""):
+        row = self.checker.snapshot.get(self.checker.sync_group.name, relative_path)
+        return row.entries.get(name)
+
+
+def _copies(workers) -> list[tuple[str, str]]:
+    return [
+        (w.source_path.as_posix(), w.target_path.as_posix())
+        for w in workers
+        if w is not None
+    ]
+
+
+def _agreed(runner: Runner, size=10, modified=0):
+    """两边一致, 写入基准"""
+    f = _item("f", size, modified)
+    assert _copies(runner.run({"f": f}, {"f": f})) == []
+    return f
+
+
+@pytest.mark.parametrize("copied_at", [1, 5])
+def test_new_file_converge(copied_at):
+    """复制后一致: 上传保留了修改时间, 或者目标的修改时间为复制的时间"""
+    runner = Runner()
+    f = _item("f", 10, 1)
+    assert _copies(runner.run({"f": f}, {})) == [("/a/f", "/b/f")]
+    assert runner.entry("f")["pending"]["to"] == {B: None}
+
+    copied = _item("f", 10, copied_at)
+    assert _copies(runner.run({"f": f}, {"f": copied})) == []
+    assert "pending" not in runner.entry("f")
+    assert _copies(runner.run({"f": f}, {"f": copied})) == []
+
+
+def test_concurrent_edit_same_size():
+    """两个成员同时修改为相同大小的不同内容: 冲突, 以最新的为准并复制"""
+    runner = Runner()
+    _agreed(runner)
+    a, b = _item("f", 10, 1), _item("f", 10, 2)
+    assert _copies(runner.run({"f": a}, {"f": b})) == [("/b/f", "/a/f")]
+    assert "f" in runner.checker.conflict
+
+    # 复制失败: 仍以旧的基准对比, 不会反向复制
+    assert _copies(runner.run({"f": a}, {"f": b})) == [("/b/f", "/a/f")]
+    # 复制完成后一致
+    assert _copies(runner.run({"f": b}, {"f": b})) == []
+    _sig = [10, _t(2).timestamp()]
+    assert runner.entry("f") == {A: _sig, B: _sig}
+
+
+def test_concurrent_edit_same_content():
+    """散列相同时, 两个成员的修改是一致的"""
+    runner = Runner()
+    _agreed(runner)
+    a, b = _item("f", 10, 1, sha1="aa"), _item("f", 10, 2, sha1="aa")
+    assert _copies(runner.run({"f": a}, {"f": b})) == []
+    assert not runner.checker.conflict
+
+    a, b = _item("f", 10, 3, sha1="aa"), _item("f", 10, 4, sha1="bb")
+    assert _copies(runner.run({"f": a}, {"f": b})) == [("/b/f", "/a/f")]
+    assert "f" in runner.checker.conflict
+
+
+def test_delete():
+    runner = Runner()
+    f = _agreed(runner)
+    assert _copies(runner.run({}, {"f": f})) == []
+    assert runner.checker.delete_plans == {runner.b: {"f"}}
+
+
+def test_delete_vs_modify():
+    runner = Runner()
+    _agreed(runner)
+    assert _copies(runner.run({}, {"f": _item("f", 12, 1)})) == [("/b/f", "/a/f")]
+    assert "f" in runner.checker.conflict
+    assert not runner.checker.delete_plans
+
+
+def test_directory_deleted():
+    """成员删除了整个目录: 其他成员上删除该目录"""
+    runner = Runner()
+    f = _item("f")
+    _dirs = {runner.a: _item("d", is_dir=True), runner.b: _item("d", is_dir=True)}
+    runner.run({"f": f}, {"f": f}, "d", _dirs)
+    assert runner.entry("f", "d") is not None
+
+    runner.run({}, {}, "d", {runner.a: None, runner.b: _item("d", is_dir=True)})
+    assert runner.checker.delete_plans == {runner.b: {"d"}}
+    assert runner.checker.snapshot.get(runner.checker.sync_group.name, "d") is None
+
+
+def _walk(runner: Runner, monkeypatch, sync_config, missing: str):
+    """遍历根目录, 成员 missing 的存储未挂载"""
+    from alist_sdk import AlistPath
+
+    def fetch(path: AlistPath, missing_ok=True):
+        if path.as_posix() == missing:
+            if not missing_ok:
+                raise FileNotFoundError(path.as_uri())
+            return {}
+        return {"f": _item("f")}
+
+    monkeypatch.setattr(sync_config.dir_cache, "fetch", fetch)
+    sync_config.dir_cache.clear()
+    _t = runner.checker.start_walker()
+    _t.join(10)
+    assert not _t.is_alive()
+    return list(runner.checker.delete_workers())
+
+
+def test_missing_root(monkeypatch, sync_config):
+    """成员目录不存在时跳过同步组, 不删除其他成员上的文件"""
+    from alist_sdk import AlistPath
+
+    runner = Runner()
+    _agreed(runner)
+    monkeypatch.setattr(AlistPath, "exists", lambda self: self.as_posix() != "/b")
+    assert _walk(runner, monkeypatch, sync_config, "/b") == []
+    assert runner.checker.worker_queue.empty()
+    assert runner.entry("f") is not None
+
+
+def test_missing_dir_listing(monkeypatch, sync_config):
+    """基准中存在的目录列出时不存在, 不视为删除了其中的文件"""
+    from alist_sdk import AlistPath
+
+    runner = Runner()
+    _agreed(runner)
+    monkeypatch.setattr(AlistPath, "exists", lambda self: True)
+    assert _walk(runner, monkeypatch, sync_config, "/b") == []
+    assert not runner.checker.delete_plans
+    assert runner.checker.worker_queue.empty()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@File Name  : test_sync_incr.py
+@Author     : LeeCQ
+@Date-Time  : 2024/3/29 20:00
+
+增量同步 CheckerSyncIncr: 按记录的源文件状态跳过未变化的文件
+"""
+
+import datetime
+import itertools
+from queue import Queue
+
+import httpx
+import pytest
+from alist_sdk import Client, Item
+from alist_sdk.path_lib import login_server
+
+from alist_sync.config import Config, SyncGroup
+
+pytestmark = pytest.mark.usefixtures("sync_config")
+
+SERVER = "http://incr.local:5253"
+_groups = itertools.count()
+
+
+def _t(n: int) -> datetime.datetime:
+    return datetime.datetime(2024, 3, 1, tzinfo=datetime.timezone.utc) + (
+        datetime.timedelta(hours=n)
+    )
+
+
+def _item(name, size=10, modified=0):
+    return Item(
+        name=name,
+        size=size,
+        is_dir=False,
+        modified=_t(modified),
+        created=_t(0),
+        sign="",
+        thumb="",
+        type=0,
+    )
+
+
+class Runner:
+    """每次 run 相当于一次增量同步中对根目录的检查, 不向 AList 发出请求"""
+
+    def __init__(self, monkeypatch, sync_config):
+        from alist_sync.d_checker import CheckerSyncIncr
+
+        def handler(request: httpx.Request):
+            raise AssertionError(f"不应发出请求: {request.url}")
+
+        login_server(Client(SERVER, transport=httpx.MockTransport(handler)))
+        name = f"incr{next(_groups)}"
+        group = SyncGroup(
+            name=name,
+            type="sync-incr",
+            group=[f"{SERVER}/{name}/src", f"{SERVER}/{name}/dst"],
+        )
+        monkeypatch.setattr(
+            Config,
+            "get_sync_group",
+            lambda self, name: group if name == group.name else None,
+        )
+        self.checker = CheckerSyncIncr(group, Queue(), Queue())
+        self.src, self.dst = group.group
+        self.handle = sync_config.handle
+        self.listed = []
+        self.target: dict[str, Item] = {}
+        monkeypatch.setattr(self.checker, "list_dir", self._list_dir)
+
+    def _list_dir(self, path):
+        self.listed.append(path)
+        return self.target
+
+    def run(self, source: dict[str, Item]):
+        return [
+            w
+            for w in self.checker.checker_dir("", {self.src: source, self.dst: None})
+            if w is not None
+        ]
+
+    def state(self, name):
+        return self.handle.get_file_item(self.dst.joinpath(name))
+
+
+@pytest.fixture()
+def runner(monkeypatch, sync_config):
+    return Runner(monkeypatch, sync_config)
+
+
+def test_first_run(runner):
+    """没有记录时获取 Target 的信息, 复制后记录本次复制的源文件状态"""
+    f = _item("f", 10, 1)
+    workers = runner.run({"f": f})
+    assert runner.listed == [runner.dst]
+    assert [w.target_path for w in workers] == [runner.dst.joinpath("f")]
+
+    workers[0].record_state()
+    state = Item.model_validate(runner.state("f"))
+    assert (state.size, state.modified) == (10, _t(1))
+
+
+def test_skip_recorded(runner):
+    """源文件没有变化时不获取 Target 的信息, 直接跳过"""
+    f = _item("f", 10, 1)
+    runner.run({"f": f})[0].record_state()
+    runner.listed.clear()
+
+    assert runner.run({"f": f}) == []
+    assert runner.listed == []
+
+
+def test_changed_recopy(runner):
+    """源文件修改后再次复制, 记录新的状态"""
+    runner.run({"f": _item("f", 10, 1)})[0].record_state()
+    runner.target = {"f": _item("f", 10, 2)}
+    runner.listed.clear()
+
+    changed = _item("f", 12, 3)
+    workers = runner.run({"f": changed})
+    assert runner.listed == [runner.dst]
+    assert [w.source_path for w in workers] == [runner.src.joinpath("f")]
+
+    workers[0].record_state()
+    state = Item.model_validate(runner.state("f"))
+    assert (state.size, state.modified) == (12, _t(3))
+    assert runner.run({"f": changed}) == []
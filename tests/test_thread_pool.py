@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@File Name  : test_thread_pool.py
+@Author     : LeeCQ
+@Date-Time  : 2024/3/22 20:30
+"""
+
+import threading
+import time
+
+from alist_sync.thread_pool import MyThreadPoolExecutor
+
+
+def test_wait():
+    done = []
+    with MyThreadPoolExecutor(2) as pool:
+        for i in range(4):
+            pool.submit(lambda _i: (time.sleep(0.05), done.append(_i)), i)
+        _start = time.monotonic()
+        pool.wait()
+        assert len(done) == 4
+        assert time.monotonic() - _start < 1
+
+
+def test_submit_wait():
+    event = threading.Event()
+    with MyThreadPoolExecutor(1, max_queued=1) as pool:
+        pool.submit_wait(event.wait)
+        pool.submit_wait(event.wait)
+        # 运行中与排队中的任务已满
+        assert not pool._slots.acquire(blocking=False)
+        event.set()
+        pool.wait()
+        assert pool._slots.acquire(blocking=False)
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+@File Name  : test_walk.py
+@Author     : LeeCQ
+@Date-Time  : 2024/3/28 20:10
+
+Checker.walker: 同时列出全部成员上的同一相对目录, 不存在的目录不再列出
+"""
+
+import datetime
+import threading
+from queue import Queue
+
+import pytest
+from alist_sdk import AlistPath, Item
+
+from alist_sync.config import SyncGroup
+
+pytestmark = pytest.mark.usefixtures("sync_config")
+
+SERVER = "http://localhost:5244"
+MODIFIED = datetime.datetime(2024, 3, 1, tzinfo=datetime.timezone.utc)
+
+
+def _item(name, is_dir=False):
+    return Item(
+        name=name,
+        size=0 if is_dir else 10,
+        is_dir=is_dir,
+        modified=MODIFIED,
+        created=MODIFIED,
+        sign="",
+        thumb="",
+        type=1 if is_dir else 0,
+    )
+
+
+def _dir(*names: str) -> dict[str, Item]:
+    """名称以 / 结尾的为目录"""
+    return {n.rstrip("/"): _item(n.rstrip("/"), n.endswith("/")) for n in names}
+
+
+LISTINGS = {
+    "/src": _dir("a.txt", "ign.tmp", "sub/", "new/", "skip/"),
+    "/src/sub": _dir("b.txt", "deep/"),
+    "/src/sub/deep": _dir("c.txt"),
+    "/src/new": _dir("n.txt"),
+    "/src/skip": _dir("x.txt"),
+    "/dst": _dir("a.txt", "extra.txt", "sub/", "skip/"),
+    "/dst/sub": _dir("b.txt"),
+    "/dst2": {},
+}
+
+
+def _walk(monkeypatch, type_: str, fail: str | None = None):
+    from alist_sync.d_checker import get_checker
+
+    group = SyncGroup(
+        name="walk",
+        type=type_,
+        blacklist=["skip", "*.tmp"],
+        group=[f"{SERVER}/src", f"{SERVER}/dst", f"{SERVER}/dst2"],
+    )
+    checker = get_checker(type_)(group, Queue(), Queue())
+    calls = []
+    _lock = threading.Lock()
+
+    def list_dir(path: AlistPath, modified=None):
+        with _lock:
+            calls.append(path.as_posix())
+        if path.as_posix() == fail:
+            raise ConnectionError(fail)
+        return LISTINGS[path.as_posix()]
+
+    monkeypatch.setattr(checker, "list_dir", list_dir)
+    monkeypatch.setattr(AlistPath, "exists", lambda self: True)
+
+    _t = checker.start_walker()
+    _t.join(10)
+    assert not _t.is_alive(), "遍历没有结束"
+    assert checker._walking == 0
+
+    workers = []
+    while not checker.worker_queue.empty():
+        workers.append(checker.worker_queue.get_nowait())
+    return calls, workers
+
+
+def test_walk_copy(monkeypatch):
+    calls, workers = _walk(monkeypatch, "copy")
+
+    # 每个目录在每个成员上只列出一次; 父目录中不存在的成员、被忽略的目录不再列出
+    assert sorted(calls) == [
+        "/dst",
+        "/dst/sub",
+        "/dst2",
+        "/src",
+        "/src/new",
+        "/src/sub",
+        "/src/sub/deep",
+    ]
+    assert sorted(w.target_path.as_posix() for w in workers) == [
+        "/dst/new/n.txt",
+        "/dst/sub/deep/c.txt",
+        "/dst2/a.txt",
+        "/dst2/new/n.txt",
+        "/dst2/sub/b.txt",
+        "/dst2/sub/deep/c.txt",
+    ]
+    assert {w.type for w in workers} == {"copy"}
+    # 目录列表中的文件信息带入 Worker
+    assert {(w.file_size, w.source_modified) for w in workers} == {(10, MODIFIED)}
+    _sources = {w.source_path.as_posix() for w in workers if w.relative_path == "a.txt"}
+    assert _sources == {"/src/a.txt"}
+
+
+def test_walk_mirror(monkeypatch):
+    _, workers = _walk(monkeypatch, "mirror")
+
+    # 删除在遍历结束后进入队列
+    assert [w.type for w in workers].count("copy") == 6
+    assert workers[-1].type == "delete"
+    assert workers[-1].target_path.as_posix() == "/dst"
+    assert workers[-1].delete_names == ["extra.txt"]
+
+
+def test_walk_error(monkeypatch):
+    """列出失败的目录不再向下遍历, 遍历仍然结束"""
+    calls, workers = _walk(monkeypatch, "copy", fail="/src/sub")
+    assert "/src/sub/deep" not in calls
+    assert not any(w.relative_path.startswith("sub/") for w in workers)
+    assert "/dst2/new/n.txt" in {w.target_path.as_posix() for w in workers}
@@ -38,3 +38,349 @@ def test_worker_copy():
     )
     worker = Worker(**docs)
     worker.run()
+
+
+def test_recovered_targets(monkeypatch, sync_config):
+    """接管的Worker完成后, Checker 为同一Target创建的Worker仍然不执行"""
+    from alist_sync.config import Config, SyncGroup
+    from alist_sync.d_worker import Worker, Workers
+    from alist_sync.scheduler import WorkerScheduler
+
+    group = SyncGroup(
+        name="recover",
+        type="copy",
+        group=["http://localhost:5244/src", "http://localhost:5244/dst"],
+    )
+    monkeypatch.setattr(Config, "get_sync_group", lambda self, name: group)
+
+    def _worker(name, source="src"):
+        return Worker(
+            type="copy",
+            group_name=group.name,
+            need_backup=False,
+            relative_path=name,
+            source_path=f"http://localhost:5244/{source}/{name}",
+            target_path=f"http://localhost:5244/dst/{name}",
+        )
+
+    recovered = _worker("a.txt")
+    recovered.update(status="downloaded")
+    queue = WorkerScheduler()
+    workers = Workers(max_workers=1)
+    try:
+        workers.recover(queue).join()
+        assert queue.get(timeout=1).id == recovered.id
+        assert not workers._locked(recovered)
+
+        workers.release_lock(recovered.target_path)
+        # 同一Target, 不同的Source
+        assert workers._locked(_worker("a.txt", "src2"))
+        assert not workers._locked(_worker("b.txt"))
+    finally:
+        workers.thread_pool.shutdown()
+        sync_config.handle.delete_worker(recovered.id)
+
+
+def test_purge_active_groups(monkeypatch, sync_config):
+    """退出时只清理本次运行的同步组中遗留的Worker, 没有启用的同步组的保留"""
+    import datetime
+    from alist_sync.config import Config, SyncGroup
+    from alist_sync.d_worker import Worker, Workers
+
+    groups = {
+        "purge": SyncGroup(
+            name="purge",
+            type="copy",
+            group=["http://localhost:5244/src", "http://localhost:5244/dst"],
+        ),
+        "disabled": SyncGroup(
+            name="disabled",
+            type="copy",
+            enable=False,
+            group=["http://localhost:5244/src", "http://localhost:5244/dst"],
+        ),
+    }
+    monkeypatch.setattr(Config, "get_sync_group", lambda self, name: groups.get(name))
+
+    def _worker(group_name):
+        _w = Worker(
+            type="copy",
+            group_name=group_name,
+            need_backup=False,
+            created_at=datetime.datetime(2024, 3, 1),
+            source_path=f"http://localhost:5244/src/{group_name}.txt",
+            target_path=f"http://localhost:5244/dst/{group_name}.txt",
+        )
+        _w.update(status="downloaded")
+        _w.tmp_file.write_bytes(b"0")
+        return _w
+
+    purged, kept = _worker("purge"), _worker("disabled")
+    workers = Workers(max_workers=1)
+    try:
+        workers.__del__()
+        assert sync_config.handle.get_worker(purged.id) is None
+        assert not purged.tmp_file.exists()
+        assert sync_config.handle.get_worker(kept.id) is not None
+        assert kept.tmp_file.exists()
+    finally:
+        workers.thread_pool.shutdown()
+        for _w in (purged, kept):
+            _w.tmp_file.unlink(missing_ok=True)
+            sync_config.handle.delete_worker(_w.id)
+
+
+def test_worker_offline_dump(sync_config):
+    """序列化与保存 Worker 不向 AList 发出任何请求"""
+    import datetime
+    from queue import Queue
+
+    import httpx
+    from alist_sdk import Client, Item
+    from alist_sdk.models import HashInfo
+    from alist_sync.d_checker import CheckerCopy
+    from alist_sync.config import SyncGroup
+    from alist_sync.d_worker import Worker
+
+    def handler(request: httpx.Request):
+        raise AssertionError(f"不应发出请求: {request.url}")
+
+    server = "http://offline.local:5250"
+    login_server(Client(server, transport=httpx.MockTransport(handler)))
+    group = SyncGroup(
+        name="offline", type="copy", group=[f"{server}/src", f"{server}/dst"]
+    )
+    checker = CheckerCopy(group, Queue(), Queue())
+    modified = datetime.datetime(2024, 3, 1, tzinfo=datetime.timezone.utc)
+    item = Item(
+        name="a.txt",
+        size=10,
+        is_dir=False,
+        modified=modified,
+        created=modified,
+        sign="",
+        thumb="",
+        type=0,
+        hash_info=HashInfo(sha1="aa"),
+    )
+    worker = checker.create_worker(
+        "copy",
+        group.group[0].joinpath("a.txt"),
+        group.group[1].joinpath("a.txt"),
+        source_stat=item,
+    )
+
+    assert worker.model_dump()["file_size"] == 10
+    assert '"source_modified"' in worker.model_dump_json()
+    worker.update(status="downloaded")
+    sync_config.handle.create_log(worker)
+    try:
+        loaded = Worker(**sync_config.handle.get_worker(worker.id))
+        assert loaded.id == worker.id
+        assert loaded.status == "downloaded"
+        assert loaded.source_stat() == (10, modified)
+        assert loaded.source_hash == {"sha1": "aa"}
+    finally:
+        sync_config.handle.delete_worker(worker.id)
+
+
+def test_prepare_target(sync_config):
+    """目标文件不存在时不等待重试: 查询一次, 创建目录"""
+    import time
+    import httpx
+    from alist_sdk import Client
+    from alist_sync.d_worker import Worker
+
+    requests = []
+
+    def handler(request: httpx.Request):
+        requests.append(request.url.path)
+        if request.url.path == "/api/fs/get" and b"a.txt" not in request.content:
+            _code, _message = 500, "failed get objs: object not found"
+        else:
+            _code, _message = 200, "success"
+        return httpx.Response(
+            200, json={"code": _code, "message": _message, "data": None}
+        )
+
+    server = "http://mock.local:5251"
+    login_server(Client(server, transport=httpx.MockTransport(handler)))
+
+    def _worker(name):
+        return Worker(
+            type="copy",
+            need_backup=False,
+            source_path=f"{server}/src/{name}",
+            target_path=f"{server}/dst/{name}",
+        )
+
+    _start = time.monotonic()
+    _worker("b.txt")._prepare_target()
+    assert time.monotonic() - _start < 0.5
+    assert requests == ["/api/fs/get", "/api/fs/mkdir"]
+
+    requests.clear()
+    _worker("a.txt")._prepare_target()
+    assert requests == ["/api/fs/get", "/api/fs/remove"]
+
+
+def test_download_without_token(monkeypatch, sync_config):
+    """下载 raw_url 的请求不带 AList 的 Token, raw_url 可能指向第三方存储"""
+    import asyncio
+    import datetime
+    import httpx
+    from alist_sdk import Client
+    from alist_sync.config import AlistServer
+    from alist_sync.d_worker import Worker, AsyncWorkers
+
+    downloads = []
+
+    def handler(request: httpx.Request):
+        if request.url.host == "cdn.local":
+            downloads.append(request.headers.get("Authorization"))
+            return httpx.Response(200, content=b"0123456789")
+        _modified = datetime.datetime(2024, 3, 1, tzinfo=datetime.timezone.utc)
+        return httpx.Response(
+            200,
+            json={
+                "code": 200,
+                "message": "success",
+                "data": {
+                    "name": "a.txt",
+                    "size": 10,
+                    "is_dir": False,
+                    "modified": _modified.isoformat(),
+                    "created": _modified.isoformat(),
+                    "sign": "",
+                    "thumb": "",
+                    "type": 0,
+                    "raw_url": "http://cdn.local/a.txt",
+                    "readme": "",
+                    "provider": "Local",
+                    "related": None,
+                },
+            },
+        )
+
+    server = "http://token.local:5252"
+    client = Client(server, transport=httpx.MockTransport(handler))
+    client.headers["Authorization"] = "alist-token"
+    login_server(client)
+    _server = AlistServer(base_url=server, download_segments=1)
+    _server.__dict__["transport"] = httpx.MockTransport(handler)
+    monkeypatch.setattr(sync_config, "alist_servers", [_server])
+    monkeypatch.setattr(
+        AlistServer, "async_transport", lambda self: httpx.MockTransport(handler)
+    )
+
+    def _worker(name):
+        return Worker(
+            type="copy",
+            need_backup=False,
+            source_path=f"{server}/src/{name}",
+            target_path=f"{server}/dst/{name}",
+        )
+
+    worker = _worker("a.txt")
+    try:
+        worker.downloader()
+        assert worker.tmp_file.read_bytes() == b"0123456789"
+        assert downloads == [None]
+    finally:
+        worker.tmp_file.unlink(missing_ok=True)
+        sync_config.handle.delete_worker(worker.id)
+
+    async def _async_download(_w: Worker):
+        _w.workers = AsyncWorkers()
+        try:
+            await _w.async_downloader()
+        finally:
+            for _client in _w.workers._download_clients.values():
+                await _client.aclose()
+
+    worker = _worker("b.txt")
+    try:
+        asyncio.run(_async_download(worker))
+        assert worker.tmp_file.read_bytes() == b"0123456789"
+    finally:
+        worker.tmp_file.unlink(missing_ok=True)
+        sync_config.handle.delete_worker(worker.id)
+
+    assert downloads == [None, None]
+
+
+def test_async_workers(monkeypatch, sync_config):
+    """AsyncWorkers 在事件循环中完成跨服务器的复制: 下载、上传、复查"""
+    import datetime
+    import json
+    import urllib.parse
+    import httpx
+    from alist_sdk import Client
+    from alist_sync.config import AlistServer
+    from alist_sync.d_worker import Worker, AsyncWorkers
+    from alist_sync.scheduler import WorkerScheduler
+
+    _modified = datetime.datetime(2024, 3, 1, tzinfo=datetime.timezone.utc)
+    files = {"http://src.local:5254/src/a.txt": b"0123456789"}
+
+    def _resp(data=None, code=200, message="success"):
+        return httpx.Response(
+            200, json={"code": code, "message": message, "data": data}
+        )
+
+    def handler(request: httpx.Request):
+        _server = f"{request.url.scheme}://{request.url.netloc.decode()}"
+        if request.url.path.startswith("/d/"):
+            return httpx.Response(200, content=files[_server + request.url.path[2:]])
+        if request.url.path == "/api/fs/put":
+            _path = urllib.parse.unquote(request.headers["File-Path"])
+            files[_server + _path] = request.content
+            return _resp()
+        if request.url.path == "/api/fs/get":
+            _path = json.loads(request.content)["path"]
+            if _server + _path not in files:
+                return _resp(code=500, message="failed get objs: object not found")
+            return _resp(
+                {
+                    "name": _path.rsplit("/", 1)[-1],
+                    "size": len(files[_server + _path]),
+                    "is_dir": False,
+                    "modified": _modified.isoformat(),
+                    "created": _modified.isoformat(),
+                    "sign": "",
+                    "thumb": "",
+                    "type": 0,
+                    "raw_url": f"{_server}/d{_path}",
+                    "readme": "",
+                    "provider": "Local",
+                    "related": None,
+                }
+            )
+        return _resp()
+
+    servers = []
+    for server in ("http://src.local:5254", "http://dst.local:5255"):
+        login_server(Client(server, transport=httpx.MockTransport(handler)))
+        _server = AlistServer(base_url=server, download_segments=1)
+        _server.__dict__["transport"] = httpx.MockTransport(handler)
+        servers.append(_server)
+    monkeypatch.setattr(sync_config, "alist_servers", servers)
+    monkeypatch.setattr(
+        AlistServer, "async_transport", lambda self: httpx.MockTransport(handler)
+    )
+
+    worker = Worker(
+        type="copy",
+        need_backup=False,
+        source_path="http://src.local:5254/src/a.txt",
+        target_path="http://dst.local:5255/dst/a.txt",
+    )
+    queue = WorkerScheduler()
+    queue.put(worker)
+    queue.close()
+    try:
+        AsyncWorkers(max_workers=2).run(queue)
+        assert files["http://dst.local:5255/dst/a.txt"] == b"0123456789"
+        assert sync_config.handle.get_worker(worker.id) is None
+    finally:
+        sync_config.handle.delete_worker(worker.id)